@@ -29,7 +29,10 @@ from tqdm import (
 )
 
 from data_perimeter_helper.variables import Variables as Var
-from data_perimeter_helper.toolbox import utils
+from data_perimeter_helper.toolbox import (
+    utils,
+    boto3_pool
+)
 
 logger = logging.getLogger(__name__)
 
@@ -80,9 +83,9 @@ class ExternalAccessAnalyzer():
         if region_name in cls.cache_boto3_client:
             if service_name in cls.cache_boto3_client[region_name]:
                 return cls.cache_boto3_client[region_name][service_name]
-        assert Var.session_iam_aa is not None  # nosec: B101
-        client = Var.session_iam_aa.client(
+        client = boto3_pool.get_client(
             service_name,
+            profile_name=Var.profile_iam_access_analyzer,
             region_name=region_name,
             config=cls.boto3_config_increase_retry
         )
@@ -20,7 +20,10 @@ from botocore.exceptions import (
 from botocore.config import Config
 
 from data_perimeter_helper.variables import Variables as Var
-from data_perimeter_helper.toolbox import utils
+from data_perimeter_helper.toolbox import (
+    utils,
+    boto3_pool
+)
 from data_perimeter_helper.findings.ExternalAccessAnalyzer import (
     ExternalAccessAnalyzer
 )
@@ -42,14 +45,14 @@ class SecurityHub():
         if SecurityHub.enabled is True:
             return
         SecurityHub.enabled = True
-        assert Var.session_iam_aa is not None  # nosec: B101
         client_sh_bump_max_attemps = Config(
             retries={
                 'max_attempts': 15
             }
         )
-        SecurityHub.sh_client = Var.session_iam_aa.client(
+        SecurityHub.sh_client = boto3_pool.get_client(
             'securityhub',
+            profile_name=Var.profile_iam_access_analyzer,
             region_name=Var.region,
             config=client_sh_bump_max_attemps
         )
@@ -21,13 +21,18 @@ if __name__ == "__main__" and __package__ is None:
     )
 import logging
 from typing import (
+    Any,
+    Iterator,
     List,
     Dict,
+    Tuple,
     Union
 )
 from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
     ThreadPoolExecutor,
-    as_completed as concurrent_completed
+    wait
 )
 
 import pandas
@@ -41,11 +46,20 @@ from data_perimeter_helper.toolbox import (
     exporter
 )
 from data_perimeter_helper.queries import (
-    import_query
+    import_query,
+    principal_memo,
+    query_history,
+    result_dtype
 )
 from data_perimeter_helper.queries.Query import (
     Query
 )
+from data_perimeter_helper.queries.StagingTable import (
+    StagingTable
+)
+from data_perimeter_helper.queries.AthenaEngine import (
+    AthenaEngine
+)
 from data_perimeter_helper.referential import (
     import_referential
 )
@@ -149,7 +163,7 @@ def merge_all_and_export(
         list_df_to_export.append(
             {
                 'name': query_name,
-                'dataframe': pandas.concat(list_df, axis=0)
+                'dataframe': result_dtype.concat(list_df)
             }
         )
     export_to_file(
@@ -159,6 +173,25 @@ def merge_all_and_export(
     )
 
 
+def export_run_statistics(
+    dict_df: Dict[str, Dict[str, Dict[str, Union[str, pandas.DataFrame]]]],
+    list_export_format: List[str]
+) -> None:
+    """Export the execution statistics of all queries as a JSON file"""
+    if len(list_export_format) == 0:
+        return
+    list_statistics: List[Dict] = []
+    for account_id, dict_query in dict_df.items():
+        for query_name, query_value in dict_query.items():
+            list_statistics.append({
+                'AccountId': account_id,
+                'QueryName': query_name,
+                'ExecTime': query_value.get('exec_time'),
+                **query_value.get('statistics', {})  # type: ignore
+            })
+    exporter.export_run_statistics(list_statistics)
+
+
 def export_referential(list_export_format: List[str]) -> None:
     """Export referential"""
     list_dataframes: List[Dict[str, Union[str, pandas.DataFrame]]] = []
@@ -177,6 +210,186 @@ def export_referential(list_export_format: List[str]) -> None:
         )
 
 
+def plan_fused_queries(
+    standard_queries: Dict[str, Dict[str, Union[str, Query]]]
+) -> None:
+    """Group the standard queries performed on multiple accounts into fused
+    Athena queries if the variable `athena_fuse_accounts` is enabled"""
+    if Var.athena_fuse_accounts is not True:
+        return
+    if len(Var.list_account_id) < 2:
+        return
+    nb_query_saved = 0
+    for query_value in standard_queries.values():
+        assert isinstance(query_value['instance'], Query)  # nosec: B101
+        nb_query_saved += query_value['instance'].plan_fused_queries(
+            Var.list_account_id
+        )
+    log_msg = f"{nb_query_saved} Athena queries saved by fusing queries "\
+        "across accounts"
+    logger.debug(log_msg)
+    tqdm.write(utils.Icons.INFO + log_msg)
+
+
+def create_staging_table(
+    standard_queries: Dict[str, Dict[str, Union[str, Query]]]
+) -> None:
+    """Create the Athena staging table shared by the standard queries if the
+    variable `athena_staging_table` is enabled"""
+    if Var.athena_staging_table is not True:
+        return
+    list_statement: List[str] = []
+    for query_value in standard_queries.values():
+        assert isinstance(query_value['instance'], Query)  # nosec: B101
+        list_statement.extend(
+            query_value['instance'].list_athena_statement(Var.list_account_id)
+        )
+    start_time = utils.current_perf_time()
+    if not StagingTable.create(list_statement, Var.list_account_id):
+        return
+    exec_time = utils.get_readable_elapsed_perf_time(start_time)
+    log_msg = f"Athena staging table `{StagingTable.table_name}` created "\
+        f"in {exec_time}"
+    logger.debug(log_msg)
+    tqdm.write(utils.Icons.INFO + log_msg)
+
+
+def order_standard_queries(
+    standard_queries: Dict[str, Dict[str, Union[str, Query]]]
+) -> List[Tuple[str, str]]:
+    """Get the (account ID, query name) pairs of the standard queries. If the
+    variable `schedule_queries_by_history` is enabled, pairs are ordered by
+    decreasing expected runtime from the query history. Pairs without history
+    are estimated from the number of accounts scanned by the query"""
+    list_pair = [
+        (account_id, query_name)
+        for account_id in Var.list_account_id
+        for query_name in standard_queries
+    ]
+    if Var.schedule_queries_by_history is not True:
+        return list_pair
+    query_history.load()
+    default_runtime = query_history.get_default_runtime()
+
+    def get_expected_runtime(pair: Tuple[str, str]) -> float:
+        account_id, query_name = pair
+        runtime = query_history.get_expected_runtime(query_name, account_id)
+        if runtime is not None:
+            return runtime
+        query = standard_queries[query_name]['instance']
+        assert isinstance(query, Query)  # nosec: B101
+        return default_runtime * query.get_scope_factor(account_id)
+
+    return sorted(list_pair, key=get_expected_runtime, reverse=True)
+
+
+def record_query_history(
+    dict_df: Dict[str, Dict[str, Dict[str, Union[str, pandas.DataFrame]]]]
+) -> None:
+    """Record the statistics of the standard queries in the query history if
+    the variable `schedule_queries_by_history` is enabled"""
+    if Var.schedule_queries_by_history is not True:
+        return
+    for account_id in Var.list_account_id:
+        for query_name, query_value in dict_df.get(account_id, {}).items():
+            query_history.record(
+                query_name,
+                account_id,
+                query_value.get('statistics', {})  # type: ignore
+            )
+    query_history.save()
+
+
+def submit_queries(
+    executor: ThreadPoolExecutor,
+    queries: Dict[str, Dict[str, Dict[str, Union[str, Query]]]],
+    list_pair: List[Tuple[str, str]]
+) -> Dict[Future, List[Dict[str, Any]]]:
+    """Submit to the pool the standard queries of the (account ID, query
+    name) pairs and the standalone queries. If the variable
+    `athena_async_engine` is enabled, the Athena queries of the standard
+    queries are started first and processed once completed, see
+    `wait_queries`. Returns the submitted futures with their queries"""
+    dict_pending: Dict[Future, List[Dict[str, Any]]] = {}
+    standard_queries = queries.get("standard", {})
+    step = "start" if Query.use_athena_engine() else "process"
+    for account_id, query_name in list_pair:
+        query = standard_queries[query_name]['instance']
+        assert isinstance(query, Query)  # nosec: B101
+        function = query.start_athena_query if step == "start"\
+            else query.submit_query_with_statistics
+        dict_pending[executor.submit(function, account_id)] = [{
+            'account_id': account_id,
+            'query_name': query_name,
+            'instance': query,
+            'step': step,
+            'start_time': utils.current_perf_time()
+        }]
+    for standalone_query_type in Var.standalone_query_types:
+        standalone_queries = queries.get(standalone_query_type, {})
+        for query_name, query_value in standalone_queries.items():
+            query = query_value['instance']
+            assert isinstance(query, Query)  # nosec: B101
+            dict_pending[executor.submit(
+                query.submit_query_with_statistics,
+                standalone_query_type
+            )] = [{
+                'account_id': standalone_query_type,
+                'query_name': query_name,
+                'instance': query,
+                'step': "process",
+                'start_time': utils.current_perf_time()
+            }]
+    return dict_pending
+
+
+def wait_queries(
+    executor: ThreadPoolExecutor,
+    dict_pending: Dict[Future, List[Dict[str, Any]]]
+) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Wait for the submitted queries and yield each processed query with
+    its result as soon as it completes. A started Athena query is submitted
+    for processing once completed. The first exception is raised without
+    waiting for the other queries: the Athena queries not started yet and
+    the queries not running in the pool are cancelled"""
+    try:
+        while len(dict_pending) > 0:
+            set_done, _ = wait(dict_pending, return_when=FIRST_COMPLETED)
+            for future in set_done:
+                for item in dict_pending.pop(future):
+                    if item['step'] == "athena":
+                        # Errors of the Athena query are raised and logged
+                        # by the processing of the query
+                        dict_pending[executor.submit(
+                            item['instance'].submit_query_with_statistics,
+                            item['account_id']
+                        )] = [{**item, 'step': "process"}]
+                        continue
+                    exception = future.exception()
+                    if exception:
+                        raise exception
+                    if item['step'] == "process":
+                        yield item, future.result()
+                        continue
+                    athena_query = future.result()
+                    if athena_query is None:
+                        # No Athena query started, the query is processed
+                        # as without the Athena engine
+                        dict_pending[executor.submit(
+                            item['instance'].submit_query_with_statistics,
+                            item['account_id']
+                        )] = [{**item, 'step': "process"}]
+                        continue
+                    # Queries with the same statement share the Athena query
+                    dict_pending.setdefault(athena_query, []).append(
+                        {**item, 'step': "athena"}
+                    )
+    except BaseException:
+        AthenaEngine.cancel_queued_queries()
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+
+
 def query_per_account(
     queries: Dict[str, Dict[str, Dict[str, Union[str, Query]]]],
     list_export_format: List[str]
@@ -190,6 +403,8 @@ def query_per_account(
     for standalone_query_type in Var.standalone_query_types:
         nb_standalone_query += len(queries.get(standalone_query_type, {}))
     standard_queries = queries.get("standard", {})
+    plan_fused_queries(standard_queries)
+    create_staging_table(standard_queries)
     nb_query = (len(Var.list_account_id) * len(standard_queries)) +\
         nb_standalone_query
     dict_df: Dict[str, Dict[str, Dict[str, Union[str, pandas.DataFrame]]]] = {}
@@ -201,7 +416,7 @@ def query_per_account(
             dict_df[account_id] = {}
             for query_name, query_value in standard_queries.items():
                 start_time = utils.current_perf_time()
-                result = query_value['instance'].submit_query(  # type: ignore
+                result = query_value['instance'].submit_query_with_statistics(  # type: ignore
                     account_id=account_id
                 )
                 exec_time = utils.get_readable_elapsed_perf_time(start_time)
@@ -209,7 +424,8 @@ def query_per_account(
                     'name': query_name,
                     'query': result['query'],
                     'dataframe': result['dataframe'],
-                    'exec_time': exec_time
+                    'exec_time': exec_time,
+                    'statistics': result['statistics']
                 }
                 log_msg = f"Completed query `{query_name}` for account"\
                     f" {account_id} in {exec_time}!"
@@ -228,7 +444,7 @@ def query_per_account(
             for query_name, query_value in standalone_queries.items():
                 start_time = utils.current_perf_time()
                 assert isinstance(query_value['instance'], Query)  # nosec: B101
-                result = query_value['instance'].submit_query(
+                result = query_value['instance'].submit_query_with_statistics(
                     account_id=standalone_query_type
                 )
                 exec_time = utils.get_readable_elapsed_perf_time(start_time)
@@ -236,7 +452,8 @@ def query_per_account(
                     'name': query_name,
                     'query': result['query'],
                     'dataframe': result['dataframe'],
-                    'exec_time': exec_time
+                    'exec_time': exec_time,
+                    'statistics': result['statistics']
                 }
                 log_msg = f"Completed {standalone_query_type} query `{query_name}`"\
                     f" in {exec_time}!"
@@ -247,11 +464,14 @@ def query_per_account(
                 )
                 logger.debug(log_msg)
                 pbar.update(1)
+    principal_memo.log_statistics()
     export_all_queries(
         list_account_id=Var.list_account_id,
         dict_df=dict_df,
         list_export_format=list_export_format,
     )
+    export_run_statistics(dict_df, list_export_format)
+    record_query_history(dict_df)
 
 
 def query_in_parrallel(
@@ -268,61 +488,39 @@ def query_in_parrallel(
     )
     Var.augment_variables()
     dict_df: Dict[str, Dict[str, Dict[str, Union[str, pandas.DataFrame]]]] = {}
-    pool = {}
     nb_standalone_query = 0
     for standalone_query_type in Var.standalone_query_types:
         nb_standalone_query += len(queries.get(standalone_query_type, {}))
     standard_queries = queries.get("standard", {})
+    plan_fused_queries(standard_queries)
+    create_staging_table(standard_queries)
     nb_query = (len(Var.list_account_id) * len(standard_queries)) +\
         nb_standalone_query
     with tqdm(
         total=nb_query, desc="Nb queries performed: ", unit="Queries"
     ) as pbar:
         with ThreadPoolExecutor(max_workers=Var.thread_max_worker) as executor:
-            # Manage standard queries
             for account_id in Var.list_account_id:
                 dict_df[account_id] = {}
-                pool.update({
-                    executor.submit(
-                        query_value['instance'].submit_query,  # type: ignore
-                        account_id
-                    ): {
-                        'account_id': account_id,
-                        'query_name': query_name,
-                        'start_time': utils.current_perf_time()
-                    }
-                    for query_name, query_value in standard_queries.items()
-                })
-            # Manage standalone queries not tied to an account
             for standalone_query_type in Var.standalone_query_types:
-                standalone_queries = queries.get(standalone_query_type, {})
                 dict_df[standalone_query_type] = {}
-                pool.update({
-                    executor.submit(
-                        query_value['instance'].submit_query,  # type: ignore
-                        standalone_query_type
-                    ): {
-                        'account_id': standalone_query_type,
-                        'query_name': query_name,
-                        'start_time': utils.current_perf_time()
-                    }
-                    for query_name, query_value in standalone_queries.items()
-                })
-            for request_in_pool in concurrent_completed(pool):
-                exception = request_in_pool.exception()
-                if exception:
-                    raise exception
-                account_id = str(pool[request_in_pool]['account_id'])
-                query_name = str(pool[request_in_pool]['query_name'])
+            dict_pending = submit_queries(
+                executor,
+                queries,
+                order_standard_queries(standard_queries)
+            )
+            for item, result in wait_queries(executor, dict_pending):
+                account_id = str(item['account_id'])
+                query_name = str(item['query_name'])
                 exec_time = utils.get_readable_elapsed_perf_time(
-                    pool[request_in_pool]['start_time']
+                    item['start_time']
                 )
-                result = request_in_pool.result()
                 dict_df[account_id][query_name] = {
                     'name': query_name,
                     'query': result['query'],
                     'dataframe': result['dataframe'],
-                    'exec_time': exec_time
+                    'exec_time': exec_time,
+                    'statistics': result['statistics']
                 }
                 if account_id in Var.standalone_query_types:
                     log_msg = f"Completed {account_id} query `{query_name}`"\
@@ -338,11 +536,19 @@ def query_in_parrallel(
                 )
                 logger.debug(log_msg)
                 pbar.update(1)
+    if Query.use_athena_engine():
+        log_msg = "Athena engine concurrency limit at the end of the run: "\
+            f"{AthenaEngine.get_concurrency_limit()}"
+        logger.debug(log_msg)
+        tqdm.write(utils.Icons.INFO + log_msg)
+    principal_memo.log_statistics()
     export_all_queries(
         list_account_id=Var.list_account_id,
         dict_df=dict_df,
         list_export_format=list_export_format,
     )
+    export_run_statistics(dict_df, list_export_format)
+    record_query_history(dict_df)
 
 
 def init_iam_access_analyzer_external_access_findings() -> bool:
@@ -399,6 +605,14 @@ def main(args=None) -> int:
     except BaseException:
         logger.exception("[!] Fatal expection catched")  # nosemgrep: logging-error-without-handling
         raise
+    finally:
+        try:
+            StagingTable.drop()
+        except Exception:  # pylint: disable=broad-except
+            # Do not replace the exception raised by the run, if any
+            logger.exception(  # nosemgrep: logging-error-without-handling
+                "[!] Unable to drop the Athena staging table"
+            )
     return 0
 
 
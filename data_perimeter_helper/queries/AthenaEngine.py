@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+'''
+This module hosts the class AthenaEngine used to submit Athena queries
+asynchronously and track their execution with a single poller thread
+'''
+import logging
+import random
+import time
+from collections import (
+    deque
+)
+from concurrent.futures import (
+    Future
+)
+from threading import (
+    Condition,
+    Thread
+)
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Tuple
+)
+
+import boto3
+import awswrangler as wr
+from awswrangler.exceptions import (
+    QueryFailed
+)
+from botocore.exceptions import (
+    ClientError
+)
+
+from data_perimeter_helper.toolbox import (
+    boto3_pool
+)
+from data_perimeter_helper.variables import (
+    Variables as Var
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class AthenaEngine:
+    '''Starts Athena queries with StartQueryExecution and tracks them in a
+    poller thread using BatchGetQueryExecution. Callers receive a Future
+    resolved with the QueryExecution once the query reaches a final state.
+    The number of queries running at the same time is adapted with an
+    additive increase, multiplicative decrease (AIMD) policy: the limit is
+    halved when Athena throttles the engine and slowly increased while
+    queries spend little time queued. It never exceeds the variable
+    `athena_max_concurrent_queries`, queries above the limit are queued.
+    A query throttled when started is queued again after a backoff, it fails
+    once throttled more than `MAX_THROTTLING_RETRIES` times'''
+    BATCH_GET_MAX_ID = 50
+    POLLING_DELAY = 1.0
+    BACKOFF_BASE_DELAY = 1.0
+    BACKOFF_MAX_DELAY = 60.0
+    MAX_THROTTLING_RETRIES = 8
+    LOW_QUEUE_TIME_IN_MILLIS = 1000
+    THROTTLING_ERROR_CODES = (
+        "TooManyRequestsException",
+        "ThrottlingException",
+    )
+    condition = Condition()
+    poller: Optional[Thread] = None
+    executions: Dict[Tuple[str, Tuple[str, ...]], Future] = {}
+    # Queued items: (query, params, future, number of throttled attempts)
+    queued: Deque[Tuple[str, List[str], Future, int]] = deque()
+    running: Dict[str, Future] = {}
+    concurrency_limit: Optional[float] = None
+    nb_throttling = 0
+    backoff_until = 0.0
+
+    @classmethod
+    def get_concurrency_limit(cls) -> int:
+        """Get the current limit of Athena queries running at the same
+        time"""
+        with cls.condition:
+            if cls.concurrency_limit is None:
+                return Var.athena_max_concurrent_queries
+            return max(1, int(cls.concurrency_limit))
+
+    @classmethod
+    def is_throttling_error(cls, error: Exception) -> bool:
+        """Return True if an error is raised by Athena throttling"""
+        return isinstance(error, ClientError)\
+            and error.response.get('Error', {}).get('Code')\
+            in cls.THROTTLING_ERROR_CODES
+
+    @classmethod
+    def get_backoff_delay(cls, nb_attempt: int) -> float:
+        """Get an exponential backoff delay with full jitter"""
+        return random.uniform(  # nosec: B311
+            0,
+            min(
+                cls.BACKOFF_MAX_DELAY,
+                cls.BACKOFF_BASE_DELAY * (2 ** nb_attempt)
+            )
+        )
+
+    @classmethod
+    def decrease_concurrency_limit(cls) -> None:
+        """Halve the concurrency limit and back off after a throttling. Must
+        be called with the condition acquired"""
+        now = time.monotonic()
+        if now < cls.backoff_until:
+            # Throttling caused by queries started before the last decrease
+            return
+        cls.nb_throttling += 1
+        cls.concurrency_limit = max(
+            1.0,
+            (cls.concurrency_limit or Var.athena_max_concurrent_queries) / 2
+        )
+        cls.backoff_until = now + cls.get_backoff_delay(cls.nb_throttling)
+        logger.debug(
+            "[~] Athena throttling, concurrency limit decreased to %s",
+            int(cls.concurrency_limit)
+        )
+
+    @classmethod
+    def increase_concurrency_limit(cls) -> None:
+        """Increase the concurrency limit by one per limit of completed
+        queries. Must be called with the condition acquired"""
+        limit = cls.concurrency_limit or Var.athena_max_concurrent_queries
+        cls.concurrency_limit = min(
+            float(Var.athena_max_concurrent_queries),
+            limit + 1 / limit
+        )
+        cls.nb_throttling = 0
+
+    @classmethod
+    def start_query_execution(
+        cls,
+        query: str,
+        params: List[str]
+    ) -> Future:
+        """Queue an Athena query for execution and return a Future resolved
+        with the QueryExecution. Submitting twice the same query and params
+        returns the Future of the first submission"""
+        key = (query, tuple(params))
+        with cls.condition:
+            if key in cls.executions:
+                return cls.executions[key]
+            future: Future = Future()
+            cls.executions[key] = future
+            cls.queued.append((query, params, future, 0))
+            if cls.poller is None or not cls.poller.is_alive():
+                cls.poller = Thread(
+                    target=cls.poll,
+                    name="athena_engine_poller",
+                    daemon=True
+                )
+                cls.poller.start()
+            cls.condition.notify()
+        return future
+
+    @classmethod
+    def get_query_execution(
+        cls,
+        query: str,
+        params: List[str]
+    ) -> Dict[str, Any]:
+        """Wait for the completion of an Athena query, start it if it has not
+        been started yet, and return its QueryExecution"""
+        future = cls.start_query_execution(query, params)
+        try:
+            return future.result()
+        finally:
+            with cls.condition:
+                cls.executions.pop((query, tuple(params)), None)
+
+    @classmethod
+    def cancel_queued_queries(cls) -> None:
+        """Cancel the queries not started yet, the queries already running
+        are left to complete"""
+        with cls.condition:
+            list_future = [item[2] for item in cls.queued]
+            cls.queued.clear()
+        for future in list_future:
+            future.cancel()
+
+    @classmethod
+    def poll(cls) -> None:
+        """Poller loop: start queued queries within the concurrency limit and
+        check the state of running queries by batch"""
+        try:
+            boto3_session = boto3_pool.get_session(
+                profile_name=Var.profile_athena_access,
+                region_name=Var.region
+            )
+            athena_client = boto3_pool.get_client(
+                "athena",
+                profile_name=Var.profile_athena_access,
+                region_name=Var.region
+            )
+            while True:
+                with cls.condition:
+                    if len(cls.queued) == 0 and len(cls.running) == 0:
+                        cls.poller = None
+                        return
+                cls.start_queued_queries(boto3_session)
+                cls.check_running_queries(athena_client)
+                with cls.condition:
+                    cls.condition.wait(timeout=cls.POLLING_DELAY)
+        except Exception as error:  # pylint: disable=broad-except
+            logger.error("[!] Athena engine poller has failed: %s", error)  # nosemgrep: logging-error-without-handling
+            with cls.condition:
+                list_future = [item[2] for item in cls.queued]
+                list_future.extend(cls.running.values())
+                cls.queued.clear()
+                cls.running.clear()
+                cls.poller = None
+            for future in list_future:
+                future.set_exception(error)
+
+    @classmethod
+    def start_queued_queries(
+        cls,
+        boto3_session: boto3.session.Session
+    ) -> None:
+        """Start queued queries while the concurrency limit is not reached"""
+        while True:
+            with cls.condition:
+                if len(cls.queued) == 0:
+                    return
+                if time.monotonic() < cls.backoff_until:
+                    return
+                if len(cls.running) >= cls.get_concurrency_limit():
+                    return
+                query, params, future, nb_attempt = cls.queued.popleft()
+            try:
+                query_execution_id = wr.athena.start_query_execution(
+                    sql=query,
+                    database=Var.athena_database,
+                    workgroup=Var.athena_workgroup,
+                    params=params if len(params) > 0 else None,
+                    paramstyle="qmark",
+                    boto3_session=boto3_session,
+                )
+            except Exception as error:  # pylint: disable=broad-except
+                if cls.is_throttling_error(error):
+                    nb_attempt += 1
+                    if nb_attempt <= cls.MAX_THROTTLING_RETRIES:
+                        with cls.condition:
+                            cls.queued.appendleft(
+                                (query, params, future, nb_attempt)
+                            )
+                            cls.decrease_concurrency_limit()
+                            # Queued queries are started after the backoff
+                            cls.backoff_until = max(
+                                cls.backoff_until,
+                                time.monotonic()
+                                + cls.get_backoff_delay(nb_attempt)
+                            )
+                        return
+                    logger.debug(
+                        "[!] Athena query throttled %s times, aborted",
+                        nb_attempt
+                    )
+                future.set_exception(error)
+                continue
+            assert isinstance(query_execution_id, str)  # nosec: B101
+            logger.debug(
+                "[~] Athena query started: %s", query_execution_id
+            )
+            with cls.condition:
+                cls.running[query_execution_id] = future
+
+    @classmethod
+    def check_running_queries(cls, athena_client) -> None:
+        """Resolve the Futures of running queries that reached a final
+        state"""
+        with cls.condition:
+            list_query_execution_id = list(cls.running.keys())
+        for i in range(0, len(list_query_execution_id), cls.BATCH_GET_MAX_ID):
+            chunk = list_query_execution_id[i:i + cls.BATCH_GET_MAX_ID]
+            try:
+                response = athena_client.batch_get_query_execution(
+                    QueryExecutionIds=chunk
+                )
+            except ClientError as error:
+                if cls.is_throttling_error(error):
+                    with cls.condition:
+                        cls.decrease_concurrency_limit()
+                    return
+                logger.error("[!] Error from AWS client:\n%s", error.response)  # nosemgrep: logging-error-without-handling
+                with cls.condition:
+                    for query_execution_id in chunk:
+                        cls.running.pop(query_execution_id).set_exception(
+                            error
+                        )
+                continue
+            for query_execution in response.get('QueryExecutions', []):
+                cls.resolve(query_execution)
+
+    @classmethod
+    def resolve(cls, query_execution: Dict[str, Any]) -> None:
+        """Resolve the Future of a query if it reached a final state"""
+        state = query_execution['Status']['State']
+        if state not in ('SUCCEEDED', 'FAILED', 'CANCELLED'):
+            return
+        queue_time = query_execution.get('Statistics', {}).get(
+            'QueryQueueTimeInMillis', 0
+        )
+        with cls.condition:
+            future = cls.running.pop(query_execution['QueryExecutionId'])
+            if queue_time < cls.LOW_QUEUE_TIME_IN_MILLIS:
+                cls.increase_concurrency_limit()
+        if state == 'SUCCEEDED':
+            future.set_result(query_execution)
+            return
+        future.set_exception(
+            QueryFailed(
+                query_execution['Status'].get(
+                    'StateChangeReason', f"Query {state.lower()}"
+                )
+            )
+        )
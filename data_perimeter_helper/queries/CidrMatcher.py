@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+'''
+This module hosts the class CidrMatcher used to match columns of IP
+addresses against lists of CIDRs
+'''
+import logging
+from ipaddress import (
+    ip_address,
+    ip_network,
+    IPv6Network
+)
+from typing import (
+    List,
+    Optional,
+    Tuple
+)
+
+import numpy
+import pandas
+
+
+logger = logging.getLogger(__name__)
+
+
+class CidrMatcher:
+    '''Matches IP addresses against a list of CIDRs. IPv4 addresses are
+    converted to integers and matched with a binary search against the
+    sorted and merged intervals of the IPv4 CIDRs. Other values (IPv6
+    addresses, DNS names such as `s3.amazonaws.com`) are parsed once per
+    distinct value and matched against the IPv6 CIDRs'''
+    octet = r"(25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)"
+    regex_ipv4 = rf"^{octet}\.{octet}\.{octet}\.{octet}$"
+
+    def __init__(self, list_cidr: List[str]) -> None:
+        list_interval: List[Tuple[int, int]] = []
+        self.list_ipv6_network: List[IPv6Network] = []
+        for cidr in list_cidr:
+            try:
+                network = ip_network(cidr)
+            except ValueError:
+                logger.debug("[!] Invalid CIDR: %s", cidr)
+                continue
+            if isinstance(network, IPv6Network):
+                self.list_ipv6_network.append(network)
+                continue
+            list_interval.append((
+                int(network.network_address),
+                int(network.broadcast_address)
+            ))
+        list_merged: List[Tuple[int, int]] = []
+        for start, end in sorted(list_interval):
+            if len(list_merged) > 0 and start <= list_merged[-1][1] + 1:
+                list_merged[-1] = (
+                    list_merged[-1][0], max(end, list_merged[-1][1])
+                )
+            else:
+                list_merged.append((start, end))
+        self.starts = numpy.array(
+            [start for start, _ in list_merged], dtype=numpy.int64
+        )
+        self.ends = numpy.array(
+            [end for _, end in list_merged], dtype=numpy.int64
+        )
+
+    @classmethod
+    def ipv4_to_int(
+        cls,
+        values: pandas.Series
+    ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """Convert a Series of IPv4 addresses to integers. Returns the
+        integers and a mask of the values that are IPv4 addresses"""
+        octets = values.astype(object).str.extract(cls.regex_ipv4)
+        is_ipv4 = octets[0].notna().to_numpy(dtype=bool)
+        octets = octets.fillna("0").astype(numpy.uint32).to_numpy()
+        ints = (octets[:, 0] << 24) | (octets[:, 1] << 16)\
+            | (octets[:, 2] << 8) | octets[:, 3]
+        return ints.astype(numpy.int64), is_ipv4
+
+    def match(
+        self,
+        values: pandas.Series,
+        ipv4: Optional[Tuple[numpy.ndarray, numpy.ndarray]] = None
+    ) -> numpy.ndarray:
+        """Return a boolean array set to True for the values in one of the
+        CIDRs. <ipv4> is the result of ipv4_to_int for <values>, if already
+        computed"""
+        ints, is_ipv4 = self.ipv4_to_int(values) if ipv4 is None else ipv4
+        is_match = numpy.zeros(len(ints), dtype=bool)
+        if len(self.starts) > 0:
+            ipv4_ints = ints[is_ipv4]
+            interval = numpy.searchsorted(
+                self.starts, ipv4_ints, side='right'
+            ) - 1
+            is_in_interval = interval >= 0
+            is_in_interval[is_in_interval] = ipv4_ints[is_in_interval]\
+                <= self.ends[interval[is_in_interval]]
+            is_match[is_ipv4] = is_in_interval
+        if len(self.list_ipv6_network) > 0:
+            is_other = ~is_ipv4 & values.notna().to_numpy(dtype=bool)
+            other_values = values[is_other]
+            codes, unique_values = pandas.factorize(other_values)
+            unique_is_match = numpy.array(
+                [self.is_in_ipv6_network(value) for value in unique_values],
+                dtype=bool
+            )
+            is_match[is_other] = unique_is_match[codes]
+        return is_match
+
+    def is_in_ipv6_network(self, value: str) -> bool:
+        """Return True if a value is an IPv6 address in one of the CIDRs"""
+        try:
+            address = ip_address(value)
+        except ValueError:
+            return False
+        return any(address in network for network in self.list_ipv6_network)
+
+    @staticmethod
+    def is_public(values: pandas.Series) -> numpy.ndarray:
+        """Return a boolean array set to True for the values that are public
+        IP addresses. The classification of ipaddress is evaluated once per
+        distinct value"""
+        codes, unique_values = pandas.factorize(values)
+        unique_is_public = numpy.zeros(len(unique_values) + 1, dtype=bool)
+        for position, value in enumerate(unique_values):
+            try:
+                unique_is_public[position] = not ip_address(value).is_private
+            except ValueError:
+                continue
+        # Codes equal to -1 are NA values and point to the last item
+        return unique_is_public[codes]
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+'''
+This module hosts the class FusedQuery used to perform a single Athena query
+for a batch of accounts
+'''
+import logging
+from threading import (
+    Lock
+)
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple
+)
+
+import pandas
+
+from data_perimeter_helper.queries import (
+    helper
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class FusedQuery:
+    '''Represents an Athena query covering a batch of accounts. The query is
+    performed by the first account requesting its results, the results are
+    then split back per account'''
+    account_column = "p_account"
+
+    def __init__(
+        self,
+        query_name: str,
+        list_account_id: List[str],
+        normalized_statement: str,
+        params: List[str],
+    ):
+        """Init a fused query from a statement normalized with
+        `helper.athena_normalize_account_statement`"""
+        self.query_name = query_name
+        self.list_account_id = list_account_id
+        self.account_label = ', '.join(list_account_id)
+        self.params = params
+        self.statement = FusedQuery.generate_statement(
+            normalized_statement,
+            list_account_id
+        )
+        self.lock = Lock()
+        self.readable_query: Optional[str] = None
+        self.results: Dict[str, pandas.DataFrame] = {}
+        self.empty_result: Optional[pandas.DataFrame] = None
+
+    @classmethod
+    def generate_statement(
+        cls,
+        normalized_statement: str,
+        list_account_id: List[str]
+    ) -> str:
+        """Generate the Athena statement for the batch of accounts"""
+        p_account = ','.join(
+            f"'{account_id}'" for account_id in list_account_id
+        )
+        statement = normalized_statement.replace(
+            "__ATHENA_ACCOUNT_LIST_PLACEHOLDER__",
+            f"fused: {len(list_account_id)} accounts"
+        ).replace(
+            "__ATHENA_ACCOUNT_PARTITION_PLACEHOLDER__",
+            f"p_account IN ({p_account})"
+        )
+        statement_with_account = helper.athena_add_column_to_statement(
+            statement,
+            cls.account_column
+        )
+        if statement_with_account is None:
+            raise ValueError(
+                f"Cannot add the column {cls.account_column} to the statement"
+            )
+        return statement_with_account
+
+    def get_result(
+        self,
+        account_id: str,
+        function_execute: Callable[
+            [str, List[str], str], Tuple[str, pandas.DataFrame]
+        ]
+    ) -> Tuple[str, pandas.DataFrame]:
+        """Get the results of the fused query for a given account. The first
+        caller performs the Athena query through <function_execute>, callers
+        for other accounts of the batch wait for the results"""
+        with self.lock:
+            if self.readable_query is None:
+                readable_query, result = function_execute(
+                    self.statement,
+                    self.params.copy(),
+                    self.account_label
+                )
+                self.split_result(result)
+                self.readable_query = readable_query
+            result = self.results.pop(account_id, None)
+        if result is None:
+            assert isinstance(self.empty_result, pandas.DataFrame)  # nosec: B101
+            result = self.empty_result.copy()
+        return self.readable_query, result
+
+    def split_result(self, result: pandas.DataFrame) -> None:
+        """Split the results of the fused query per account"""
+        if self.account_column not in result.columns:
+            self.empty_result = pandas.DataFrame()
+            return
+        self.empty_result = result.iloc[0:0].drop(
+            columns=[self.account_column]
+        )
+        for account_id, df_account in result.groupby(
+            self.account_column, sort=False
+        ):
+            self.results[str(account_id)] = df_account.drop(
+                columns=[self.account_column]
+            ).reset_index(drop=True)
+        logger.debug(
+            "[~] Fused query `%s` split into results for %s accounts",
+            self.query_name, len(self.results)
+        )
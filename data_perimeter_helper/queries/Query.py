@@ -8,8 +8,14 @@ queries inherit
 '''
 import logging
 import re
+import threading
+import time
+from concurrent.futures import (
+    Future
+)
 from typing import (
     Callable,
+    Iterator,
     Union,
     Optional,
     Dict,
@@ -17,7 +23,7 @@ from typing import (
     Tuple,
 )
 
-import boto3
+import numpy
 import pandas
 import awswrangler as wr
 from awswrangler.exceptions import (
@@ -29,12 +35,30 @@ from botocore.exceptions import (
 from pandas._libs.missing import (
     NAType
 )
+from pandas.api.extensions import (
+    take
+)
 
 from data_perimeter_helper.queries import (
-    helper
+    helper,
+    athena_cache,
+    incremental,
+    principal_memo,
+    resource_exception,
+    result_dtype
+)
+from data_perimeter_helper.queries.FusedQuery import (
+    FusedQuery
+)
+from data_perimeter_helper.queries.AthenaEngine import (
+    AthenaEngine
+)
+from data_perimeter_helper.queries.StagingTable import (
+    StagingTable
 )
 from data_perimeter_helper.toolbox import (
-    utils
+    utils,
+    boto3_pool
 )
 from data_perimeter_helper.referential.Referential import (
     Referential
@@ -52,6 +76,16 @@ class Query:
     queries: Dict[str, 'Query'] = {}
     depends_on_resource_type: List[str] = []
     depends_on_iam_access_analyzer = False
+    athena_statistics: Dict[str, Dict[str, Union[int, str, None]]] = {}
+    thread_local = threading.local()
+    # Columns derived from the IAM role of the principal and the attribute
+    # of the resource type AWS::IAM::Role they are populated with
+    ROLE_ATTRIBUTE_COLUMN = {
+        'isAssumableBy': 'allowedPrincipalList',
+        'isServiceRole': 'isServiceRole',
+        'isServiceLinkedRole': 'isServiceLinkedRole',
+        'isNetworkPerimeterHumanRole': 'isNetworkPerimeterHumanRole',
+    }
 
     def __init__(
         self,
@@ -64,6 +98,7 @@ class Query:
         Query.queries[name] = self
         self.name = name
         self.use_split = use_split_table
+        self.fused_queries: Dict[str, FusedQuery] = {}
         if depends_on_resource_type is not None and len(depends_on_resource_type):
             Query.depends_on_resource_type.extend(depends_on_resource_type)
             Query.depends_on_resource_type = list(set(
@@ -87,38 +122,466 @@ class Query:
         Submit a query"""
         raise NotImplementedError("Must be overridden by childs queries")
 
+    def submit_query_with_statistics(
+        self, account_id: str
+    ) -> Dict[str, Union[str, pandas.DataFrame, Dict]]:
+        """Submit a query and attach the statistics of the performed Athena
+        query and the time spent on local processing"""
+        Query.thread_local.athena_time = 0.0
+        start_time = utils.current_perf_time()
+        if Query.use_streaming():
+            result: Dict[str, Union[str, pandas.DataFrame, Dict]] = dict(
+                self.submit_query_streamed(account_id)
+            )
+        else:
+            result = dict(self.submit_query(account_id=account_id))
+        if isinstance(result.get('dataframe'), pandas.DataFrame):
+            result['dataframe'] = result_dtype.compact(
+                result['dataframe']  # type: ignore
+            )
+        elapsed_time = utils.current_perf_time() - start_time
+        athena_time = Query.thread_local.athena_time
+        statistics: Dict[str, Union[int, str, None]] = dict(
+            Query.athena_statistics.get(str(result.get('query')), {})
+        )
+        statistics['AthenaClientTimeInMillis'] = int(athena_time * 1000)
+        statistics['LocalProcessingTimeInMillis'] = int(
+            (elapsed_time - athena_time) * 1000
+        )
+        result['statistics'] = statistics
+        return result
+
+    def submit_query_streamed(
+        self, account_id: str
+    ) -> Dict[str, Union[str, pandas.DataFrame]]:
+        """Submit a query and perform its data processing on the Athena
+        results chunk by chunk. `submit_query` is called once per chunk, each
+        call to `submit_athena_query` returns the next chunk. Only the
+        processed chunks are retained"""
+        stream: Dict = {
+            'query': "", 'iterator': None, 'exhausted': False, 'cache_key': None
+        }
+        Query.thread_local.stream = stream
+        list_df: List[pandas.DataFrame] = []
+        try:
+            while True:
+                result = self.submit_query(account_id=account_id)
+                dataframe = result['dataframe']
+                assert isinstance(dataframe, pandas.DataFrame)  # nosec: B101
+                if len(dataframe.index) > 0:
+                    list_df.append(dataframe)
+                if stream['iterator'] is None or stream['exhausted'] is True:
+                    break
+        finally:
+            # Cached only if all chunks have been read
+            athena_cache.close_cached_chunks(stream, is_complete=False)
+            Query.thread_local.stream = None
+        if len(list_df) == 0:
+            return result
+        return {
+            **result,
+            'dataframe': pandas.concat(list_df, ignore_index=True)
+        }
+
+    def read_next_chunk(self, stream: Dict) -> pandas.DataFrame:
+        """Read the next chunk of a streamed Athena result. Returns an empty
+        DataFrame once all chunks have been read"""
+        chunk = next(stream['iterator'], None)
+        if chunk is None:
+            stream['exhausted'] = True
+            athena_cache.close_cached_chunks(stream, is_complete=True)
+            return pandas.DataFrame()
+        athena_cache.write_cached_chunk(stream, chunk)
+        if stream['query'] not in Query.athena_statistics:
+            Query.athena_statistics[stream['query']] = {
+                'ResultSource': 'athena',
+                **helper.get_athena_query_statistics(chunk)
+            }
+        return chunk
+
     def submit_athena_query(
         self,
         query_name: str,
         account_id: str
     ) -> Tuple[str, pandas.DataFrame]:
         """Generate the Athena query and then submit it"""
-        context_infos = f"(account_id: {account_id} | query: {query_name}"\
-            f" | use_param: {Var.use_parameterized_queries})"
-        logger.debug("[-] Generating Athena query %s", context_infos)
+        start_time = utils.current_perf_time()
+        stream = getattr(Query.thread_local, 'stream', None)
+        try:
+            if stream is not None and stream['iterator'] is not None:
+                return stream['query'], self.read_next_chunk(stream)
+            if stream is not None and account_id not in self.fused_queries:
+                tuple_streamed = self.execute_athena_query_streamed(
+                    query_name,
+                    account_id
+                )
+                if tuple_streamed is not None:
+                    stream['query'], stream['iterator'], \
+                        stream['cache_key'] = tuple_streamed
+                    return stream['query'], self.read_next_chunk(stream)
+            if account_id in self.fused_queries:
+                return self.fused_queries[account_id].get_result(
+                    account_id,
+                    lambda statement, params, list_account_id: self.execute_athena_query(
+                        query_name,
+                        list_account_id,
+                        lambda _: (statement, params)
+                    )
+                )
+            return self.execute_athena_query(
+                query_name,
+                account_id,
+                self.generate_athena_statement
+            )
+        finally:
+            Query.thread_local.athena_time = getattr(
+                Query.thread_local, 'athena_time', 0.0
+            ) + utils.current_perf_time() - start_time
+
+    def prepare_athena_query(
+        self,
+        account_id: str,
+        function_generate_statement: Callable
+    ) -> Optional[Tuple[str, List[str], str]]:
+        """Generate the Athena query with <function_generate_statement>.
+        Returns None if no query is generated, else returns the query and
+        parameters to submit to Athena and the readable query"""
         tuple_query_param = self.generate_athena_query(
-            function_generate_statement=self.generate_athena_statement,
+            function_generate_statement=function_generate_statement,
             account_id=account_id
         )
         if tuple_query_param is None:
-            logger.warning("[!] No query generated %s", context_infos)
-            return "", pandas.DataFrame()
+            return None
         query, params = tuple_query_param
         readable_query = Query.generate_readable_query(query, params)
-        logger.debug("[+] Generating Athena query %s", context_infos)
-        logger.debug("[-] Executing Athena query %s", context_infos)
         if Var.use_parameterized_queries is True:
-            result = self.read_sql_query(
-                query, params, query_name, account_id,
-            )
-        else:
-            result = self.read_sql_query(
-                readable_query, [], query_name, account_id,
+            return query, params, readable_query
+        return readable_query, [], readable_query
+
+    def execute_athena_query(
+        self,
+        query_name: str,
+        account_id: str,
+        function_generate_statement: Callable,
+        use_incremental: bool = True
+    ) -> Tuple[str, pandas.DataFrame]:
+        """Generate the Athena query with <function_generate_statement> and
+        then submit it"""
+        if use_incremental is True:
+            tuple_incremental = self.prepare_incremental_athena_query(
+                account_id,
+                function_generate_statement
             )
+            if tuple_incremental is not None:
+                return self.execute_incremental_athena_query(
+                    query_name,
+                    account_id,
+                    function_generate_statement,
+                    tuple_incremental
+                )
+        context_infos = f"(account_id: {account_id} | query: {query_name}"\
+            f" | use_param: {Var.use_parameterized_queries})"
+        logger.debug("[-] Generating Athena query %s", context_infos)
+        tuple_query = self.prepare_athena_query(
+            account_id,
+            function_generate_statement
+        )
+        if tuple_query is None:
+            logger.warning("[!] No query generated %s", context_infos)
+            return "", pandas.DataFrame()
+        query, params, readable_query = tuple_query
+        logger.debug("[+] Generating Athena query %s", context_infos)
+        cache_key = athena_cache.get_cache_key(readable_query)
+        cached_result = athena_cache.read_cached_result(cache_key)
+        if cached_result is not None:
+            athena_cache.report_cache_hit(query_name, account_id)
+            Query.athena_statistics[readable_query] = {'ResultSource': 'cache'}
+            return readable_query, cached_result
+        logger.debug("[-] Executing Athena query %s", context_infos)
+        result = self.read_sql_query(
+            query, params, query_name, account_id,
+        )
+        assert isinstance(result, pandas.DataFrame)  # nosec: B101
+        Query.athena_statistics[readable_query] = {
+            'ResultSource': 'athena',
+            **helper.get_athena_query_statistics(result)
+        }
+        athena_cache.write_cached_result(cache_key, result)
         logger.debug(readable_query)
         logger.debug("[+] Executing Athena query %s", context_infos)
         return readable_query, result
 
+    def execute_athena_query_streamed(
+        self,
+        query_name: str,
+        account_id: str
+    ) -> Optional[Tuple[str, Iterator[pandas.DataFrame], Optional[str]]]:
+        """Generate the Athena query of a given account and submit it, the
+        results are read by chunks of `athena_chunksize` rows. Returns None if
+        the results must be read at once, when they are cached or processed
+        incrementally. Else returns the readable query, the iterator on
+        chunks and the key under which the chunks are cached, if any"""
+        if self.prepare_incremental_athena_query(
+            account_id,
+            self.generate_athena_statement
+        ) is not None:
+            return None
+        tuple_query = self.prepare_athena_query(
+            account_id,
+            self.generate_athena_statement
+        )
+        if tuple_query is None:
+            return None
+        query, params, readable_query = tuple_query
+        cache_key = athena_cache.get_cache_key(readable_query)
+        if athena_cache.has_cached_result(cache_key):
+            return None
+        logger.debug(
+            "[-] Executing Athena query %s for account %s by chunks",
+            query_name, account_id
+        )
+        Query.athena_statistics.pop(readable_query, None)
+        iterator = self.read_sql_query(
+            query, params, query_name, account_id,
+            chunksize=Var.athena_chunksize
+        )
+        return readable_query, iter(iterator), cache_key
+
+    def prepare_incremental_athena_query(
+        self,
+        account_id: str,
+        function_generate_statement: Callable
+    ) -> Optional[Tuple[str, List[str], List[str], Callable]]:
+        """Prepare the processing of an Athena query per day partition.
+        Returns None if the query cannot be processed incrementally, else
+        returns the storage key, the days of the date window, the days to
+        query and the function generating the statement for these days"""
+        if not incremental.is_enabled():
+            return None
+        if helper.get_athena_sql_limit(account_id) != 0:
+            helper.warn_skipped_by_sql_limit(
+                "athena_incremental_partitions", account_id
+            )
+            return None
+        tuple_statement_param = function_generate_statement(account_id)
+        if tuple_statement_param is None:
+            return None
+        statement, params = tuple_statement_param
+        if statement is None:
+            return None
+        storage_key = incremental.get_storage_key(statement, params)
+        if storage_key is None:
+            return None
+        list_day = incremental.get_list_partition_day()
+        list_day_to_query = incremental.get_list_day_to_query(
+            storage_key, list_day
+        )
+        statement_per_day = incremental.generate_statement_per_day(
+            statement, list_day_to_query
+        )
+        if statement_per_day is None:
+            return None
+        return (
+            storage_key,
+            list_day,
+            list_day_to_query,
+            lambda _: (statement_per_day, params.copy())
+        )
+
+    def execute_incremental_athena_query(
+        self,
+        query_name: str,
+        account_id: str,
+        function_generate_statement: Callable,
+        tuple_incremental: Tuple[str, List[str], List[str], Callable]
+    ) -> Tuple[str, pandas.DataFrame]:
+        """Query the days of the date window without stored results, store
+        the results of past days and merge them with the stored days"""
+        storage_key, list_day, list_day_to_query, \
+            function_generate_statement_per_day = tuple_incremental
+        set_day_to_query = set(list_day_to_query)
+        list_result = incremental.read_stored_days(
+            storage_key,
+            [day for day in list_day if day not in set_day_to_query]
+        )
+        logger.debug(
+            "[~] Incremental Athena query %s for account %s: %s stored days,"
+            " %s days to query",
+            query_name, account_id, len(list_result), len(list_day_to_query)
+        )
+        if len(list_day_to_query) > 0:
+            readable_query, result = self.execute_athena_query(
+                query_name,
+                account_id,
+                function_generate_statement_per_day,
+                use_incremental=False
+            )
+            if incremental.partition_column in result.columns:
+                result = incremental.store_days(
+                    storage_key, list_day_to_query, result
+                )
+            if len(list_result) > 0 and readable_query in Query.athena_statistics:
+                # Only part of the date window has been queried
+                Query.athena_statistics[readable_query][
+                    'ResultSource'
+                ] = 'incremental'
+            list_result.append(result)
+        else:
+            tuple_query = self.prepare_athena_query(
+                account_id,
+                function_generate_statement
+            )
+            readable_query = tuple_query[2] if tuple_query is not None else ""
+            Query.athena_statistics[readable_query] = {
+                'ResultSource': 'incremental'
+            }
+        incremental.remove_days_outside_window(storage_key, list_day)
+        return readable_query, incremental.merge_days(list_result)
+
+    def start_athena_query(
+        self,
+        account_id: str
+    ) -> Optional[Future]:
+        """Start the Athena query of a given account with the Athena engine
+        without waiting for its completion. The results are retrieved later
+        by `submit_query`. Returns None if no Athena query is generated"""
+        if account_id in self.fused_queries:
+            fused_query = self.fused_queries[account_id]
+            account_label = fused_query.account_label
+            function_generate_statement: Callable = (
+                lambda _: (fused_query.statement, fused_query.params.copy())
+            )
+        else:
+            account_label = account_id
+            function_generate_statement = self.generate_athena_statement
+        try:
+            tuple_incremental = self.prepare_incremental_athena_query(
+                account_label,
+                function_generate_statement
+            )
+            if tuple_incremental is not None:
+                if len(tuple_incremental[2]) == 0:
+                    return None
+                function_generate_statement = tuple_incremental[3]
+            tuple_query = self.prepare_athena_query(
+                account_label,
+                function_generate_statement
+            )
+        except NotImplementedError:
+            return None
+        if tuple_query is None:
+            return None
+        query, params, readable_query = tuple_query
+        if athena_cache.has_cached_result(
+            athena_cache.get_cache_key(readable_query)
+        ):
+            return None
+        return AthenaEngine.start_query_execution(query, params)
+
+    def list_athena_statement(
+        self,
+        list_account_id: List[str]
+    ) -> List[str]:
+        """Generate the Athena statements of a list of accounts, fused
+        statements included"""
+        list_statement: List[str] = []
+        for account_id in list_account_id:
+            if account_id in self.fused_queries:
+                list_statement.append(self.fused_queries[account_id].statement)
+                continue
+            try:
+                tuple_statement_param = self.generate_athena_statement(
+                    account_id
+                )
+            except NotImplementedError:
+                return []
+            if tuple_statement_param is None:
+                continue
+            statement, _ = tuple_statement_param
+            if statement is not None:
+                list_statement.append(statement)
+        return list_statement
+
+    def get_scope_factor(self, account_id: str) -> int:
+        """Get the number of accounts scanned by the Athena query of a given
+        account, used to estimate the cost of a query without history"""
+        try:
+            tuple_statement_param = self.generate_athena_statement(account_id)
+        except NotImplementedError:
+            return 1
+        if tuple_statement_param is None:
+            return 1
+        statement, _ = tuple_statement_param
+        if statement is None:
+            return 1
+        set_account_id = StagingTable.get_filtered_accounts(statement)
+        if set_account_id is None:
+            return 1
+        return max(1, len(set_account_id))
+
+    def plan_fused_queries(
+        self,
+        list_account_id: List[str]
+    ) -> int:
+        """Group the accounts for which the Athena statements only differ by
+        the selected account, each group is then performed as a single Athena
+        query per batch of `athena_fuse_accounts_batch_size` accounts.
+        Returns the number of Athena queries saved"""
+        self.fused_queries = {}
+        dict_account_per_statement: Dict[
+            Tuple[str, Tuple[str, ...]], List[str]
+        ] = {}
+        for account_id in list_account_id:
+            if helper.get_athena_sql_limit(account_id) != 0:
+                helper.warn_skipped_by_sql_limit(
+                    "athena_fuse_accounts", account_id
+                )
+                continue
+            try:
+                tuple_statement_param = self.generate_athena_statement(
+                    account_id
+                )
+            except NotImplementedError:
+                return 0
+            if tuple_statement_param is None:
+                continue
+            statement, params = tuple_statement_param
+            if statement is None:
+                continue
+            normalized_statement = helper.athena_normalize_account_statement(
+                statement, params, account_id
+            )
+            if normalized_statement is None:
+                continue
+            dict_account_per_statement.setdefault(
+                (normalized_statement, tuple(params)), []
+            ).append(account_id)
+        nb_query_saved = 0
+        batch_size = max(1, Var.athena_fuse_accounts_batch_size)
+        for (normalized_statement, params), list_account in dict_account_per_statement.items():
+            for i in range(0, len(list_account), batch_size):
+                list_account_batch = list_account[i:i + batch_size]
+                if len(list_account_batch) < 2:
+                    continue
+                try:
+                    fused_query = FusedQuery(
+                        self.name,
+                        list_account_batch,
+                        normalized_statement,
+                        list(params)
+                    )
+                except ValueError:
+                    # The accounts of this statement are queried one by one
+                    logger.debug(
+                        "[~] Query `%s` cannot be fused for accounts: %s",
+                        self.name, ', '.join(list_account)
+                    )
+                    break
+                for account_id in list_account_batch:
+                    self.fused_queries[account_id] = fused_query
+                nb_query_saved += len(list_account_batch) - 1
+        return nb_query_saved
+
     @staticmethod
     def _exception_read_sql_query(
         query: str,
@@ -144,16 +607,28 @@ class Query:
         params: List[str],
         query_name: str,
         account_id: str,
-    ) -> pandas.DataFrame:
-        """Submit an Athena query"""
+        chunksize: Optional[int] = None,
+    ) -> Union[pandas.DataFrame, Iterator[pandas.DataFrame]]:
+        """Submit an Athena query. If <chunksize> is provided, returns an
+        iterator on chunks of <chunksize> rows"""
         try:
-            boto3_session_thread = boto3.session.Session(
+            boto3_session_thread = boto3_pool.get_session(
                 profile_name=Var.profile_athena_access,
                 region_name=Var.region
             )
             if Var.print_query:
                 logger.info("Athena query:\n%s", query)
             exception_raised = False
+            if Query.use_athena_engine():
+                query_execution = AthenaEngine.get_query_execution(
+                    query, params
+                )
+                return wr.athena.get_query_results(  # type: ignore
+                    query_execution_id=query_execution['QueryExecutionId'],
+                    boto3_session=boto3_session_thread,
+                    use_threads=True,
+                    chunksize=chunksize,
+                )
             read_sql_params = {
                 "sql": query,
                 "workgroup": Var.athena_workgroup,
@@ -165,8 +640,9 @@ class Query:
             if Var.use_parameterized_queries is True:
                 read_sql_params["params"] = params
                 read_sql_params["paramstyle"] = "qmark"
-                return wr.athena.read_sql_query(**read_sql_params)  # type: ignore
-            return wr.athena.read_sql_query(**read_sql_params)  # type: ignore
+            if chunksize is not None:
+                read_sql_params["chunksize"] = chunksize
+            return Query.read_sql_query_with_backoff(read_sql_params)
         except ClientError as error:
             logger.error("[!] Error from AWS client:\n%s", error.response)  # nosemgrep: logging-error-without-handling
             exception_raised = True
@@ -186,6 +662,41 @@ class Query:
                     query, params, query_name, account_id
                 )
 
+    @staticmethod
+    def read_sql_query_with_backoff(
+        read_sql_params: Dict
+    ) -> Union[pandas.DataFrame, Iterator[pandas.DataFrame]]:
+        """Submit an Athena query with AWS SDK for pandas, the submission is
+        retried with a jittered backoff while Athena throttles it"""
+        nb_attempt = 0
+        while True:
+            try:
+                return wr.athena.read_sql_query(**read_sql_params)  # type: ignore
+            except ClientError as error:
+                if not AthenaEngine.is_throttling_error(error)\
+                        or nb_attempt >= AthenaEngine.MAX_THROTTLING_RETRIES:
+                    raise
+                nb_attempt += 1
+                delay = AthenaEngine.get_backoff_delay(nb_attempt)
+                logger.debug(
+                    "[~] Athena throttling, retrying in %.1f seconds", delay
+                )
+                time.sleep(delay)
+
+    @staticmethod
+    def use_streaming() -> bool:
+        """Return True if Athena results are read and processed by chunks of
+        `athena_chunksize` rows"""
+        return Var.athena_chunksize > 0
+
+    @staticmethod
+    def use_athena_engine() -> bool:
+        """Return True if Athena queries are submitted through the
+        asynchronous Athena engine. The engine does not support the CTAS
+        approach of AWS SDK for pandas"""
+        return Var.athena_async_engine is True\
+            and Var.athena_ctas_approach is not True
+
     @staticmethod
     def generate_athena_query(
         function_generate_statement: Callable,
@@ -197,10 +708,19 @@ class Query:
         <function_generate_statement> returns None. Else returns the generated
         SQL query"""
         query = ""
-        stmt, params = function_generate_statement(account_id)
+        tuple_statement_param = function_generate_statement(account_id)
+        if tuple_statement_param is None:
+            return None
+        stmt, params = tuple_statement_param
         if stmt is None:
             return None
-        if helper.athena_cloudtrail_with_union():
+        staging_table_name = StagingTable.get_table_name(stmt)
+        if staging_table_name is not None:
+            query = stmt.replace(
+                "__ATHENA_TABLE_NAME_PLACEHOLDER__",
+                staging_table_name
+            )
+        elif helper.athena_cloudtrail_with_union():
             params.extend(params)
             stmt_mgmt_event = stmt.replace(
                 "__ATHENA_TABLE_NAME_PLACEHOLDER__",
@@ -241,6 +761,27 @@ UNION ALL
             )
         return re.sub(r'\?(?![i])', lambda x: get_param(), query)
 
+    @staticmethod
+    def map_vpce_attribute(
+        dataframe: pandas.DataFrame,
+        attribute: str
+    ) -> pandas.Series:
+        """Get an attribute of the VPC endpoint used by each call of a
+        DataFrame, NA if the call is not performed through a VPC endpoint"""
+        is_through_vpce = dataframe['vpcendpointid'].notna().to_numpy(
+            dtype=bool
+        ) & ~dataframe['sourceipaddress'].astype(str).str.contains(
+            "amazonaws", regex=False
+        ).to_numpy(dtype=bool)
+        result = pandas.Series(pandas.NA, index=dataframe.index, dtype=object)
+        result[is_through_vpce] = Referential.map_resource_attribute(
+            resource_type="AWS::EC2::VPCEndpoint",
+            lookup_values=dataframe.loc[is_through_vpce, 'vpcendpointid'],
+            lookup_column='vpcEndpointId',
+            attribute=attribute
+        ).to_numpy()
+        return result
+
     def add_column_vpc_id(
         self,
         dataframe: pandas.DataFrame
@@ -258,20 +799,9 @@ UNION ALL
                 self.name
             )
             return
-        dataframe['vpcId'] = [
-            Referential.get_resource_attribute(
-                resource_type="AWS::EC2::VPCEndpoint",
-                lookup_value=vpce_id,
-                lookup_column='vpcEndpointId',
-                attribute='vpcId'
-            )
-            if not pandas.isna(vpce_id) and "amazonaws" not in ip
-            else pandas.NA
-            for vpce_id, ip in zip(
-                dataframe['vpcendpointid'],
-                dataframe['sourceipaddress']
-            )
-        ]
+        dataframe['vpcId'] = self.map_vpce_attribute(
+            dataframe, 'vpcId'
+        ).to_numpy()
 
     def add_column_vpce_account_id(
         self,
@@ -290,27 +820,20 @@ UNION ALL
                 self.name
             )
             return
-        dataframe['vpceAccountId'] = [
-            Referential.get_resource_attribute(
-                resource_type="AWS::EC2::VPCEndpoint",
-                lookup_value=vpce_id,
-                lookup_column='vpcEndpointId',
-                attribute='ownerId'
-            )
-            if not pandas.isna(vpce_id) and "amazonaws" not in ip
-            else pandas.NA
-            for vpce_id, ip in zip(
-                dataframe['vpcendpointid'],
-                dataframe['sourceipaddress']
-            )
-        ]
+        dataframe['vpceAccountId'] = self.map_vpce_attribute(
+            dataframe, 'ownerId'
+        ).to_numpy()
 
-    def add_column_is_assumable_by(
+    def add_column_role_attributes(
         self,
-        dataframe: pandas.DataFrame
+        dataframe: pandas.DataFrame,
+        list_column: List[str]
     ) -> None:
-        """Add column isAssumableBy to provided DataFrame"""
-        logger.debug("[~] Enriching data with column: isAssumableBy")
+        """Add columns derived from the IAM role of the principal to provided
+        DataFrame. Supported columns are the keys of ROLE_ATTRIBUTE_COLUMN.
+        The role attributes are resolved once per run for each unique
+        principal and account, memoized, and broadcast to the rows"""
+        logger.debug("[~] Enriching data with columns: %s", list_column)
         list_account_id = helper.get_list_account_id()
         if list_account_id is None:
             return
@@ -320,142 +843,104 @@ UNION ALL
         ):
             logger.error(
                 "Unable to perform operation"
-                " `add_column_is_assumable_by`"
+                " `add_column_role_attributes`"
                 " for query: %s",
                 self.name
             )
             return
-        dataframe['isAssumableBy'] = [
-            "PRINCIPAL_NOT_IN_ORGANIZATION"
-            if pandas.isna(account_id) or account_id not in list_account_id
-            else (
-                Referential.get_resource_attribute(
-                    resource_type="AWS::IAM::Role",
-                    lookup_value=role_id.split(
-                        ":"
-                    )[0] if ":" in role_id else role_id,
-                    lookup_column='roleId',
-                    attribute='allowedPrincipalList'
-                )
-                if not pandas.isna(role_id) else pandas.NA
-            )
-            for account_id, role_id in zip(
-                dataframe['principal_accountid'], dataframe['principalid']
-            )
+        # Each unique (account, principal) pair is resolved once per run, the
+        # resolved attributes are shared across queries through a memo
+        code, unique_pair = pandas.MultiIndex.from_arrays([
+            dataframe['principal_accountid'].astype(object),
+            dataframe['principalid'].astype(object)
+        ]).factorize()
+        list_key = [
+            principal_memo.get_key(account_id, principal_id)
+            for account_id, principal_id in unique_pair
+        ]
+        list_item = principal_memo.lookup(list_key, list_column)
+        list_miss_key = [
+            key for key, item in zip(list_key, list_item) if item is None
         ]
+        dict_miss_value = self.resolve_role_attributes(
+            list_miss_key, list_column, list_account_id
+        )
+        dict_miss_position = {
+            key: position for position, key in enumerate(list_miss_key)
+        }
+        principal_memo.store(list_miss_key, dict_miss_value)
+        for column in list_column:
+            unique_value = numpy.array([
+                item[column] if item is not None
+                else dict_miss_value[column][dict_miss_position[key]]
+                for key, item in zip(list_key, list_item)
+            ] + [pandas.NA], dtype=object)
+            dataframe[column] = take(
+                unique_value,
+                code,
+                allow_fill=True,
+                fill_value=pandas.NA
+            )
+
+    @classmethod
+    def resolve_role_attributes(
+        cls,
+        list_key: List[Tuple[Optional[str], Optional[str]]],
+        list_column: List[str],
+        list_account_id: List[str]
+    ) -> Dict[str, List[object]]:
+        """Resolve the columns derived from the IAM role of a list of
+        (principal account ID, principal ID) pairs"""
+        if len(list_key) == 0:
+            return {column: [] for column in list_column}
+        is_in_organization = pandas.Series(
+            [account_id for account_id, _ in list_key], dtype=object
+        ).isin(set(list_account_id)).to_numpy(dtype=bool)
+        principal_id = pandas.Series(
+            [principal_id for _, principal_id in list_key], dtype=object
+        )
+        has_principal = principal_id.notna().to_numpy(dtype=bool)
+        role_id = principal_id[has_principal].str.split(":", n=1).str[0]
+        dict_column_value: Dict[str, List[object]] = {}
+        for column in list_column:
+            value = numpy.full(len(list_key), pandas.NA, dtype=object)
+            value[has_principal] = Referential.map_resource_attribute(
+                resource_type="AWS::IAM::Role",
+                lookup_values=role_id,
+                lookup_column='roleId',
+                attribute=cls.ROLE_ATTRIBUTE_COLUMN[column]
+            ).to_numpy()
+            value[~is_in_organization] = "PRINCIPAL_NOT_IN_ORGANIZATION"
+            dict_column_value[column] = value.tolist()
+        return dict_column_value
+
+    def add_column_is_assumable_by(
+        self,
+        dataframe: pandas.DataFrame
+    ) -> None:
+        """Add column isAssumableBy to provided DataFrame"""
+        self.add_column_role_attributes(dataframe, ['isAssumableBy'])
 
     def add_column_is_service_role(
         self,
         dataframe: pandas.DataFrame
     ) -> None:
         """Add column isServiceRole to provided DataFrame"""
-        logger.debug("[~] Enriching data with column: isServiceRole")
-        list_account_id = helper.get_list_account_id()
-        if list_account_id is None:
-            return
-        if not utils.df_columns_exist(
-            dataframe,
-            {'principal_accountid', 'principalid'}
-        ):
-            logger.error(
-                "Unable to perform operation"
-                " `add_column_is_service_role`"
-                " for query: %s",
-                self.name
-            )
-            return
-        dataframe['isServiceRole'] = [
-            "PRINCIPAL_NOT_IN_ORGANIZATION"
-            if pandas.isna(account_id) or account_id not in list_account_id
-            else (
-                Referential.get_resource_attribute(
-                    resource_type="AWS::IAM::Role",
-                    lookup_value=role_id.split(":")[0] if ":" in role_id else role_id,
-                    lookup_column='roleId',
-                    attribute='isServiceRole'
-                )
-                if not pandas.isna(role_id) else pandas.NA
-            )
-            for account_id, role_id in zip(
-                dataframe['principal_accountid'], dataframe['principalid']
-            )
-        ]
+        self.add_column_role_attributes(dataframe, ['isServiceRole'])
 
     def add_column_is_service_linked_role(
         self,
         dataframe: pandas.DataFrame
     ) -> None:
         """Add column isServiceLinkedRole to provided DataFrame"""
-        logger.debug("[~] Enriching data with column: isServiceLinkedRole")
-        list_account_id = helper.get_list_account_id()
-        if list_account_id is None:
-            return
-        if not utils.df_columns_exist(
-            dataframe,
-            {'principal_accountid', 'principalid'}
-        ):
-            logger.error(
-                "Unable to perform operation"
-                " `add_column_is_service_linked_role`"
-                " for query: %s",
-                self.name
-            )
-            return
-        dataframe['isServiceLinkedRole'] = [
-            "PRINCIPAL_NOT_IN_ORGANIZATION"
-            if pandas.isna(account_id) or account_id not in list_account_id
-            else (
-                Referential.get_resource_attribute(
-                    resource_type="AWS::IAM::Role",
-                    lookup_value=role_id.split(":")[0] if ":" in role_id else role_id,
-                    lookup_column='roleId',
-                    attribute='isServiceLinkedRole'
-                )
-                if not pandas.isna(role_id) else pandas.NA
-            )
-            for account_id, role_id in zip(
-                dataframe['principal_accountid'], dataframe['principalid']
-            )
-        ]
+        self.add_column_role_attributes(dataframe, ['isServiceLinkedRole'])
 
     def add_column_is_network_perimeter_human_role(
         self,
         dataframe: pandas.DataFrame
     ) -> None:
         """Add column isNetworkPerimeterHumanRole to provided DataFrame"""
-        logger.debug(
-            "[~] Enriching data with column: isNetworkPerimeterHumanRole"
-        )
-        list_account_id = helper.get_list_account_id()
-        if list_account_id is None:
-            return
-        if not utils.df_columns_exist(
-            dataframe,
-            {'principal_accountid', 'principalid'}
-        ):
-            logger.error(
-                "Unable to perform operation"
-                " `add_column_is_network_perimeter_human_role`"
-                " for query: %s",
-                self.name
-            )
-            return
-        dataframe['isNetworkPerimeterHumanRole'] = [
-            "PRINCIPAL_NOT_IN_ORGANIZATION"
-            if pandas.isna(account_id) or account_id not in list_account_id
-            else (
-                Referential.get_resource_attribute(
-                    resource_type="AWS::IAM::Role",
-                    lookup_value=role_id.split(":")[0] if ":" in role_id else role_id,
-                    lookup_column='roleId',
-                    attribute='isNetworkPerimeterHumanRole'
-                )
-                if not pandas.isna(role_id) else pandas.NA
-            )
-            for account_id, role_id in zip(
-                dataframe['principal_accountid'], dataframe['principalid']
-            )
-        ]
+        self.add_column_role_attributes(dataframe, ['isNetworkPerimeterHumanRole'])
 
     @staticmethod
     def is_service_role_used_by_service_not_in_trust_policy(
@@ -504,51 +989,33 @@ UNION ALL
                 self.name
             )
             return dataframe
-        # 1. Drop API calls by service role from an AWS service not in the
-        # service role's trust policy
-        # 1.1 Creates a column name with a list of all AWS services contained
-        # in the trust policy
-        dataframe['isAssumableByAWServiceName'] = [
-            [
-                item.get('principal', '')
-                for item in is_assumable_by
-                if item.get('type', '') == 'Service'
-            ]
-            if isinstance(is_assumable_by, list)
-            else pandas.NA
-            for is_assumable_by in dataframe['isAssumableBy']
-        ]
-        # 1.2 Create column viaAWSServiceRole_ServiceRole that is set to
-        # True if call is made by a service role and coming from
-        # an AWS service not in the service role's trust policy
-        dataframe['viaAWSServiceRole_ServiceRole'] = [
-            Query.is_service_role_used_by_service_not_in_trust_policy(
-                list_service_trust_policy,
-                sourceipaddress
-            )
-            for list_service_trust_policy, sourceipaddress in zip(
-                dataframe['isAssumableByAWServiceName'],
-                dataframe['sourceipaddress']
-            )
-        ]
-        # 1.3 Drop the identified calls
-        dataframe = dataframe.drop(
-            dataframe[
-                dataframe['viaAWSServiceRole_ServiceRole'].isin([True, 'True'])
-            ].index
+        sourceipaddress = dataframe['sourceipaddress'].astype(object)
+        # 1. Identify API calls by service role from an AWS service not in
+        # the service role's trust policy. Only the rows with the principals
+        # of the trust policy as a list are checked
+        list_is_assumable_by = dataframe['isAssumableBy'].to_numpy(
+            dtype=object
         )
-        # 1.4 Drop the columns used only for processing
-        dataframe = dataframe.drop(
-            columns=[
-                'isAssumableByAWServiceName',
-                'viaAWSServiceRole_ServiceRole'
-            ]
+        is_via_service_not_in_trust_policy = numpy.zeros(
+            len(dataframe.index), dtype=bool
         )
+        for position, is_assumable_by in enumerate(list_is_assumable_by):
+            if not isinstance(is_assumable_by, list):
+                continue
+            is_via_service_not_in_trust_policy[position] = \
+                self.is_service_role_used_by_service_not_in_trust_policy(
+                    [
+                        item.get('principal', '')
+                        for item in is_assumable_by
+                        if item.get('type', '') == 'Service'
+                    ],
+                    sourceipaddress.iat[position]
+                )
         logger.debug(
             "[~] Removing calls by principals that are not service roles"
             " from AWS service networks"
         )
-        # 2. Drop API calls made by human roles from AWS service networks.
+        # 2. Identify API calls made by human roles from AWS service networks.
         # 2.1 Add the column isNetworkPerimeterHumanRole if it does not exist.
         drop_is_network_perimeter_human_role = False
         if not utils.df_columns_exist(
@@ -556,13 +1023,16 @@ UNION ALL
         ):
             self.add_column_is_network_perimeter_human_role(dataframe)
             drop_is_network_perimeter_human_role = True
-        # 2.2 Drop calls made by human roles from AWS service networks.
-        dataframe = dataframe.drop(
-            dataframe[
-                dataframe['isNetworkPerimeterHumanRole'].isin([True, 'True'])
-                & dataframe['sourceipaddress'].str.contains("amazonaws")
-            ].index
-        )
+        is_human_role_from_service_network = dataframe[
+            'isNetworkPerimeterHumanRole'
+        ].isin([True, 'True']).to_numpy(dtype=bool) & sourceipaddress.str.contains(
+            "amazonaws", regex=False, na=False
+        ).to_numpy(dtype=bool)
+        # 3. Drop the identified calls in a single selection
+        dataframe = dataframe[
+            ~(is_via_service_not_in_trust_policy
+              | is_human_role_from_service_network)
+        ]
         if drop_is_network_perimeter_human_role is True:
             dataframe = dataframe.drop(columns=['isNetworkPerimeterHumanRole'])
         return dataframe
@@ -633,50 +1103,17 @@ UNION ALL
     ) -> pandas.DataFrame:
         """Remove exceptions types for a given resource type and
         exception type"""
-        for exception_type, exception in exceptions.items():
-            logger.debug(
-                "exception_type:%s, exception:%s, list_exception:%s",
-                exception_type, exception, list_exception_type_to_consider
-            )
-            if exception_type not in list_exception_type_to_consider:
-                continue
-            if exception_type in (
-                'network_perimeter_trusted_principal',
-                'identity_perimeter_trusted_principal'
-            ):
-                dataframe = dataframe.drop(
-                    dataframe[
-                        (dataframe[lookup_column] == resource_id_value)
-                        & (dataframe['principal_arn'].str.contains(
-                            '|'.join(exception)
-                        ))
-                    ].index
-                )
-            elif exception_type == "network_perimeter_expected_vpc_endpoint":
-                dataframe = dataframe.drop(
-                    dataframe[
-                        (dataframe[lookup_column] == resource_id_value)
-                        & (dataframe['vpcendpointid'].str.contains(
-                            '|'.join(exception)
-                        ))
-                    ].index
-                )
-            elif exception_type == "network_perimeter_expected_vpc":
-                dataframe = dataframe.drop(
-                    dataframe[
-                        (dataframe[lookup_column] == resource_id_value)
-                        & (dataframe['vpcId'].str.contains('|'.join(exception)))
-                    ].index
+        keep = resource_exception.get_keep_mask(
+            dataframe,
+            lookup_column,
+            {
+                resource_id_value: resource_exception.compile_resource_exception(
+                    exceptions,
+                    list_exception_type_to_consider
                 )
-            elif exception_type == "network_perimeter_expected_public_cidr":
-                for cidr in exception:
-                    dataframe = dataframe.drop(
-                        dataframe[
-                            (dataframe[lookup_column] == resource_id_value)
-                            & (dataframe['sourceipaddress'].map(lambda ip: helper.is_ip_in_cidr(ip, cidr)))  # type: ignore
-                        ].index
-                    )
-        return dataframe
+            }
+        )
+        return dataframe[keep]
 
     @staticmethod
     def remove_all_resource_exception(
@@ -687,18 +1124,17 @@ UNION ALL
         list_exception_type_to_consider: list
     ) -> pandas.DataFrame:
         """Get exceptions for a given account/resource type;
-        then remove exceptions for each resource"""
-        conf = Var.get_account_resource_exception(
+        then remove exceptions for each resource in a single pass"""
+        compiled = resource_exception.get_compiled_exceptions(
             account_id=account_id,
-            resource_type=resource_type
+            resource_type=resource_type,
+            list_exception_type_to_consider=list_exception_type_to_consider
         )
-        logger.debug("Exceptions: %s", conf)
-        for resource_name, exceptions in conf.items():
-            dataframe = Query.remove_resource_exception(
-                dataframe,
-                resource_id_column_name,
-                resource_name,
-                exceptions,
-                list_exception_type_to_consider
-            )
-        return dataframe
+        if len(compiled) == 0:
+            return dataframe
+        keep = resource_exception.get_keep_mask(
+            dataframe,
+            resource_id_column_name,
+            compiled
+        )
+        return dataframe[keep]
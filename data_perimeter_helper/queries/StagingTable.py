@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+'''
+This module hosts the class StagingTable used to scan the CloudTrail tables
+once per run into a narrow Parquet table shared by all queries
+'''
+import logging
+import re
+import uuid
+from typing import (
+    List,
+    Optional,
+    Set
+)
+
+import awswrangler as wr
+
+from data_perimeter_helper.queries import (
+    helper
+)
+from data_perimeter_helper.toolbox import (
+    boto3_pool
+)
+from data_perimeter_helper.variables import (
+    Variables as Var
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class StagingTable:
+    '''Materializes with a CTAS query the CloudTrail columns referenced by the
+    selected queries, for the selected accounts and date window. Statements
+    only filtering on the staged accounts are then performed against the
+    staging table instead of the CloudTrail tables. The staging table is
+    dropped at the end of the run.
+    Top-level columns are copied whole: queries reference the nested fields
+    of `useridentity` and `resources` and the JSON values of
+    `requestparameters` with the CloudTrail table layout, which a projection
+    of these fields would not preserve'''
+    # Top-level columns of the CloudTrail table schema
+    CLOUDTRAIL_COLUMNS = [
+        "eventversion", "useridentity", "eventtime", "eventsource",
+        "eventname", "awsregion", "sourceipaddress", "useragent", "errorcode",
+        "errormessage", "requestparameters", "responseelements",
+        "additionaleventdata", "requestid", "eventid", "resources",
+        "eventtype", "apiversion", "readonly", "recipientaccountid",
+        "serviceeventdetails", "sharedeventid", "vpcendpointid",
+        "tlsdetails", "eventcategory"
+    ]
+    # CTAS queries cannot write more than 100 partitions
+    MAX_PARTITIONS = 100
+    regex_account_filter = re.compile(
+        r"p_account\s*(?:=\s*'(\d{12})'|IN\s*\(([^)]*)\))",
+        re.IGNORECASE
+    )
+    regex_account_id = re.compile(r"\d{12}")
+    table_name: Optional[str] = None
+    set_account_id: Set[str] = set()
+    set_column: Set[str] = set()
+
+    @classmethod
+    def get_referenced_columns(cls, statement: str) -> Set[str]:
+        """Get the CloudTrail columns referenced by a statement"""
+        return {
+            column for column in cls.CLOUDTRAIL_COLUMNS
+            if re.search(rf"\b{column}\b", statement, re.IGNORECASE)
+        }
+
+    @classmethod
+    def get_filtered_accounts(cls, statement: str) -> Optional[Set[str]]:
+        """Get the accounts selected by the account partition filters of a
+        statement. Returns None if the statement does not filter on the
+        account partition"""
+        list_match = cls.regex_account_filter.findall(statement)
+        if len(list_match) == 0:
+            return None
+        set_account_id: Set[str] = set()
+        for account_id, list_account_id in list_match:
+            if account_id:
+                set_account_id.add(account_id)
+            else:
+                set_account_id.update(
+                    cls.regex_account_id.findall(list_account_id)
+                )
+        return set_account_id
+
+    @classmethod
+    def is_filtering_on_accounts(
+        cls,
+        statement: str,
+        set_account_id: Set[str]
+    ) -> bool:
+        """Return True if a statement only selects accounts from a given set
+        of accounts"""
+        set_filtered_account_id = cls.get_filtered_accounts(statement)
+        if set_filtered_account_id is None:
+            return False
+        return set_filtered_account_id <= set_account_id
+
+    @classmethod
+    def get_table_name(cls, statement: str) -> Optional[str]:
+        """Get the name of the staging table if a statement can be performed
+        against it, else returns None"""
+        if cls.table_name is None:
+            return None
+        if not cls.is_filtering_on_accounts(statement, cls.set_account_id):
+            return None
+        if not cls.get_referenced_columns(statement) <= cls.set_column:
+            return None
+        return cls.table_name
+
+    @classmethod
+    def generate_statement(
+        cls,
+        table_name: str,
+        list_column: List[str],
+        list_account_id: List[str]
+    ) -> str:
+        """Generate the statement selecting the staged columns from a
+        CloudTrail table"""
+        columns = ',\n    '.join(list_column)
+        p_account = ','.join(
+            f"'{account_id}'" for account_id in list_account_id
+        )
+        return f'''SELECT
+    {columns},
+    p_date,
+    p_account
+FROM "{table_name}"
+WHERE
+    p_account IN ({p_account})
+    AND p_date {helper.get_athena_date_partition()}
+'''
+
+    @classmethod
+    def create(
+        cls,
+        list_statement: List[str],
+        list_account_id: List[str]
+    ) -> bool:
+        """Create the staging table with the columns referenced by a list of
+        statements. Only statements filtering on the given accounts are
+        considered, the staging table is not created for less than two of
+        them. Returns True if the staging table has been created"""
+        set_account_id = set(list_account_id)
+        list_statement = [
+            statement for statement in list_statement
+            if cls.is_filtering_on_accounts(statement, set_account_id)
+        ]
+        if len(list_statement) < 2:
+            return False
+        set_column: Set[str] = set()
+        for statement in list_statement:
+            set_column.update(cls.get_referenced_columns(statement))
+        list_column = [
+            column for column in cls.CLOUDTRAIL_COLUMNS
+            if column in set_column
+        ]
+        if len(list_column) == 0:
+            return False
+        if helper.athena_cloudtrail_with_union():
+            sql = cls.generate_statement(
+                Var.athena_table_name_mgmt_event, list_column, list_account_id
+            ) + "UNION ALL\n" + cls.generate_statement(
+                Var.athena_table_name_data_event, list_column, list_account_id
+            )
+        else:
+            sql = cls.generate_statement(
+                Var.athena_table_name_mgmt_data_event,
+                list_column,
+                list_account_id
+            )
+        table_name = f"dph_staging_{uuid.uuid4().hex}"
+        partitioning_info = ["p_account"]\
+            if len(list_account_id) <= cls.MAX_PARTITIONS else None
+        boto3_session = boto3_pool.get_session(
+            profile_name=Var.profile_athena_access,
+            region_name=Var.region
+        )
+        logger.debug("[-] Creating Athena staging table %s", table_name)
+        wr.athena.create_ctas_table(
+            sql=sql,
+            database=Var.athena_database,
+            ctas_table=table_name,
+            storage_format="PARQUET",
+            write_compression="SNAPPY",
+            partitioning_info=partitioning_info,
+            workgroup=Var.athena_workgroup,
+            wait=True,
+            boto3_session=boto3_session,
+        )
+        logger.debug("[+] Creating Athena staging table %s", table_name)
+        cls.table_name = table_name
+        cls.set_account_id = set_account_id
+        cls.set_column = set_column
+        return True
+
+    @classmethod
+    def drop(cls) -> None:
+        """Drop the staging table and delete its data"""
+        if cls.table_name is None:
+            return
+        table_name = cls.table_name
+        cls.table_name = None
+        boto3_session = boto3_pool.get_session(
+            profile_name=Var.profile_athena_access,
+            region_name=Var.region
+        )
+        logger.debug("[-] Dropping Athena staging table %s", table_name)
+        location = wr.catalog.get_table_location(
+            database=Var.athena_database,
+            table=table_name,
+            boto3_session=boto3_session
+        )
+        wr.catalog.delete_table_if_exists(
+            database=Var.athena_database,
+            table=table_name,
+            boto3_session=boto3_session
+        )
+        wr.s3.delete_objects(
+            path=location,
+            boto3_session=boto3_session
+        )
+        logger.debug("[+] Dropping Athena staging table %s", table_name)
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+'''
+This module hosts functions to cache Athena query results on the local
+filesystem. Results are stored as Parquet files named after a hash of the
+readable query and of the Athena configuration, the least recently used
+files are deleted when the cache exceeds its maximum size
+'''
+import logging
+import os
+import json
+import hashlib
+import uuid
+from pathlib import (
+    Path
+)
+from threading import (
+    Lock
+)
+from typing import (
+    Dict,
+    List,
+    Optional
+)
+
+import pandas
+import pyarrow
+from pyarrow import (
+    parquet
+)
+from tqdm import (
+    tqdm
+)
+
+from data_perimeter_helper.queries import (
+    incremental
+)
+from data_perimeter_helper.queries.StagingTable import (
+    StagingTable
+)
+from data_perimeter_helper.toolbox import (
+    utils,
+    exporter
+)
+from data_perimeter_helper.variables import (
+    Variables as Var
+)
+
+
+logger = logging.getLogger(__name__)
+lock_eviction = Lock()
+
+
+def get_cache_folder_path() -> str:
+    """Get the folder where Athena query results are cached"""
+    return f"{Var.cache_folder_path}/athena_results/"
+
+
+def is_date_window_closed() -> bool:
+    """Return True if the analyzed date window is in the past and CloudTrail
+    has delivered its events, i.e. the window ended more than
+    `incremental.delivery_lag` ago. Results of queries on an open window
+    (`partition_date_interval`, a recent window or `partition_date_regex`)
+    change over time and are not cached"""
+    if Var.partition_date_regex is not None:
+        return False
+    if Var.partition_date_start is None or Var.partition_date_end is None:
+        return False
+    return str(Var.partition_date_end) < incremental.get_first_open_day()
+
+
+def get_cache_key(
+    readable_query: str
+) -> Optional[str]:
+    """Get the cache key of an Athena query. Returns None if the result cache
+    is disabled or if the results of the query cannot be cached"""
+    if Var.cache_athena_results is not True:
+        return None
+    if not is_date_window_closed():
+        return None
+    if StagingTable.table_name is not None:
+        # The staging table holds the same events as the CloudTrail tables
+        readable_query = readable_query.replace(
+            StagingTable.table_name, "__ATHENA_STAGING_TABLE__"
+        )
+    content = json.dumps(
+        {
+            'query': readable_query,
+            'workgroup': Var.athena_workgroup,
+            'database': Var.athena_database,
+            'tables': [
+                Var.athena_table_name_mgmt_data_event,
+                Var.athena_table_name_mgmt_event,
+                Var.athena_table_name_data_event
+            ],
+            'partition': [
+                Var.partition_date_start,
+                Var.partition_date_end
+            ],
+            'ctas_approach': Var.athena_ctas_approach
+        },
+        sort_keys=True
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def get_cache_path(cache_key: str) -> str:
+    """Get the path of the file caching the results of a given key"""
+    return f"{get_cache_folder_path()}{cache_key}.parquet"
+
+
+def has_cached_result(cache_key: Optional[str]) -> bool:
+    """Return True if results are cached for a given key"""
+    if cache_key is None:
+        return False
+    return os.path.isfile(get_cache_path(cache_key))
+
+
+def read_cached_result(
+    cache_key: Optional[str]
+) -> Optional[pandas.DataFrame]:
+    """Read cached results for a given key. Returns None on cache miss"""
+    if not has_cached_result(cache_key):
+        return None
+    assert isinstance(cache_key, str)  # nosec: B101
+    path = get_cache_path(cache_key)
+    try:
+        result = pandas.read_parquet(path)
+        # Update the modification time used for LRU eviction
+        os.utime(path)
+    except (OSError, ValueError) as error:
+        logger.debug("[!] Unable to read cached results %s: %s", path, error)
+        return None
+    return result
+
+
+def write_cached_result(
+    cache_key: Optional[str],
+    dataframe: pandas.DataFrame
+) -> None:
+    """Cache results for a given key, then evict the least recently used
+    results if the cache exceeds its maximum size"""
+    if cache_key is None:
+        return
+    try:
+        exporter.write_dataframe_to_parquet(
+            dataframe=dataframe,
+            export_folder=get_cache_folder_path(),
+            file_name=cache_key,
+            file_extension="parquet"
+        )
+    except (OSError, ValueError, TypeError) as error:
+        logger.debug("[!] Unable to cache results %s: %s", cache_key, error)
+        return
+    evict_least_recently_used()
+
+
+def write_cached_chunk(
+    stream: Dict,
+    chunk: pandas.DataFrame
+) -> None:
+    """Append a chunk of results streamed from Athena to the cache key of
+    the stream, if any. Chunks are written to a temporary file renamed by
+    `close_cached_chunks` once all chunks have been read. The results are
+    not cached if a chunk cannot be written"""
+    if stream.get('cache_key') is None:
+        return
+    try:
+        table = pyarrow.Table.from_pandas(chunk, preserve_index=False)
+        if stream.get('cache_writer') is None:
+            utils.create_folder(get_cache_folder_path())
+            stream['cache_path'] = f"{get_cache_folder_path()}"\
+                f"{stream['cache_key']}_{uuid.uuid4().hex}.tmp"
+            stream['cache_writer'] = parquet.ParquetWriter(
+                stream['cache_path'], table.schema, compression='gzip'
+            )
+        writer = stream['cache_writer']
+        writer.write_table(table.cast(writer.schema))
+    except (OSError, ValueError, TypeError, pyarrow.ArrowException) as error:
+        logger.debug(
+            "[!] Unable to cache results %s: %s", stream['cache_key'], error
+        )
+        close_cached_chunks(stream, is_complete=False)
+
+
+def close_cached_chunks(
+    stream: Dict,
+    is_complete: bool
+) -> None:
+    """Close the cache file of a stream. If all chunks have been written, the
+    file is renamed after the cache key, else it is deleted"""
+    writer = stream.pop('cache_writer', None)
+    cache_key = stream.pop('cache_key', None)
+    if writer is None or cache_key is None:
+        return
+    path = stream.pop('cache_path')
+    try:
+        writer.close()
+        if is_complete:
+            os.replace(path, get_cache_path(cache_key))
+    except OSError as error:
+        logger.debug("[!] Unable to cache results %s: %s", cache_key, error)
+        is_complete = False
+    if not is_complete:
+        Path(path).unlink(missing_ok=True)
+        return
+    evict_least_recently_used()
+
+
+def evict_least_recently_used() -> None:
+    """Delete the least recently used results until the size of the cache is
+    below `cache_athena_results_max_size_in_mb`"""
+    max_size = Var.cache_athena_results_max_size_in_mb * 1024 * 1024
+    with lock_eviction:
+        list_file: List[os.stat_result] = []
+        list_path: List[Path] = []
+        for path in Path(get_cache_folder_path()).glob("*.parquet"):
+            try:
+                list_file.append(path.stat())
+                list_path.append(path)
+            except FileNotFoundError:
+                continue
+        cache_size = sum(stat.st_size for stat in list_file)
+        if cache_size <= max_size:
+            return
+        for stat, path in sorted(
+            zip(list_file, list_path), key=lambda item: item[0].st_mtime
+        ):
+            if cache_size <= max_size:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            cache_size -= stat.st_size
+            logger.debug("[~] Evicted cached Athena results: %s", path)
+
+
+def report_cache_hit(query_name: str, account_id: str) -> None:
+    """Report in the run output that Athena results came from the cache"""
+    log_msg = f"Athena results of query `{query_name}` for account "\
+        f"{account_id} retrieved from cache"
+    logger.debug(log_msg)
+    tqdm.write(utils.Icons.INFO + log_msg)
@@ -132,9 +132,7 @@ GROUP BY
                 "query": athena_query,
                 "dataframe": result
             }
-        self.add_column_is_assumable_by(result)
-        self.add_column_is_service_role(result)
-        self.add_column_is_service_linked_role(result)
+        self.add_column_role_attributes(result, ['isAssumableBy', 'isServiceRole', 'isServiceLinkedRole'])
         result = self.remove_calls_by_service_linked_role(result)
         logger.debug("[~] Writing parameters [controlType && findings]")
         result['controlType'] = "network_perimeter"
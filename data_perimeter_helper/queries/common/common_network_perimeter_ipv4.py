@@ -151,8 +151,7 @@ GROUP BY
             }
         self.add_column_vpc_id(result)
         self.add_column_vpce_account_id(result)
-        self.add_column_is_assumable_by(result)
-        self.add_column_is_service_role(result)
+        self.add_column_role_attributes(result, ['isAssumableBy', 'isServiceRole'])
         result = self.remove_expected_vpc_id(
             account_id,
             result
@@ -164,18 +163,9 @@ GROUP BY
         if len(result.index):
             logger.debug("[~] Writing parameters [controlType && findings]")
             result['controlType'] = "network_perimeter"
-            result['findings'] = [
-                helper.basic_explain_network_perimeter_findings(
-                    is_service_role, ip, vpce_id, vpc_id
-                )
-                for is_service_role, ip, vpce_id, vpc_id
-                in zip(
-                    result['isServiceRole'],
-                    result['sourceipaddress'],
-                    result['vpcendpointid'],
-                    result['vpcId']
-                )
-            ]
+            result['findings'] = helper.explain_network_perimeter_findings(
+                result
+            ).to_numpy()
         if Var.print_result:
             logger.info(result)
         return {
@@ -94,9 +94,7 @@ GROUP BY
                 "query": athena_query,
                 "dataframe": result
             }
-        self.add_column_is_assumable_by(result)
-        self.add_column_is_service_role(result)
-        self.add_column_is_service_linked_role(result)
+        self.add_column_role_attributes(result, ['isAssumableBy', 'isServiceRole', 'isServiceLinkedRole'])
         logger.debug("[~] Writing parameters [controlType && findings]")
         result['controlType'] = "All"
         result['findings'] = "Principal performed API calls with an access denied error message"
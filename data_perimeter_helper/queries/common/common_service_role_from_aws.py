@@ -97,8 +97,7 @@ GROUP BY
                 "query": athena_query,
                 "dataframe": result
             }
-        self.add_column_is_assumable_by(result)
-        self.add_column_is_service_role(result)
+        self.add_column_role_attributes(result, ['isAssumableBy', 'isServiceRole'])
         logger.debug("[-] principals that are not service roles are removed")
         result = result.drop(
             result[
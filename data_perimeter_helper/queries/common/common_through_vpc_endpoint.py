@@ -118,8 +118,7 @@ GROUP BY
             }
         self.add_column_vpc_id(result)
         self.add_column_vpce_account_id(result)
-        self.add_column_is_assumable_by(result)
-        self.add_column_is_service_role(result)
+        self.add_column_role_attributes(result, ['isAssumableBy', 'isServiceRole'])
         logger.debug("[~] Writing parameters [controlType && findings]")
         result['controlType'] = "network_perimeter"
         result['findings'] = "Principal is performing AWS API calls through an unexpected VPC endpoint or an AWS-owned VPC endpoint"
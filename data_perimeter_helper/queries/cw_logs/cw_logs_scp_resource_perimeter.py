@@ -133,8 +133,7 @@ GROUP BY
                 "query": athena_query,
                 "dataframe": result
             }
-        self.add_column_is_assumable_by(result)
-        self.add_column_is_service_role(result)
+        self.add_column_role_attributes(result, ['isAssumableBy', 'isServiceRole'])
         result = self.remove_calls_by_service_linked_role(result)
         if len(result.index):
             logger.debug("[~] Writing parameters [controlType && findings]")
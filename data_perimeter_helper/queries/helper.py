@@ -6,13 +6,16 @@
 This module hosts helper functions for Athena queries
 """
 import logging
+import re
 from ipaddress import (
     ip_address,
     ip_network
 )
 from typing import (
+    Dict,
     Optional,
     List,
+    Set,
     Union,
 )
 
@@ -21,6 +24,9 @@ import pandas
 from data_perimeter_helper.variables import (
     Variables as Var
 )
+from data_perimeter_helper.queries.CidrMatcher import (
+    CidrMatcher
+)
 from data_perimeter_helper.toolbox import (
     utils
 )
@@ -33,6 +39,12 @@ from data_perimeter_helper.referential.organization_tree import (
 
 
 logger = logging.getLogger(__name__)
+regex_athena_select = re.compile(r"^SELECT\n", re.MULTILINE)
+regex_athena_after_group_by = re.compile(
+    r"^\s*(HAVING|ORDER BY|LIMIT)\b", re.MULTILINE | re.IGNORECASE
+)
+# Features already reported as skipped because of `athena_sql_limit`
+set_feature_skipped_by_sql_limit: Set[str] = set()
 
 
 def is_ip_public(ip: str) -> Union[bool, None]:
@@ -80,6 +92,60 @@ def basic_explain_network_perimeter_findings(
     return ""
 
 
+def is_truthy(value: object) -> bool:
+    """Return the truth value of a value, False if it has none (pandas.NA)"""
+    try:
+        return bool(value)
+    except TypeError:
+        return False
+
+
+def explain_network_perimeter_findings(
+    dataframe: pandas.DataFrame
+) -> pandas.Series:
+    """Provide a basic explanation for each network perimeter finding of a
+    DataFrame, vectorized version of basic_explain_network_perimeter_findings
+    over the columns isServiceRole, sourceipaddress, vpcendpointid, vpcId"""
+    ip = dataframe['sourceipaddress'].astype(object)
+    vpcendpoint = dataframe['vpcendpointid'].astype(object)
+    vpc_id = dataframe['vpcId'].astype(object)
+    is_aws_network = ip.str.contains(
+        "amazonaws.com", regex=False, na=False
+    ).to_numpy(dtype=bool)
+    codes, unique_is_service_role = pandas.factorize(
+        dataframe['isServiceRole']
+    )
+    is_service_role = pandas.Series(
+        [is_truthy(value) for value in unique_is_service_role] + [False],
+        dtype=bool
+    ).to_numpy()[codes]
+    is_public = ~is_aws_network & CidrMatcher.is_public(ip)
+    # str.len is NA for values that are not strings
+    has_vpc_id = ~is_aws_network & ~is_public\
+        & vpc_id.str.len().notna().to_numpy(dtype=bool)
+    is_vpc = vpc_id.str.contains("vpc", regex=False, na=False).to_numpy(
+        dtype=bool
+    )
+    result = pandas.Series("", index=dataframe.index, dtype=object)
+    result[has_vpc_id & ~is_vpc] = "Principal made calls through a VPC endpoint that is not inventoried in Config aggregator"
+    is_unexpected_vpc = has_vpc_id & is_vpc
+    result[is_unexpected_vpc] = (
+        "Principal made calls through the VPC endpoint ("
+        + vpcendpoint[is_unexpected_vpc].map(str)
+        + ") attached to a VPC ("
+        + vpc_id[is_unexpected_vpc].map(str)
+        + ") that is unexpected"
+    ).to_numpy()
+    result[is_public] = (
+        "Principal is performing API calls from an unexpected public IP address: ("
+        + ip[is_public].map(str)
+        + ")"
+    ).to_numpy()
+    result[is_aws_network & is_service_role] = "Principal is a service role which performed API calls from an AWS service network"
+    result[is_aws_network & ~is_service_role] = "Principal performed API calls from an AWS service network"
+    return result
+
+
 def comment_injected_sql(sql: str, key: str) -> str:
     """Comment an SQL statement"""
     return f"-- START injected: {key}\n" + sql.strip("\n") + "\n  -- END"
@@ -148,6 +214,19 @@ def get_athena_sql_limit(account_id: str) -> int:
     return max_sql_limit
 
 
+def warn_skipped_by_sql_limit(feature: str, account_id: str) -> None:
+    """Warn once per run that <feature> is not applied to the accounts with
+    an `athena_sql_limit`"""
+    if feature in set_feature_skipped_by_sql_limit:
+        return
+    set_feature_skipped_by_sql_limit.add(feature)
+    logger.warning(
+        "[!] %s is not applied to the accounts with an athena_sql_limit set"
+        " in the data perimeter configuration, such as account %s",
+        feature, account_id
+    )
+
+
 def athena_cloudtrail_with_union() -> bool:
     """Return True if table UNION is needed, else False.
     Used to manage the case where 2 athena table are used,
@@ -276,6 +355,56 @@ def get_athena_account_org_unit_boundary(
     )
 
 
+def athena_add_column_to_statement(
+    statement: str,
+    column_name: str
+) -> Optional[str]:
+    """Add a column to the SELECT clause and, if any, to the trailing
+    GROUP BY clause of an Athena statement. Returns None if the statement
+    does not follow the layout of data perimeter helper queries"""
+    if not regex_athena_select.search(statement):
+        return None
+    statement = regex_athena_select.sub(
+        f"\\g<0>    {column_name},\n", statement, count=1
+    )
+    group_by_position = statement.rfind("\nGROUP BY\n")
+    if group_by_position == -1:
+        return statement
+    if regex_athena_after_group_by.search(statement[group_by_position:]):
+        return None
+    return f"{statement.rstrip()},\n    {column_name}\n"
+
+
+def athena_normalize_account_statement(
+    statement: str,
+    params: List[str],
+    account_id: str
+) -> Optional[str]:
+    """Remove all references to the selected account from an Athena
+    statement so statements generated for different accounts can be compared.
+    The account partition filter is replaced by a placeholder and the account
+    ID literals by the column `p_account`, which holds the same value for
+    each row scanned under a single account partition.
+    Returns None if the account ID cannot be removed from the statement"""
+    account_partition = f"p_account = '{account_id}'"
+    if account_partition not in statement:
+        return None
+    first_line, _, body = statement.partition("\n")
+    first_line = first_line.replace(
+        f"| {account_id}", "| __ATHENA_ACCOUNT_LIST_PLACEHOLDER__"
+    )
+    body = body.replace(
+        account_partition, "__ATHENA_ACCOUNT_PARTITION_PLACEHOLDER__"
+    )
+    body = body.replace(f"'{account_id}'", "p_account")
+    normalized_statement = f"{first_line}\n{body}"
+    if account_id in normalized_statement:
+        return None
+    if any(account_id in str(param) for param in params):
+        return None
+    return normalized_statement
+
+
 def athena_trino_regex_escape(item: str) -> str:
     """Escape characters used in AWS resources name
     that are interpreted by Trino"""
@@ -393,3 +522,29 @@ def get_ou_id_from_name(ou_name: str) -> str:
             index = list(list_parent_name).index(ou_name)
             return list_parent_id[index]
     raise ValueError(f"OU name {ou_name} not found")
+
+
+def get_athena_query_statistics(
+    result: pandas.DataFrame
+) -> Dict[str, Union[int, str, None]]:
+    """Get the statistics of the Athena QueryExecution attached by AWS SDK
+    for pandas to a query result"""
+    query_metadata = getattr(result, "query_metadata", None)
+    if query_metadata is None:
+        return {}
+    query_execution = query_metadata.raw_payload
+    statistics = query_execution.get('Statistics', {})
+    return {
+        'QueryExecutionId': query_execution.get('QueryExecutionId'),
+        'DataScannedInBytes': statistics.get('DataScannedInBytes'),
+        'EngineExecutionTimeInMillis': statistics.get(
+            'EngineExecutionTimeInMillis'
+        ),
+        'QueryQueueTimeInMillis': statistics.get('QueryQueueTimeInMillis'),
+        'QueryPlanningTimeInMillis': statistics.get(
+            'QueryPlanningTimeInMillis'
+        ),
+        'ServiceProcessingTimeInMillis': statistics.get(
+            'ServiceProcessingTimeInMillis'
+        ),
+    }
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+'''
+This module hosts functions to process Athena queries incrementally per day
+partition. Aggregated results of past days are stored on the local
+filesystem, later runs only query the days not stored yet and merge the
+request counts across days
+'''
+import logging
+import json
+import hashlib
+from datetime import (
+    date,
+    datetime,
+    timedelta,
+    timezone
+)
+from pathlib import (
+    Path
+)
+from typing import (
+    Dict,
+    List,
+    Optional
+)
+
+import pandas
+
+from data_perimeter_helper.queries import (
+    helper
+)
+from data_perimeter_helper.toolbox import (
+    exporter
+)
+from data_perimeter_helper.variables import (
+    Variables as Var
+)
+
+
+logger = logging.getLogger(__name__)
+partition_column = "p_date"
+count_column = "nb_reqs"
+date_format = "%Y/%m/%d"
+# CloudTrail delivers events to S3 with a delay, a day is only stored once
+# this delay has passed after its end
+delivery_lag = timedelta(hours=12)
+
+
+def is_enabled() -> bool:
+    """Return True if Athena queries are processed incrementally. The mode
+    is not supported with `partition_date_regex`"""
+    return Var.athena_incremental_partitions is True\
+        and Var.partition_date_regex is None
+
+
+def get_today() -> date:
+    """Get the current date in UTC, the time zone of Athena CURRENT_DATE"""
+    return datetime.now(timezone.utc).date()
+
+
+def get_first_open_day() -> str:
+    """Get the first day partition which may still receive events. Results
+    of this day and of the following days are never stored"""
+    return (
+        datetime.now(timezone.utc) - delivery_lag
+    ).date().strftime(date_format)
+
+
+def get_list_partition_day() -> List[str]:
+    """Get the list of day partitions covered by the date window"""
+    today = get_today()
+    if Var.partition_date_start is not None and Var.partition_date_end is not None:
+        start = datetime.strptime(Var.partition_date_start, date_format).date()
+        end = datetime.strptime(Var.partition_date_end, date_format).date()
+    elif Var.partition_date_interval is not None:
+        value = int(Var.partition_date_interval_value)
+        unit = Var.partition_date_interval_unit
+        offset = pandas.DateOffset(**{f"{unit}s": value})
+        start = (pandas.Timestamp(today) - offset).date()
+        end = today
+    else:
+        raise ValueError(
+            "[!] Date variable is not set"
+        )
+    return [
+        (start + timedelta(days=i)).strftime(date_format)
+        for i in range((end - start).days + 1)
+    ]
+
+
+def get_storage_key(
+    statement: str,
+    params: List[str]
+) -> Optional[str]:
+    """Get the key under which the per-day results of a statement are stored.
+    Returns None if the statement does not filter on the date partition"""
+    date_partition = f"{partition_column} {helper.get_athena_date_partition()}"
+    if date_partition not in statement:
+        return None
+    content = json.dumps(
+        {
+            'statement': statement.replace(
+                date_partition, "__ATHENA_DATE_PARTITION_PLACEHOLDER__"
+            ),
+            'params': params,
+            'workgroup': Var.athena_workgroup,
+            'database': Var.athena_database,
+            'tables': [
+                Var.athena_table_name_mgmt_data_event,
+                Var.athena_table_name_mgmt_event,
+                Var.athena_table_name_data_event
+            ],
+            'use_parameterized_queries': Var.use_parameterized_queries
+        },
+        sort_keys=True
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def get_storage_folder_path(storage_key: str) -> str:
+    """Get the folder where the per-day results of a statement are stored"""
+    return f"{Var.cache_folder_path}/athena_partitions/{storage_key}/"
+
+
+def get_day_file_name(day: str) -> str:
+    """Get the name of the file storing the results of a day"""
+    return day.replace("/", "_")
+
+
+def generate_statement_per_day(
+    statement: str,
+    list_day: List[str]
+) -> Optional[str]:
+    """Restrict a statement to a list of day partitions and group its results
+    per day. Returns None if the statement cannot be grouped per day"""
+    date_partition = f"{partition_column} {helper.get_athena_date_partition()}"
+    list_day_sql = ','.join(f"'{day}'" for day in list_day)
+    return helper.athena_add_column_to_statement(
+        statement.replace(
+            date_partition, f"{partition_column} IN ({list_day_sql})"
+        ),
+        partition_column
+    )
+
+
+def get_list_day_to_query(
+    storage_key: str,
+    list_day: List[str]
+) -> List[str]:
+    """Get the days of the window without stored results. Days from the
+    first open day onwards are never stored as their partitions are still
+    being written"""
+    folder = Path(get_storage_folder_path(storage_key))
+    first_open_day = get_first_open_day()
+    return [
+        day for day in list_day
+        if day >= first_open_day
+        or not (folder / f"{get_day_file_name(day)}.parquet").is_file()
+    ]
+
+
+def read_stored_days(
+    storage_key: str,
+    list_day: List[str]
+) -> List[pandas.DataFrame]:
+    """Read the stored results of a list of days"""
+    folder = get_storage_folder_path(storage_key)
+    return [
+        pandas.read_parquet(f"{folder}{get_day_file_name(day)}.parquet")
+        for day in list_day
+    ]
+
+
+def store_days(
+    storage_key: str,
+    list_day: List[str],
+    result: pandas.DataFrame
+) -> pandas.DataFrame:
+    """Store the results of closed days from a result grouped per day. Days
+    without results are stored as empty results. Returns the result without
+    the partition column"""
+    result = result.copy()
+    result[partition_column] = result[partition_column].astype(str)
+    dict_result_per_day: Dict[str, pandas.DataFrame] = {
+        str(day): df_day.drop(columns=[partition_column]).reset_index(drop=True)
+        for day, df_day in result.groupby(partition_column, sort=False)
+    }
+    result = result.drop(columns=[partition_column])
+    first_open_day = get_first_open_day()
+    folder = get_storage_folder_path(storage_key)
+    for day in list_day:
+        if day >= first_open_day:
+            continue
+        exporter.write_dataframe_to_parquet(
+            dataframe=dict_result_per_day.get(day, result.iloc[0:0]),
+            export_folder=folder,
+            file_name=get_day_file_name(day),
+            file_extension="parquet"
+        )
+    return result
+
+
+def remove_days_outside_window(
+    storage_key: str,
+    list_day: List[str]
+) -> None:
+    """Remove the stored results of days outside the date window"""
+    set_file_name = {get_day_file_name(day) for day in list_day}
+    for path in Path(get_storage_folder_path(storage_key)).glob("*.parquet"):
+        if path.stem not in set_file_name:
+            path.unlink(missing_ok=True)
+            logger.debug("[~] Removed stored day partition: %s", path)
+
+
+def merge_days(list_result: List[pandas.DataFrame]) -> pandas.DataFrame:
+    """Merge per-day results by summing the request counts of identical
+    rows"""
+    list_result = [df for df in list_result if len(df.columns) > 0]
+    if len(list_result) == 0:
+        return pandas.DataFrame()
+    result = pandas.concat(list_result, ignore_index=True)
+    if count_column not in result.columns:
+        return result.drop_duplicates(ignore_index=True)
+    list_column = [c for c in result.columns if c != count_column]
+    if len(list_column) == 0:
+        return result[[count_column]].sum().to_frame().T
+    merged = result.groupby(
+        list_column, dropna=False, sort=False
+    )[count_column].sum().reset_index()
+    return merged[result.columns]
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+'''
+This module hosts functions to memoize, for the duration of a run, the role
+attributes resolved for each principal. The memo is shared by all queries,
+accounts and worker threads
+'''
+import logging
+from threading import (
+    Lock
+)
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Tuple
+)
+
+
+logger = logging.getLogger(__name__)
+lock = Lock()
+# Key: (principal account ID, principal ID), value: {column: value}
+memo: Dict[Tuple[Optional[str], Optional[str]], Dict[str, object]] = {}
+nb_hit = 0
+nb_miss = 0
+
+
+def get_key(
+    account_id: object,
+    principal_id: object
+) -> Tuple[Optional[str], Optional[str]]:
+    """Get the memo key of a principal, missing values are set to None"""
+    return (
+        account_id if isinstance(account_id, str) else None,
+        principal_id if isinstance(principal_id, str) else None
+    )
+
+
+def lookup(
+    list_key: List[Tuple[Optional[str], Optional[str]]],
+    list_column: List[str]
+) -> List[Optional[Dict[str, object]]]:
+    """Get the memoized attributes of a list of principals. None is returned
+    for the principals missing one of the columns"""
+    global nb_hit, nb_miss  # pylint: disable=global-statement
+    list_item: List[Optional[Dict[str, object]]] = []
+    with lock:
+        for key in list_key:
+            item = memo.get(key)
+            if item is not None and all(column in item for column in list_column):
+                list_item.append(item)
+            else:
+                list_item.append(None)
+        nb_miss_lookup = list_item.count(None)
+        nb_miss += nb_miss_lookup
+        nb_hit += len(list_item) - nb_miss_lookup
+    return list_item
+
+
+def store(
+    list_key: List[Tuple[Optional[str], Optional[str]]],
+    dict_column_value: Dict[str, List[object]]
+) -> None:
+    """Memoize the attributes of a list of principals"""
+    with lock:
+        for position, key in enumerate(list_key):
+            item = memo.setdefault(key, {})
+            for column, list_value in dict_column_value.items():
+                item[column] = list_value[position]
+
+
+def get_hit_rate() -> Optional[float]:
+    """Get the percentage of principal lookups served by the memo"""
+    with lock:
+        nb_lookup = nb_hit + nb_miss
+        if nb_lookup == 0:
+            return None
+        return 100 * nb_hit / nb_lookup
+
+
+def log_statistics() -> None:
+    """Log the hit rate of the memo"""
+    hit_rate = get_hit_rate()
+    if hit_rate is None:
+        return
+    logger.debug(
+        "[~] Principal attribute memo: %s principals, %s hits, %s misses"
+        " (hit rate: %.1f%%)",
+        len(memo), nb_hit, nb_miss, hit_rate
+    )
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+'''
+This module hosts functions to persist the Athena runtime and bytes scanned
+of each query per account across runs. The history is used to schedule the
+queries expected to be the longest first
+'''
+import logging
+import json
+import statistics
+from threading import (
+    Lock
+)
+from typing import (
+    Dict,
+    Optional,
+    Union
+)
+
+from data_perimeter_helper.toolbox import (
+    utils
+)
+from data_perimeter_helper.variables import (
+    Variables as Var
+)
+
+
+logger = logging.getLogger(__name__)
+lock = Lock()
+# Weight of the last run in the moving average of the history
+SMOOTHING_FACTOR = 0.5
+# Runtime used when the history is empty
+DEFAULT_RUNTIME_IN_MILLIS = 60000.0
+history: Dict[str, Dict[str, Dict[str, float]]] = {}
+
+
+def get_history_file_path() -> str:
+    """Get the path of the file persisting the query history"""
+    return f"{Var.cache_folder_path}/query_history.json"
+
+
+def load() -> None:
+    """Load the query history from the cache folder"""
+    global history  # pylint: disable=global-statement
+    try:
+        history = utils.read_json_file(get_history_file_path())
+    except (FileNotFoundError, RuntimeError):
+        logger.debug("[~] Query history not found or invalid")
+        history = {}
+
+
+def save() -> None:
+    """Save the query history in the cache folder"""
+    utils.create_folder(Var.cache_folder_path)
+    with lock:
+        content = json.dumps(history, indent=4)
+    with open(get_history_file_path(), 'w', encoding="utf-8") as file:
+        file.write(content)
+
+
+def get_expected_runtime(
+    query_name: str,
+    account_id: str
+) -> Optional[float]:
+    """Get the expected runtime in milliseconds of a query for a given
+    account. Returns None if the pair is not in the history"""
+    with lock:
+        item = history.get(query_name, {}).get(account_id)
+    if item is None:
+        return None
+    return item.get('RuntimeInMillis')
+
+
+def get_default_runtime() -> float:
+    """Get the runtime expected for a query with a single account scope when
+    the history has no entry for it: the median runtime of the history"""
+    with lock:
+        list_runtime = [
+            item['RuntimeInMillis']
+            for dict_account in history.values()
+            for item in dict_account.values()
+            if 'RuntimeInMillis' in item
+        ]
+    if len(list_runtime) == 0:
+        return DEFAULT_RUNTIME_IN_MILLIS
+    return statistics.median(list_runtime)
+
+
+def record(
+    query_name: str,
+    account_id: str,
+    query_statistics: Dict[str, Union[int, str, None]]
+) -> None:
+    """Record the statistics of a query performed for a given account as a
+    moving average of the runtime and bytes scanned. The runtime is the time
+    spent by Athena on the query, queued and running. Results not retrieved
+    from Athena (cache, stored days) are not recorded"""
+    if query_statistics.get('ResultSource') != 'athena':
+        return
+    list_time = [
+        query_statistics.get('QueryQueueTimeInMillis'),
+        query_statistics.get('EngineExecutionTimeInMillis')
+    ]
+    if any(not isinstance(value, int) for value in list_time):
+        return
+    measure = {
+        'RuntimeInMillis': float(sum(list_time)),  # type: ignore
+    }
+    if isinstance(query_statistics.get('DataScannedInBytes'), int):
+        measure['DataScannedInBytes'] = float(
+            query_statistics['DataScannedInBytes']  # type: ignore
+        )
+    with lock:
+        item = history.setdefault(query_name, {}).setdefault(account_id, {})
+        for key, value in measure.items():
+            previous = item.get(key)
+            item[key] = value if previous is None\
+                else SMOOTHING_FACTOR * value + (1 - SMOOTHING_FACTOR) * previous
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+'''
+This module hosts functions to remove from query results the API calls
+matching resource exceptions of the configuration file. The exceptions of an
+account and resource type are compiled once per run, regular expressions and
+CIDR matchers are built at compilation, and applied in a single pass
+'''
+import logging
+import re
+from threading import (
+    Lock
+)
+from typing import (
+    Dict,
+    List,
+    Tuple,
+    Union
+)
+
+import numpy
+import pandas
+
+from data_perimeter_helper.queries.CidrMatcher import (
+    CidrMatcher
+)
+from data_perimeter_helper.variables import (
+    Variables as Var
+)
+
+
+logger = logging.getLogger(__name__)
+# Column of the query results checked by each exception type
+EXCEPTION_TYPE_COLUMN = {
+    'network_perimeter_trusted_principal': 'principal_arn',
+    'identity_perimeter_trusted_principal': 'principal_arn',
+    'network_perimeter_expected_vpc_endpoint': 'vpcendpointid',
+    'network_perimeter_expected_vpc': 'vpcId',
+    'network_perimeter_expected_public_cidr': 'sourceipaddress',
+}
+# A compiled exception is a column and a regular expression or CIDR matcher
+CompiledException = Tuple[str, Union[re.Pattern, CidrMatcher]]
+lock = Lock()
+compiled_cache: Dict[
+    Tuple[str, str, Tuple[str, ...]],
+    Dict[str, List[CompiledException]]
+] = {}
+
+
+def compile_resource_exception(
+    exceptions: dict,
+    list_exception_type_to_consider: list
+) -> List[CompiledException]:
+    """Compile the exceptions of a resource"""
+    list_compiled: List[CompiledException] = []
+    for exception_type, exception in exceptions.items():
+        logger.debug(
+            "exception_type:%s, exception:%s, list_exception:%s",
+            exception_type, exception, list_exception_type_to_consider
+        )
+        if exception_type not in list_exception_type_to_consider:
+            continue
+        if exception_type not in EXCEPTION_TYPE_COLUMN:
+            continue
+        column = EXCEPTION_TYPE_COLUMN[exception_type]
+        if exception_type == "network_perimeter_expected_public_cidr":
+            list_compiled.append((column, CidrMatcher(exception)))
+        else:
+            list_compiled.append((column, re.compile('|'.join(exception))))
+    return list_compiled
+
+
+def get_compiled_exceptions(
+    account_id: str,
+    resource_type: str,
+    list_exception_type_to_consider: list
+) -> Dict[str, List[CompiledException]]:
+    """Get the compiled exceptions of each resource for a given account and
+    resource type"""
+    cache_key = (
+        account_id, resource_type, tuple(list_exception_type_to_consider)
+    )
+    with lock:
+        if cache_key in compiled_cache:
+            return compiled_cache[cache_key]
+    conf = Var.get_account_resource_exception(
+        account_id=account_id,
+        resource_type=resource_type
+    )
+    logger.debug("Exceptions: %s", conf)
+    compiled = {
+        resource_name: compile_resource_exception(
+            exceptions, list_exception_type_to_consider
+        )
+        for resource_name, exceptions in conf.items()
+    }
+    compiled = {
+        resource_name: list_compiled
+        for resource_name, list_compiled in compiled.items()
+        if len(list_compiled) > 0
+    }
+    with lock:
+        compiled_cache[cache_key] = compiled
+    return compiled
+
+
+def get_keep_mask(
+    dataframe: pandas.DataFrame,
+    lookup_column: str,
+    compiled: Dict[str, List[CompiledException]]
+) -> pandas.Series:
+    """Get a boolean Series set to False for the rows matching the compiled
+    exceptions of the resource in <lookup_column>"""
+    keep = pandas.Series(True, index=dataframe.index, dtype=bool)
+    if len(compiled) == 0 or len(dataframe.index) == 0:
+        return keep
+    positions_by_resource = dataframe.groupby(
+        lookup_column, sort=False, dropna=True
+    ).indices
+    column_values: Dict[str, pandas.Series] = {}
+    # IP addresses are converted to integers once per column
+    column_ipv4: Dict[str, Tuple[numpy.ndarray, numpy.ndarray]] = {}
+    for resource_name, list_compiled in compiled.items():
+        positions = positions_by_resource.get(resource_name)
+        if positions is None:
+            continue
+        for column, matcher in list_compiled:
+            if column not in column_values:
+                column_values[column] = dataframe[column].astype(object)
+            values = column_values[column].iloc[positions]
+            if isinstance(matcher, re.Pattern):
+                is_match = values.str.contains(
+                    matcher, na=False
+                ).to_numpy(dtype=bool)
+            else:
+                if column not in column_ipv4:
+                    column_ipv4[column] = CidrMatcher.ipv4_to_int(
+                        column_values[column]
+                    )
+                ints, is_ipv4 = column_ipv4[column]
+                is_match = matcher.match(
+                    values, (ints[positions], is_ipv4[positions])
+                )
+            keep.iloc[positions[is_match]] = False
+    return keep
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+'''
+This module hosts functions to store the results of queries with compact
+dtypes. Repetitive columns (principal ARNs, account IDs, event names, ...)
+are converted to categoricals, other string columns to Arrow-backed strings
+'''
+import logging
+from typing import (
+    Dict,
+    List
+)
+
+import numpy
+import pandas
+
+from data_perimeter_helper.variables import (
+    Variables as Var
+)
+
+
+logger = logging.getLogger(__name__)
+# Columns with at most this ratio of distinct values are categoricals
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+# Missing values are NaN, as for object columns, to keep exports unchanged
+ARROW_STRING_DTYPE = pandas.StringDtype("pyarrow", na_value=numpy.nan)
+
+
+def is_enabled() -> bool:
+    """Return True if query results are stored with compact dtypes"""
+    return Var.compact_result_dtypes is True
+
+
+def get_compact_column(column: pandas.Series) -> pandas.Series:
+    """Get a column converted to a categorical or to Arrow-backed strings.
+    The column is returned unchanged if it does not hold strings or
+    hashable values"""
+    if not (
+        pandas.api.types.is_object_dtype(column.dtype)
+        or pandas.api.types.is_string_dtype(column.dtype)
+    ):
+        return column
+    try:
+        nb_unique = column.nunique(dropna=True)
+    except TypeError:
+        return column
+    if nb_unique <= CATEGORY_MAX_UNIQUE_RATIO * len(column.index):
+        return column.astype("category")
+    values = column.dropna()
+    if len(values.index) > 0 and values.map(type).eq(str).all():
+        return column.astype(ARROW_STRING_DTYPE)
+    return column
+
+
+def compact(dataframe: pandas.DataFrame) -> pandas.DataFrame:
+    """Get a DataFrame with its columns converted to compact dtypes"""
+    if not is_enabled() or len(dataframe.index) == 0:
+        return dataframe
+    memory_before = dataframe.memory_usage(deep=True).sum()
+    result = pandas.DataFrame({
+        column_name: get_compact_column(dataframe[column_name])
+        for column_name in dataframe.columns
+    }, index=dataframe.index)
+    logger.debug(
+        "[~] Compact dtypes: memory usage from %s to %s bytes",
+        memory_before, result.memory_usage(deep=True).sum()
+    )
+    return result
+
+
+def concat(list_df: List[pandas.DataFrame]) -> pandas.DataFrame:
+    """Concatenate DataFrames, categorical columns remain categoricals. The
+    categories of each column are unified beforehand as pandas converts
+    categoricals with different categories to objects"""
+    if not is_enabled() or len(list_df) < 2:
+        return pandas.concat(list_df, axis=0)
+    dict_categories: Dict[str, pandas.Index] = {}
+    for column_name in list_df[0].columns:
+        list_column = [
+            dataframe[column_name] for dataframe in list_df
+            if column_name in dataframe.columns
+        ]
+        if len(list_column) != len(list_df):
+            continue
+        if not all(
+            isinstance(column.dtype, pandas.CategoricalDtype)
+            for column in list_column
+        ):
+            continue
+        dict_categories[column_name] = pandas.Index(
+            numpy.concatenate([
+                column.cat.categories.to_numpy(dtype=object)
+                for column in list_column
+            ]),
+            dtype=object
+        ).unique()
+    if len(dict_categories) == 0:
+        return pandas.concat(list_df, axis=0)
+    return pandas.concat([
+        dataframe.assign(**{
+            column_name: dataframe[column_name].cat.set_categories(
+                categories
+            )
+            for column_name, categories in dict_categories.items()
+        })
+        for dataframe in list_df
+    ], axis=0)
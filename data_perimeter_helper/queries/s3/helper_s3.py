@@ -58,13 +58,12 @@ def remove_call_on_bucket_in_organization(
     AWS Config aggregator"""
     s3_buckets = Referential.get_resource_type("AWS::S3::Bucket")
     logger.debug("[~] Adding column [isBucketInConfAgg]")
-    result['isBucketInConfAgg'] = [
-        s3_buckets.exists(
-            bucket_name,
-            'resourceId'
-        )
-        for bucket_name in result['bucketname']
-    ]
+    list_bucket_name = result['bucketname'].unique()
+    result['isBucketInConfAgg'] = result['bucketname'].isin(
+        list_bucket_name[
+            s3_buckets.exists_many(list_bucket_name, 'resourceId')
+        ]
+    )
     logger.debug(
         "[~] API calls to bucket not inventoried in Config aggregator"
         "are removed"
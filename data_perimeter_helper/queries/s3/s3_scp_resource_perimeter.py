@@ -148,8 +148,7 @@ GROUP BY
                 "dataframe": result
             }
         # self.add_column_vpc_id(result)
-        self.add_column_is_assumable_by(result)
-        self.add_column_is_service_role(result)
+        self.add_column_role_attributes(result, ['isAssumableBy', 'isServiceRole'])
         result = self.remove_calls_by_service_linked_role(result)
         result = helper_s3.remove_call_on_bucket_in_organization(result)
         if len(result.index):
@@ -6,7 +6,7 @@
 This module hosts the Referential class
 """
 import logging
-import json
+import threading
 from typing import (
     Optional,
     Union,
@@ -21,6 +21,7 @@ from time import (
     perf_counter,
 )
 
+import pandas
 from pandas._libs.missing import (
     NAType
 )
@@ -28,12 +29,12 @@ from tqdm import (
     tqdm
 )
 from data_perimeter_helper.toolbox import (
-    utils,
-    exporter
+    utils
 )
 from data_perimeter_helper.referential import (
     vpce,
-    generic
+    generic,
+    referential_cache
 )
 from data_perimeter_helper.referential.ResourceType import ResourceType
 from data_perimeter_helper.variables import Variables as Var
@@ -44,6 +45,8 @@ logger = logging.getLogger(__name__)
 
 class Referential:
     """Used as an interface to ResourceType class"""
+    # Ensures that a resource type is registered by a single thread
+    registry_lock = threading.Lock()
 
     @classmethod
     def batch_get_resource_type(
@@ -109,14 +112,17 @@ class Referential:
         """Get all resources of a given resource type"""
         resource_type_lower = resource_type.lower()
         if resource_type_lower not in ResourceType.registry:
-            # If the resource_type is a VPC endpoint, example: "AWS::EC2::VPCEndpoint::S3"
-            if "aws::ec2::vpcendpoint::" in resource_type_lower:
-                vpce.vpce(resource_type)
-            else:
-                generic.generic(resource_type)
+            with cls.registry_lock:
+                if resource_type_lower not in ResourceType.registry:
+                    # If the resource_type is a VPC endpoint,
+                    # example: "AWS::EC2::VPCEndpoint::S3"
+                    if "aws::ec2::vpcendpoint::" in resource_type_lower:
+                        vpce.vpce(resource_type)
+                    else:
+                        generic.generic(resource_type)
         resource = ResourceType.get_from_registry(resource_type)
         assert isinstance(resource, ResourceType)  # nosec: B101
-        resource.get_df()
+        resource.get_snapshot()
         return resource
 
     @classmethod
@@ -142,6 +148,22 @@ class Referential:
             attribute
         )
 
+    @classmethod
+    def map_resource_attribute(
+        cls,
+        resource_type: str,
+        lookup_values: pandas.Series,
+        lookup_column: str,
+        attribute: str
+    ) -> pandas.Series:
+        """Get a given resource attribute for each value of a Series"""
+        res_type = cls.get_resource_type(resource_type)
+        return res_type.map_attribute_value(
+            lookup_values,
+            lookup_column,
+            attribute
+        )
+
     @staticmethod
     def get_resource_type_registry_items() -> ItemsView[str, ResourceType]:
         return ResourceType.registry.items()
@@ -154,12 +176,6 @@ class Referential:
         registry = cls.get_resource_type_registry_items()
         metadata = {}
         timestamp = utils.current_timestamp()
-        try:
-            metadata = utils.read_json_file(
-                f"{Var.cache_folder_path}/metadata.json"
-            )
-        except FileNotFoundError:
-            logger.debug("No cache metadata found.")
         for resource_type, resource in registry:
             # If the dataframe is already coming from cache, skip export
             if resource.dataframe_from_cache is True:
@@ -167,26 +183,18 @@ class Referential:
             if resource.dataframe is None:
                 continue
             resource_type_file_name = resource_type.replace("::", "_")
-            path = exporter.write_dataframe_to_parquet(
-                dataframe=resource.dataframe,
-                export_folder=f"{Var.cache_folder_path}/",
-                file_name=resource_type_file_name,
-                file_extension="parquet"
-            )
             metadata[resource_type] = {
                 'type_name': resource.type_name,
                 'unknown_value': resource.unknown_value,
-                'timestamp': timestamp,
-                'path': path
+                'timestamp': resource.timestamp or timestamp,
+                'reconciliation_timestamp': resource.reconciliation_timestamp
+                or timestamp,
+                **referential_cache.write_resource_type(
+                    resource.dataframe,
+                    resource_type_file_name
+                )
             }
-        # Export the metadata
-        exporter.write_to_file(
-            export_folder=f"{Var.cache_folder_path}/",
-            file_name="metadata",
-            file_extension="json",
-            content=json.dumps(
-                metadata,
-                indent=4,
-                sort_keys=True
-            )
-        )
+        if len(metadata) == 0:
+            return
+        # Merge the metadata with the metadata of concurrent runs
+        referential_cache.update_metadata(metadata)
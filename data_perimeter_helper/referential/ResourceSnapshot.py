@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+This module hosts the ResourceSnapshot class
+"""
+import logging
+import threading
+from types import (
+    MappingProxyType
+)
+from typing import (
+    Dict,
+    Hashable,
+    List,
+    Mapping,
+    Optional,
+    Tuple
+)
+
+import numpy
+import pandas
+import pyarrow
+
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceSnapshot:
+    """Frozen view of the resources of a populated resource type. The hash
+    indexes of the lookup columns and the attribute maps are built once, on
+    first use, and are never modified afterwards: they can be read by
+    concurrent threads without locking.
+    The resources are either a DataFrame or a pyarrow Table memory-mapped
+    from the cache. The columns of a Table are converted to pandas on first
+    use, the whole DataFrame only if it is accessed"""
+
+    def __init__(
+        self,
+        type_name: str,
+        dataframe: Optional[pandas.DataFrame] = None,
+        table: Optional[pyarrow.Table] = None
+    ) -> None:
+        self.type_name = type_name
+        self.materialized_dataframe = dataframe
+        self.table = table
+        if dataframe is not None:
+            self.column_names: List[str] = list(dataframe.columns)
+            self.nb_row = len(dataframe.index)
+        else:
+            assert isinstance(table, pyarrow.Table)  # nosec: B101
+            self.column_names = table.column_names
+            self.nb_row = table.num_rows
+        # Reentrant as the DataFrame can be materialized while building maps
+        self.lock = threading.RLock()
+        self.columns: Mapping[str, pandas.Series] = {}
+        self.lookup_index: Mapping[str, Mapping[Hashable, numpy.ndarray]] = {}
+        self.attribute_map: Mapping[Tuple[str, str, bool], pandas.Series] = {}
+
+    @property
+    def dataframe(self) -> pandas.DataFrame:
+        """DataFrame with the resources, converted from the Table on first
+        access"""
+        dataframe = self.materialized_dataframe
+        if dataframe is not None:
+            return dataframe
+        with self.lock:
+            if self.materialized_dataframe is None:
+                assert isinstance(self.table, pyarrow.Table)  # nosec: B101
+                logger.debug(
+                    "[~] Converting all columns of %s to pandas",
+                    self.type_name
+                )
+                self.materialized_dataframe = self.table.to_pandas()
+        return self.materialized_dataframe
+
+    def has_column(self, column: str) -> bool:
+        """Return True if the resources have a given column"""
+        return column in self.column_names
+
+    def get_column(self, column: str) -> pandas.Series:
+        """Get a column of the resources, only this column is converted to
+        pandas if the DataFrame is not materialized"""
+        dataframe = self.materialized_dataframe
+        if dataframe is not None:
+            return dataframe[column]
+        series = self.columns.get(column)
+        if series is not None:
+            return series
+        with self.lock:
+            if column not in self.columns:
+                assert isinstance(self.table, pyarrow.Table)  # nosec: B101
+                logger.debug(
+                    "[~] Converting column %s of %s to pandas",
+                    column,
+                    self.type_name
+                )
+                self.columns = {
+                    **self.columns,
+                    column: self.table.column(column).to_pandas().rename(
+                        column
+                    )
+                }
+        return self.columns[column]
+
+    def take(self, positions: numpy.ndarray) -> pandas.DataFrame:
+        """Get the resources at given positions, only these rows are
+        converted to pandas if the DataFrame is not materialized"""
+        dataframe = self.materialized_dataframe
+        if dataframe is not None:
+            return dataframe.iloc[positions]
+        assert isinstance(self.table, pyarrow.Table)  # nosec: B101
+        result = self.table.take(
+            pyarrow.array(positions, type=pyarrow.int64())
+        ).to_pandas()
+        result.index = pandas.Index(positions, dtype="int64")
+        return result
+
+    def get_lookup_index(
+        self,
+        lookup_column: str
+    ) -> Mapping[Hashable, numpy.ndarray]:
+        """Get the hash index of a column, mapping each value of the column
+        to the positions of the matching rows"""
+        index = self.lookup_index.get(lookup_column)
+        if index is not None:
+            return index
+        with self.lock:
+            if lookup_column not in self.lookup_index:
+                new_index: Dict[Hashable, numpy.ndarray] = {}
+                if self.nb_row > 0:
+                    column = self.get_column(lookup_column)
+                    new_index = column.groupby(
+                        column, sort=False, dropna=True
+                    ).indices
+                for positions in new_index.values():
+                    positions.flags.writeable = False
+                logger.debug(
+                    "[~] Lookup index built for %s on column %s",
+                    self.type_name,
+                    lookup_column
+                )
+                # The mapping is replaced, not updated, so readers never see
+                # a mapping being modified
+                self.lookup_index = {
+                    **self.lookup_index,
+                    lookup_column: MappingProxyType(new_index)
+                }
+        return self.lookup_index[lookup_column]
+
+    def get_attribute_map(
+        self,
+        lookup_column: str,
+        attribute: str,
+        as_string: bool = True
+    ) -> pandas.Series:
+        """Get a Series indexed by the values of <lookup_column> with the
+        attribute of the first matching resource, converted to string if
+        <as_string> is True"""
+        cache_key = (lookup_column, attribute, as_string)
+        attribute_map = self.attribute_map.get(cache_key)
+        if attribute_map is not None:
+            return attribute_map
+        index = self.get_lookup_index(lookup_column)
+        with self.lock:
+            if cache_key not in self.attribute_map:
+                if self.has_column(attribute):
+                    attr_as_array = self.get_column(attribute).array.take(
+                        [positions[0] for positions in index.values()]
+                    )
+                    list_value = [
+                        str(value) if as_string else value
+                        for value in attr_as_array
+                    ]
+                else:
+                    list_value = [pandas.NA] * len(index)
+                new_attribute_map = pandas.Series(
+                    list_value,
+                    index=pandas.Index(list(index.keys()), dtype=object),
+                    dtype=object
+                )
+                self.attribute_map = {
+                    **self.attribute_map,
+                    cache_key: new_attribute_map
+                }
+        return self.attribute_map[cache_key]
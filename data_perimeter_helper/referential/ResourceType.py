@@ -6,14 +6,18 @@
 This module hosts the ResourceType class
 """
 import logging
+import threading
 from typing import (
+    Iterable,
     Union,
     List,
     Dict,
     Optional
 )
 
+import numpy
 import pandas
+import pyarrow
 from pandas._libs.missing import (
     NAType
 )
@@ -21,6 +25,13 @@ from tqdm import (
     tqdm
 )
 
+from data_perimeter_helper.referential import (
+    config_adv,
+    referential_cache
+)
+from data_perimeter_helper.referential.ResourceSnapshot import (
+    ResourceSnapshot
+)
 from data_perimeter_helper.toolbox import (
     utils
 )
@@ -34,6 +45,11 @@ logger = logging.getLogger(__name__)
 class ResourceType:
     """Represent an AWS resource type (example:, "AWS::IAM::Role")"""
     registry: Dict[str, 'ResourceType'] = {}
+    # Resource types retrieved from AWS Config set, in their __init__, the
+    # AWS Config resource type and the column holding the resourceId of
+    # their resources to support the incremental refresh of their cache
+    config_resource_type: Optional[str] = None
+    config_key_column: Optional[str] = None
 
     def __init__(
         self,
@@ -42,19 +58,26 @@ class ResourceType:
     ) -> None:
         """
         Init a resource type
-        self.lookup_cache = Dict(
-            'column_name': {
-                'lookup_value': dataframe.index (if cache hit) | None (else)
-            }
-        )
+        self.snapshot = ResourceSnapshot of the resources, set once the
+        resource type is populated
+        self.table = pyarrow Table memory-mapped from an Arrow IPC cache,
+        its columns are converted to pandas lazily by the snapshot
+        self.timestamp = time at which the resources were retrieved
+        self.reconciliation_timestamp = time at which the deleted resources
+        were last removed from the resources
         """
         self.type_name = type_name
         self.type_name_lower = type_name.lower()
         logger.debug("Initialization of resource type: %s", self.type_name)
         self.unknown_value = unknown_value
-        self.dataframe: Optional[pandas.DataFrame] = None
+        self.loaded_dataframe: Optional[pandas.DataFrame] = None
+        self.table: Optional[pyarrow.Table] = None
         self.dataframe_from_cache = False
-        self.lookup_cache: Dict[str, Dict[str, Union[pandas.Index, None]]] = {}
+        self.snapshot: Optional[ResourceSnapshot] = None
+        self.timestamp: Optional[float] = None
+        self.reconciliation_timestamp: Optional[float] = None
+        # Ensures that a single thread populates the resource type
+        self.lock = threading.RLock()
         if self.type_name not in ResourceType.registry:
             ResourceType.registry[self.type_name_lower] = self
 
@@ -63,19 +86,53 @@ class ResourceType:
         Generate the query Athena statement"""
         raise NotImplementedError("Must be overridden by childs queries")
 
+    @property
+    def dataframe(self) -> Optional[pandas.DataFrame]:
+        """DataFrame with the resources. The resources loaded lazily from an
+        Arrow IPC cache are converted to a DataFrame on first access"""
+        if self.loaded_dataframe is None and self.snapshot is not None:
+            return self.snapshot.dataframe
+        return self.loaded_dataframe
+
+    @dataframe.setter
+    def dataframe(self, dataframe: Optional[pandas.DataFrame]) -> None:
+        self.loaded_dataframe = dataframe
+
     def get_df(self, *args, **kwargs) -> pandas.DataFrame:
         """Get dataframe with resources, if the dataframe is not initialized,
-        populate the dataframe by calling the function populate"""
-        if self.dataframe is not None:
-            return self.dataframe
-        if self.get_df_from_cache() is True:
-            assert isinstance(self.dataframe, pandas.DataFrame)  # nosec: B101
-            return self.dataframe
-        logger.debug("[-] Getting resource type: %s", self.type_name)
-        self.dataframe = self.populate(*args, **kwargs)
-        assert isinstance(self.dataframe, pandas.DataFrame)  # nosec: B101
-        logger.debug("[+] Getting resource type: %s > DONE", self.type_name)
-        return self.dataframe
+        populate the dataframe by calling the function populate. Concurrent
+        callers wait for the thread populating the dataframe"""
+        return self.get_snapshot(*args, **kwargs).dataframe
+
+    def get_snapshot(self, *args, **kwargs) -> ResourceSnapshot:
+        """Get the frozen snapshot of the resources, populate the resource
+        type if needed. Concurrent callers wait for the thread populating the
+        resource type"""
+        snapshot = self.snapshot
+        if snapshot is not None:
+            return snapshot
+        with self.lock:
+            if self.snapshot is not None:
+                return self.snapshot
+            if self.loaded_dataframe is None and self.table is None\
+                    and self.get_df_from_cache() is False:
+                logger.debug("[-] Getting resource type: %s", self.type_name)
+                self.timestamp = utils.current_timestamp()
+                self.reconciliation_timestamp = self.timestamp
+                self.dataframe = self.populate(*args, **kwargs)
+                logger.debug(
+                    "[+] Getting resource type: %s > DONE", self.type_name
+                )
+            if self.table is not None:
+                self.snapshot = ResourceSnapshot(
+                    self.type_name, table=self.table
+                )
+            else:
+                assert isinstance(self.loaded_dataframe, pandas.DataFrame)  # nosec: B101
+                self.snapshot = ResourceSnapshot(
+                    self.type_name, dataframe=self.loaded_dataframe
+                )
+        return self.snapshot
 
     def lookup(
         self,
@@ -84,29 +141,30 @@ class ResourceType:
     ) -> Union[str, pandas.DataFrame]:
         """Perform a query to identify results based on a specific value
         on a specific column"""
-        if self.dataframe is None:
-            self.get_df()
-        assert isinstance(self.dataframe, pandas.DataFrame)  # nosec: B101
-        if len(self.dataframe.index) == 0:
+        snapshot = self.get_snapshot()
+        positions = snapshot.get_lookup_index(lookup_column).get(lookup_value)
+        if positions is None:
             return self.unknown_value
-        cache_selected_column = self.lookup_cache.setdefault(
-            lookup_column, {}
-        )
-        if lookup_value in cache_selected_column:
-            index_from_cache = cache_selected_column[lookup_value]
-            if index_from_cache is None:
-                return self.unknown_value
-            return self.dataframe.iloc[
-                index_from_cache
-            ]
-        lookup_resource = self.dataframe.loc[
-            self.dataframe[lookup_column] == lookup_value
+        return snapshot.take(positions)
+
+    def lookup_many(
+        self,
+        lookup_values: Iterable[str],
+        lookup_column: str
+    ) -> pandas.DataFrame:
+        """Perform a query to identify results based on a list of values
+        on a specific column. Returns the matching resources, in the order
+        of the values"""
+        snapshot = self.get_snapshot()
+        index = snapshot.get_lookup_index(lookup_column)
+        list_positions = [
+            index[lookup_value]
+            for lookup_value in lookup_values
+            if lookup_value in index
         ]
-        if len(lookup_resource.index) == 0:
-            cache_selected_column[lookup_value] = None
-            return self.unknown_value
-        cache_selected_column[lookup_value] = lookup_resource.index
-        return lookup_resource
+        if len(list_positions) == 0:
+            return snapshot.take(numpy.array([], dtype="int64"))
+        return snapshot.take(numpy.concatenate(list_positions))
 
     def exists(
         self,
@@ -114,9 +172,21 @@ class ResourceType:
         lookup_column: str
     ) -> bool:
         """Return True is the resource is found, False otherwise"""
-        return isinstance(
-            self.lookup(lookup_id, lookup_column),
-            pandas.DataFrame
+        return lookup_id in self.get_snapshot().get_lookup_index(
+            lookup_column
+        )
+
+    def exists_many(
+        self,
+        lookup_values: Iterable[str],
+        lookup_column: str
+    ) -> numpy.ndarray:
+        """Return a boolean array, True for the values found in the lookup
+        column. Only the lookup column is read"""
+        index = self.get_snapshot().get_lookup_index(lookup_column)
+        return numpy.array(
+            [lookup_value in index for lookup_value in lookup_values],
+            dtype=bool
         )
 
     def attribute_value(
@@ -127,23 +197,44 @@ class ResourceType:
     ) -> Union[str, NAType]:
         """Perform a call to lookup, expect max. 1 result
         and return the value"""
-        resource_df = self.lookup(
-            lookup_id,
-            lookup_column
-        )
-        if not isinstance(resource_df, pandas.DataFrame):
+        snapshot = self.get_snapshot()
+        positions = snapshot.get_lookup_index(lookup_column).get(lookup_id)
+        if positions is None:
             return self.unknown_value
-        if attribute in resource_df:
-            attr_as_array = resource_df[attribute].array
-            if len(attr_as_array) > 1:
+        if snapshot.has_column(attribute):
+            attr_as_array = snapshot.get_column(attribute).array
+            if len(positions) > 1:
                 logger.debug(
                     "[!] More than 1 match for attribute %s - %s",
                     attribute,
-                    attr_as_array
+                    attr_as_array.take(positions)
                 )
-            return str(attr_as_array[0])
+            return str(attr_as_array[positions[0]])
         return pandas.NA
 
+    def map_attribute_value(
+        self,
+        lookup_values: pandas.Series,
+        lookup_column: str,
+        attribute: str
+    ) -> pandas.Series:
+        """Vectorized version of attribute_value, map each value of a Series
+        to the attribute of the matching resource"""
+        snapshot = self.get_snapshot()
+        result = pandas.Series(
+            self.unknown_value,
+            index=lookup_values.index,
+            dtype=object
+        )
+        if snapshot.nb_row == 0 or len(lookup_values.index) == 0:
+            return result
+        attribute_map = snapshot.get_attribute_map(lookup_column, attribute)
+        is_found = lookup_values.isin(attribute_map.index)
+        result[is_found] = lookup_values[is_found].map(
+            attribute_map
+        ).to_numpy()
+        return result
+
     def attribute_list(
         self,
         lookup_id: str,
@@ -152,14 +243,12 @@ class ResourceType:
     ) -> List[str]:
         """Perform a call to lookup, convert the result (DataFrame)
         to a list and return it"""
-        resource_df = self.lookup(
-            lookup_id,
-            lookup_column
-        )
-        if not isinstance(resource_df, pandas.DataFrame):
+        snapshot = self.get_snapshot()
+        positions = snapshot.get_lookup_index(lookup_column).get(lookup_id)
+        if positions is None:
             return []
-        if attribute in resource_df:
-            return resource_df[attribute].to_list()
+        if snapshot.has_column(attribute):
+            return snapshot.get_column(attribute).iloc[positions].to_list()
         return []
 
     @classmethod
@@ -196,6 +285,8 @@ class ResourceType:
         if isinstance(Var.cache_expire_after_in_second, int) and utils.has_expired_timestamp(
             timestamp, expire_second=Var.cache_expire_after_in_second
         ):
+            if self.supports_incremental_refresh():
+                return self.refresh_from_cache(resource_type_metadata)
             log_msg = f"The cache for resource type `{self.type_name}` "\
                 f"generated the {utils.get_readable_timestamp(timestamp)} "\
                 "has expired. The import of this resource type is skipped."
@@ -208,9 +299,13 @@ class ResourceType:
             logger.debug(log_msg)
             return False
         start_time = utils.current_perf_time()
-        self.dataframe = pandas.read_parquet(
-            str(resource_type_metadata['path'])
-        )
+        cache = referential_cache.read_resource_type(resource_type_metadata)
+        if cache is None:
+            return False
+        if isinstance(cache, pyarrow.Table):
+            self.table = cache
+        else:
+            self.dataframe = cache
         self.dataframe_from_cache = True
         log_msg = f"Successfully imported resource type `{self.type_name}` "\
             f"generated the {utils.get_readable_timestamp(timestamp)} "\
@@ -223,3 +318,79 @@ class ResourceType:
             )
         )
         return True
+
+    def supports_incremental_refresh(self) -> bool:
+        """Return True if an expired cache of the resource type is refreshed
+        with the resources modified since its generation"""
+        return Var.cache_incremental_refresh is True\
+            and self.config_resource_type is not None\
+            and self.config_key_column is not None
+
+    def refresh_from_cache(
+        self,
+        resource_type_metadata: Dict[str, Union[str, float]]
+    ) -> bool:
+        """Refresh the expired cache of the resource type: only the resources
+        whose configuration was captured since the generation of the cache
+        are retrieved from AWS Config and replace their cached version. The
+        deleted resources are removed once every
+        `cache_deletion_reconciliation_after_in_hour` hours.
+        Returns False if the cache cannot be refreshed"""
+        assert isinstance(self.config_key_column, str)  # nosec: B101
+        assert isinstance(self.config_resource_type, str)  # nosec: B101
+        timestamp = float(resource_type_metadata['timestamp'])
+        reconciliation_timestamp = float(resource_type_metadata.get(
+            'reconciliation_timestamp', 0
+        ))
+        start_time = utils.current_perf_time()
+        cache = referential_cache.read_resource_type(resource_type_metadata)
+        if cache is None:
+            return False
+        dataframe = cache.to_pandas() if isinstance(cache, pyarrow.Table)\
+            else cache
+        if self.config_key_column not in dataframe:
+            return False
+        logger.debug("[-] Refreshing resource type: %s", self.type_name)
+        refresh_timestamp = utils.current_timestamp()
+        delta = self.populate(captured_after=timestamp)
+        if len(delta.index) > 0:
+            if self.config_key_column not in delta:
+                return False
+            dataframe = pandas.concat([
+                dataframe[
+                    ~dataframe[self.config_key_column].isin(
+                        delta[self.config_key_column]
+                    )
+                ],
+                delta
+            ], ignore_index=True)
+        nb_deleted = 0
+        if utils.has_expired_timestamp(
+            reconciliation_timestamp,
+            expire_hour=Var.cache_deletion_reconciliation_after_in_hour
+        ):
+            set_resource_id = config_adv.get_set_resource_id(
+                self.config_resource_type
+            )
+            is_deleted = ~dataframe[self.config_key_column].isin(
+                set_resource_id
+            )
+            nb_deleted = int(is_deleted.sum())
+            dataframe = dataframe[~is_deleted].reset_index(drop=True)
+            reconciliation_timestamp = refresh_timestamp
+        logger.debug("[+] Refreshing resource type: %s", self.type_name)
+        self.dataframe = dataframe
+        self.timestamp = refresh_timestamp
+        self.reconciliation_timestamp = reconciliation_timestamp
+        log_msg = f"Successfully refreshed resource type `{self.type_name}` "\
+            f"generated the {utils.get_readable_timestamp(timestamp)} "\
+            f"from cache with {len(delta.index)} modified and {nb_deleted} "\
+            "deleted resources "\
+            f"in {utils.get_readable_elapsed_perf_time(start_time)}!"
+        tqdm.write(
+            utils.color_string(
+                utils.Icons.FULL_CHECK_GREEN + log_msg,
+                utils.Colors.GREEN_BOLD
+            )
+        )
+        return True
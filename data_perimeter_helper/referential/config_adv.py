@@ -5,14 +5,37 @@
 """
 This module hosts all functions related to AWS Config advanced queries
 """
+import io
 import logging
 import json
+import math
+import re
+from concurrent.futures import (
+    ThreadPoolExecutor
+)
+from threading import (
+    Lock
+)
+from time import (
+    gmtime,
+    monotonic,
+    sleep,
+    strftime
+)
 from typing import (
+    Dict,
+    Optional,
+    Set,
+    Tuple,
     Union,
     List
 )
 
 import pandas
+import pyarrow
+from pyarrow import (
+    json as pyarrow_json
+)
 from botocore.exceptions import (
     ClientError
 )
@@ -23,6 +46,20 @@ from data_perimeter_helper.variables import (
 
 
 logger = logging.getLogger(__name__)
+# Configuration items can be available in the aggregator some time after
+# their capture, the capture time filter starts earlier by this margin
+CAPTURE_TIME_MARGIN_IN_SECOND = 60 * 60
+# Maximum length of the expression of a Config advanced query
+MAX_EXPRESSION_LENGTH = 4096
+# Queries already aggregated, ordered or filtered by account are not sharded
+regex_not_shardable = re.compile(
+    r"\b(GROUP\s+BY|ORDER\s+BY|accountId\s*(=|IN\b))", re.IGNORECASE
+)
+regex_where = re.compile(r"\bWHERE\b", re.IGNORECASE)
+# Prefix of the fields of the configuration item, removed from column names
+CONFIGURATION_PREFIX = "configuration."
+rate_limit_lock = Lock()
+next_request_time = 0.0
 
 
 def submit_config_advanced_query(
@@ -48,18 +85,14 @@ def submit_config_advanced_query(
     )
     if Var.print_query:
         print(f"Config advanced query:\n{query}")
-    list_result: List[str] = []
-    assert Var.config_client is not None  # nosec: B101
     try:
-        paginator = Var.config_client.get_paginator('select_aggregate_resource_config')
-        page_iterator = paginator.paginate(
-            Expression=query,
-            ConfigurationAggregatorName=Var.config_aggregator_name,
-            Limit=limit
-        )
-        for page in page_iterator:
-            for item in page['Results']:
-                list_result.append(item)
+        list_shard = get_account_shards(query, limit)
+        if list_shard is None:
+            list_result = paginate_config_advanced_query(query, limit)
+        else:
+            list_result = submit_sharded_config_advanced_query(
+                query, limit, list_shard
+            )
     except ClientError as error:
         logger.error("[!] Error from AWS client:\n%s", error.response)  # nosemgrep: logging-error-without-handling
         if error.response['Error']['Code'] == 'AccessDeniedException':
@@ -84,3 +117,257 @@ def submit_config_advanced_query(
         if transform_to_pandas:
             return df_result
     return list_result
+
+
+def wait_rate_limit() -> None:
+    """Wait until a request to AWS Config can be sent without exceeding
+    `config_max_requests_per_second` requests per second across threads"""
+    global next_request_time  # pylint: disable=global-statement
+    if Var.config_max_requests_per_second <= 0:
+        return
+    with rate_limit_lock:
+        now = monotonic()
+        wait_time = next_request_time - now
+        next_request_time = max(now, next_request_time)\
+            + 1 / Var.config_max_requests_per_second
+    if wait_time > 0:
+        sleep(wait_time)
+
+
+def paginate_config_advanced_query(
+    query: str,
+    limit: int
+) -> List[str]:
+    """Get all pages of results of an AWS Config advanced query, each
+    request is subject to the rate limiter"""
+    assert Var.config_client is not None  # nosec: B101
+    list_result: List[str] = []
+    params = {
+        'Expression': query,
+        'ConfigurationAggregatorName': Var.config_aggregator_name,
+        'Limit': limit
+    }
+    while True:
+        wait_rate_limit()
+        page = Var.config_client.select_aggregate_resource_config(**params)
+        list_result.extend(page['Results'])
+        next_token = page.get('NextToken')
+        if not next_token:
+            return list_result
+        params['NextToken'] = next_token
+
+
+def get_account_shards(
+    query: str,
+    limit: int
+) -> Optional[List[List[str]]]:
+    """Split the accounts matching an AWS Config advanced query into
+    `config_nb_shard` shards with a similar number of resources. The number
+    of resources per account is retrieved with an aggregation query. Returns
+    None if the query is not sharded.
+    The shards are a snapshot of the accounts returned by the aggregation
+    query: resources of accounts appearing in the aggregator afterwards are
+    not returned by the sharded query"""
+    if Var.config_nb_shard <= 1:
+        return None
+    where_clause = split_where_clause(query)
+    if where_clause is None or regex_not_shardable.search(query):
+        return None
+    count_query = "SELECT accountId, COUNT(*)"\
+        f"\nWHERE\n    ({where_clause[1]})\nGROUP BY accountId"
+    list_count = [
+        json.loads(item) for item in paginate_config_advanced_query(
+            count_query, limit
+        )
+    ]
+    list_count = sorted(
+        [
+            (int(item.get('COUNT(*)', 1)), item['accountId'])
+            for item in list_count if 'accountId' in item
+        ],
+        reverse=True
+    )
+    if len(list_count) < 2:
+        return None
+    # Each account adds its quoted ID and a separator to the expression
+    max_account_per_shard = (
+        MAX_EXPRESSION_LENGTH - len(get_shard_query(query, []))
+    ) // (len(list_count[0][1]) + 4)
+    if max_account_per_shard <= 0:
+        return None
+    nb_shard = max(
+        min(Var.config_nb_shard, len(list_count)),
+        math.ceil(len(list_count) / max_account_per_shard)
+    )
+    list_shard: List[List[str]] = [[] for _ in range(nb_shard)]
+    list_shard_size = [0] * nb_shard
+    # The largest accounts are assigned first to the smallest shard
+    for count, account_id in list_count:
+        position = min(
+            (
+                position for position in range(nb_shard)
+                if len(list_shard[position]) < max_account_per_shard
+            ),
+            key=lambda position: list_shard_size[position]
+        )
+        list_shard[position].append(account_id)
+        list_shard_size[position] += count
+    logger.debug(
+        "[~] Config advanced query split into %s shards of %s resources",
+        nb_shard, list_shard_size
+    )
+    return list_shard
+
+
+def split_where_clause(query: str) -> Optional[Tuple[str, str]]:
+    """Split an AWS Config advanced query into its selection and its
+    condition. Returns None if the query has no condition"""
+    list_part = regex_where.split(query, maxsplit=1)
+    if len(list_part) != 2:
+        return None
+    return list_part[0].rstrip(), list_part[1].strip()
+
+
+def get_shard_query(query: str, list_account_id: List[str]) -> str:
+    """Get a Config advanced query restricted to the resources of a list of
+    accounts, the original condition is kept between parentheses"""
+    where_clause = split_where_clause(query)
+    assert where_clause is not None  # nosec: B101
+    selection, condition = where_clause
+    accounts = ", ".join(f"'{account_id}'" for account_id in list_account_id)
+    return f"{selection}\nWHERE\n    ({condition})"\
+        f"\n    AND accountId IN ({accounts})"
+
+
+def submit_sharded_config_advanced_query(
+    query: str,
+    limit: int,
+    list_shard: List[List[str]]
+) -> List[str]:
+    """Paginate concurrently the shards of an AWS Config advanced query and
+    concatenate their results"""
+    list_query = [
+        get_shard_query(query, list_account_id)
+        for list_account_id in list_shard
+    ]
+    with ThreadPoolExecutor(max_workers=Var.config_nb_shard) as executor:
+        list_shard_result = list(executor.map(
+            lambda shard_query: paginate_config_advanced_query(
+                shard_query, limit
+            ),
+            list_query
+        ))
+    return [
+        item for shard_result in list_shard_result for item in shard_result
+    ]
+
+
+def get_capture_time_condition(captured_after: Optional[float]) -> str:
+    """Get the condition of a Config advanced query selecting the resources
+    whose configuration was captured after the timestamp <captured_after>.
+    Returns an empty string if <captured_after> is None"""
+    if captured_after is None:
+        return ""
+    capture_time = strftime(
+        "%Y-%m-%dT%H:%M:%S.000Z",
+        gmtime(captured_after - CAPTURE_TIME_MARGIN_IN_SECOND)
+    )
+    return f"\n    AND configurationItemCaptureTime > '{capture_time}'"
+
+
+def get_set_resource_id(resource_type: str) -> Set[str]:
+    """Get the resource IDs of all resources of a given resource type
+    inventoried in the AWS Config aggregator"""
+    config_query = f"""SELECT
+    resourceId
+WHERE
+    resourceType = '{resource_type}'"""
+    results = submit_config_advanced_query(
+        query=config_query,
+        transform_to_pandas=False,
+    )
+    assert isinstance(results, list)  # nosec: B101
+    return {json.loads(item).get('resourceId') for item in results}
+
+
+def decode_results(list_result: List[str]) -> pandas.DataFrame:
+    """Decode the results of an AWS Config advanced query into a DataFrame.
+    Nested fields are flattened into columns named after their path, the
+    prefix `configuration.` is removed. The results are parsed in bulk by
+    pyarrow as newline-delimited JSON, the json module is used if pyarrow
+    cannot infer a single schema for the results or if it converts strings
+    to timestamps"""
+    if len(list_result) == 0:
+        return pandas.DataFrame()
+    try:
+        table = pyarrow_json.read_json(
+            io.BytesIO("\n".join(list_result).encode())
+        )
+    except pyarrow.ArrowInvalid as error:
+        logger.debug("[!] Bulk decoding of Config results failed: %s", error)
+        return decode_results_with_json(list_result)
+    if any(is_temporal_type(field.type) for field in table.schema):
+        logger.debug(
+            "[!] Date-like strings in Config results, decoded with json"
+        )
+        return decode_results_with_json(list_result)
+    while any(pyarrow.types.is_struct(field.type) for field in table.schema):
+        table = table.flatten()
+    dict_column: Dict[str, pandas.Series] = {}
+    for name, column in zip(
+        get_column_names(table.column_names), table.columns
+    ):
+        # Lists are converted to Python lists, as decoded by the json module
+        if pyarrow.types.is_list(column.type)\
+                or pyarrow.types.is_large_list(column.type):
+            dict_column[name] = pandas.Series(column.to_pylist(), dtype=object)
+        else:
+            dict_column[name] = column.to_pandas()
+    return pandas.DataFrame(dict_column)
+
+
+def is_temporal_type(data_type: pyarrow.DataType) -> bool:
+    """Return True if a type, or the type of a nested field, is a temporal
+    type. pyarrow infers timestamps from strings that look like dates while
+    the json module keeps them as strings"""
+    if pyarrow.types.is_temporal(data_type):
+        return True
+    if pyarrow.types.is_struct(data_type):
+        return any(
+            is_temporal_type(data_type.field(position).type)
+            for position in range(data_type.num_fields)
+        )
+    if pyarrow.types.is_list(data_type)\
+            or pyarrow.types.is_large_list(data_type):
+        return is_temporal_type(data_type.value_type)
+    return False
+
+
+def decode_results_with_json(list_result: List[str]) -> pandas.DataFrame:
+    """Decode the results of an AWS Config advanced query into a DataFrame
+    with the json module, see decode_results"""
+    df = pandas.DataFrame([json.loads(item) for item in list_result])
+    if 'configuration' not in df:
+        return df
+    df_configuration = pandas.json_normalize(df['configuration'])  # type: ignore
+    df_configuration.columns = [
+        f"{CONFIGURATION_PREFIX}{name}" for name in df_configuration.columns
+    ]
+    df = pandas.concat(
+        [df.drop(columns=['configuration']), df_configuration], axis=1
+    )
+    df.columns = get_column_names(list(df.columns))
+    return df
+
+
+def get_column_names(list_column_name: List[str]) -> List[str]:
+    """Remove the prefix `configuration.` from column names, unless the
+    name without prefix is already used"""
+    set_column_name = set(list_column_name)
+    return [
+        name[len(CONFIGURATION_PREFIX):]
+        if name.startswith(CONFIGURATION_PREFIX)
+        and name[len(CONFIGURATION_PREFIX):] not in set_column_name
+        else name
+        for name in list_column_name
+    ]
@@ -6,7 +6,9 @@
 This module hosts the class generic used to retrieve any AWS Config resource type supported
 """
 import logging
-import json
+from typing import (
+    Optional
+)
 
 import pandas
 
@@ -22,6 +24,8 @@ class generic(ResourceType):
     """Get all resource of a given resource type"""
     def __init__(self, resource_type: str):
         self.resource_type = resource_type
+        self.config_resource_type = resource_type
+        self.config_key_column = "resourceId"
         resource_type_as_array = resource_type.split("::")
         resource_name = "_".join(resource_type_as_array[-2:])
         unknown_value = f"{resource_name}_NOT_IN_CONFIG_AGGREGATOR".upper()
@@ -30,8 +34,13 @@ class generic(ResourceType):
             unknown_value=unknown_value
         )
 
-    def populate(self) -> pandas.DataFrame:
-        """ Retrieves data for a given resource type """
+    def populate(
+        self,
+        captured_after: Optional[float] = None
+    ) -> pandas.DataFrame:
+        """ Retrieves data for a given resource type. If <captured_after> is
+        set, only the resources whose configuration was captured after this
+        timestamp are retrieved """
         logger.debug(
             "[~] Using a generic Config advanced query to retrieve"
             " resource type: %s",
@@ -41,7 +50,7 @@ class generic(ResourceType):
 SELECT
     accountId, awsRegion, resourceId
 WHERE
-    resourceType = '{self.resource_type}'
+    resourceType = '{self.resource_type}'{config_adv.get_capture_time_condition(captured_after)}
     '''
         logger.debug("[~] Submitting Config advanced query")
         results = config_adv.submit_config_advanced_query(
@@ -50,8 +59,6 @@ WHERE
         )
         logger.debug("[~] Converting results to DataFrame")
         assert isinstance(results, list)  # nosec: B101
-        results = pandas.DataFrame(
-            [json.loads(_) for _ in results]
-        )
+        results = config_adv.decode_results(results)
         logger.debug(results)
         return results
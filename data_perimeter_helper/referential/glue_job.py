@@ -7,7 +7,6 @@ This module hosts the class `glue_job` used to retrieve AWS Glue jobs
 functions with AWS Config advanced queries
 """
 import logging
-import json
 
 import pandas
 
@@ -52,15 +51,12 @@ WHERE
         if len(results) == 0:
             return pandas.DataFrame()
         logger.debug("[-] Converting results to DataFrame")
-        df = pandas.DataFrame(
-            [json.loads(_) for _ in results]
-        )
-        df_configuration = pandas.json_normalize(df['configuration'])  # type: ignore
-        if 'DefaultArguments.--disable-proxy-v2' not in df_configuration:
-            df_configuration['DefaultArguments.--disable-proxy-v2'] = "Not set"
-        if 'Connections.Connections' not in df_configuration:
-            df_configuration['Connections.Connections'] = "Not set"
-        df_configuration = df_configuration[
+        df = config_adv.decode_results(results)
+        if 'DefaultArguments.--disable-proxy-v2' not in df:
+            df['DefaultArguments.--disable-proxy-v2'] = "Not set"
+        if 'Connections.Connections' not in df:
+            df['Connections.Connections'] = "Not set"
+        df_configuration = df[
             ['DefaultArguments.--disable-proxy-v2', 'Connections.Connections']
         ]
         df_configuration = df_configuration.rename(
@@ -78,8 +74,6 @@ WHERE
         df_configuration = df_configuration.fillna(pandas.NA).replace(
             {pandas.NA: None}
         )
-        df = pandas.concat([df, df_configuration], axis=1)
-        # Dropping uneeded columns
-        df = df.drop(columns=['configuration'])
+        df = pandas.concat([df[['accountId', 'arn']], df_configuration], axis=1)
         logger.debug("[+] Converting results to DataFrame")
         return df
@@ -10,6 +10,11 @@ import logging
 import json
 import re
 import urllib.parse
+from typing import (
+    Dict,
+    List,
+    Optional
+)
 
 import pandas
 
@@ -24,22 +29,33 @@ regex_service_name = re.compile(r'(.*)\.amazonaws\.com')
 regex_service_linked_role = re.compile(
     r"arn:aws:iam::\d+:role/aws-service-role/.*"
 )
+# Compiled network perimeter human role patterns per configuration
+dict_network_perimeter_human_role_pattern: Dict[str, re.Pattern] = {}
 
 
 class iam_role(ResourceType):
     """All AWS IAM roles"""
     def __init__(self):
+        self.config_resource_type = "AWS::IAM::Role"
+        self.config_key_column = "roleId"
         super().__init__(
             type_name="AWS::IAM::Role",
             unknown_value="IAM_ROLE_NOT_IN_CONFIG_AGGREGATOR"
         )
 
-    def populate(self, *args, **kwargs) -> pandas.DataFrame:
+    def populate(
+        self,
+        *args,
+        captured_after: Optional[float] = None,
+        **kwargs
+    ) -> pandas.DataFrame:
         """ Retrieve all IAM roles inventoried in AWS Config aggregator
     https://github.com/awslabs/aws-config-resource-schema/blob/master/config/properties/resource-types/AWS::IAM::Role.properties.json
+        :param captured_after: if set, only the IAM roles whose configuration
+        was captured after this timestamp are retrieved
         :return: DataFrame with all IAM roles
         """
-        config_query = '''
+        config_query = f'''
 SELECT
     accountId,
     configuration.assumeRolePolicyDocument,
@@ -47,7 +63,7 @@ SELECT
     configuration.arn,
     configuration.tags
 WHERE
-    resourceType = 'AWS::IAM::Role'
+    resourceType = 'AWS::IAM::Role'{config_adv.get_capture_time_condition(captured_after)}
 '''
         logger.debug("[-] Submitting Config advanced query")
         results = config_adv.submit_config_advanced_query(
@@ -57,13 +73,9 @@ WHERE
         logger.debug("[+] Submitting Config advanced query")
         logger.debug("[-] Converting results to DataFrame")
         assert isinstance(results, list)  # nosec: B101
-        df = pandas.DataFrame(
-            [json.loads(_) for _ in results]
-        )
+        df = config_adv.decode_results(results)
         if len(df.index) == 0:
             return df
-        df_configuration = pandas.json_normalize(df['configuration'])  # type: ignore
-        df = pandas.concat([df['accountId'], df_configuration], axis=1)
         logger.debug("[+] Converting results to DataFrame")
         self.detect_duplicate(df)
         logger.debug("[-] Enriching result")
@@ -90,12 +102,9 @@ WHERE
             for arn in df['arn']
         ]
         # Checks if principals are federated
-        df['isNetworkPerimeterHumanRole'] = [
-            iam_role.is_network_perimeter_human_role(account_id, role_arn)
-            for account_id, role_arn in zip(
-                df['accountId'], df['arn']
-            )
-        ]
+        df['isNetworkPerimeterHumanRole'] = iam_role.are_network_perimeter_human_roles(
+            df['accountId'], df['arn']
+        )
         # Dropping uneeded columns
         df = df.drop(columns=['assumeRolePolicyDocument'])
         return df
@@ -243,6 +252,24 @@ WHERE
             return True
         return False
 
+    @staticmethod
+    def get_network_perimeter_human_role_pattern(
+        account_id: str
+    ) -> re.Pattern:
+        """Get the compiled regular expression matching the network perimeter
+        human roles of an account. Patterns are compiled once per distinct
+        configuration"""
+        list_network_perimeter_human_principal = Var.get_account_configuration(
+            account_id=account_id,
+            configuration_key='network_perimeter_human_role_arn'
+        )
+        regex_from_list = "|".join(list_network_perimeter_human_principal)
+        if regex_from_list not in dict_network_perimeter_human_role_pattern:
+            dict_network_perimeter_human_role_pattern[regex_from_list] = re.compile(
+                f"(?i)(?:{regex_from_list})"
+            )
+        return dict_network_perimeter_human_role_pattern[regex_from_list]
+
     @staticmethod
     def is_network_perimeter_human_role(
         account_id: str,
@@ -256,11 +283,36 @@ WHERE
         :return: True if the IAM role is identified as a network perimeter
         human role in the data perimeter helper configuration file.
         """
-        list_network_perimeter_human_principal = Var.get_account_configuration(
-            account_id=account_id,
-            configuration_key='network_perimeter_human_role_arn'
-        )
-        regex_from_list = "|".join(list_network_perimeter_human_principal)
-        if re.search(f"(?i)({regex_from_list})", role_arn):
+        pattern = iam_role.get_network_perimeter_human_role_pattern(account_id)
+        if pattern.search(role_arn):
             return True
         return False
+
+    @staticmethod
+    def are_network_perimeter_human_roles(
+        account_ids: pandas.Series,
+        role_arns: pandas.Series
+    ) -> pandas.Series:
+        """Vectorized version of is_network_perimeter_human_role. Accounts are
+        grouped by configuration and each pattern is applied once to the
+        role ARNs of its accounts.
+
+        :param account_ids: account ID of each IAM role.
+        :param role_arns: ARN of each IAM role.
+        :return: Series set to True for the network perimeter human roles.
+        """
+        result = pandas.Series(False, index=role_arns.index, dtype=bool)
+        dict_account_per_pattern: Dict[re.Pattern, List[str]] = {}
+        for account_id in account_ids.dropna().unique():
+            pattern = iam_role.get_network_perimeter_human_role_pattern(
+                account_id
+            )
+            dict_account_per_pattern.setdefault(pattern, []).append(account_id)
+        for pattern, list_account_id in dict_account_per_pattern.items():
+            is_in_account = account_ids.isin(list_account_id).to_numpy(
+                dtype=bool
+            )
+            result[is_in_account] = role_arns[is_in_account].astype(
+                object
+            ).str.contains(pattern, na=False).to_numpy(dtype=bool)
+        return result
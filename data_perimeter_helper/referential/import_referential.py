@@ -35,6 +35,8 @@ def get_available_resource_type() -> List[Dict[str, str]]:
         'generic',
         'import_referential',
         'Referential',
+        'referential_cache',
+        'ResourceSnapshot',
         'ResourceType',
     ]
     for file in list_file:
@@ -7,7 +7,6 @@ This module hosts the class `lambda_function` used to retrieve AWS Lambda
 functions with AWS Config advanced queries
 """
 import logging
-import json
 
 import pandas
 
@@ -51,12 +50,7 @@ WHERE
         if len(results) == 0:
             return pandas.DataFrame()
         logger.debug("[-] Converting results to DataFrame")
-        results = pandas.DataFrame(
-            [json.loads(_) for _ in results]
-        )
-        results = results.drop(columns='configuration').join(
-            pandas.json_normalize(results['configuration'])  # type: ignore
-        )
+        results = config_adv.decode_results(results)
         results['inVpc'] = [
             True
             if isinstance(list_subnet_id, list) and len(list_subnet_id) > 0
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+'''
+This module hosts functions to read and write the referential cache. The
+cache can be shared by concurrent runs: files are written to a temporary
+path and renamed once complete, the files of resource types are named after
+their checksum and never rewritten in place, and the updates of the metadata
+are serialized by a file lock. Readers do not take the lock. The size and
+modification time of the files are recorded in the metadata, the checksum is
+only verified when they differ, unless `cache_referential_verify_checksum`
+is set
+'''
+import hashlib
+import json
+import logging
+import os
+import uuid
+from contextlib import (
+    contextmanager
+)
+from typing import (
+    Dict,
+    Iterator,
+    Optional,
+    Union
+)
+
+import pandas
+import pyarrow
+from pyarrow import (
+    feather
+)
+
+from data_perimeter_helper.toolbox import (
+    utils,
+    exporter
+)
+from data_perimeter_helper.variables import (
+    Variables as Var
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    import msvcrt
+
+
+logger = logging.getLogger(__name__)
+CHECKSUM_PREFIX_LENGTH = 16
+
+
+def get_metadata_path() -> str:
+    """Get the path of the metadata file of the referential cache"""
+    return f"{Var.cache_folder_path}/metadata.json"
+
+
+def get_temporary_suffix() -> str:
+    """Get a file name suffix unique to the current writer"""
+    return f"_tmp_{os.getpid()}_{uuid.uuid4().hex}"
+
+
+def get_checksum(path: str) -> str:
+    """Get the SHA-256 checksum of a file"""
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+@contextmanager
+def lock_metadata() -> Iterator[None]:
+    """Hold an exclusive lock, shared by all processes, on the metadata of
+    the referential cache"""
+    utils.create_folder(f"{Var.cache_folder_path}/")
+    with open(f"{get_metadata_path()}.lock", 'a+b') as lock_file:
+        if os.name == 'nt':
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == 'nt':
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def write_resource_type(
+    dataframe: pandas.DataFrame,
+    file_name: str
+) -> Dict[str, Union[str, int]]:
+    """Write the resources of a resource type in the format set by
+    `cache_referential_format`. The file is written to a temporary path and
+    then renamed after its checksum. Returns the path, the checksum, the size
+    and the modification time of the file"""
+    export_folder = f"{Var.cache_folder_path}/"
+    temporary_suffix = get_temporary_suffix()
+    temporary_name = f"{file_name}{temporary_suffix}"
+    if Var.cache_referential_format == "parquet":
+        temporary_path = exporter.write_dataframe_to_parquet(
+            dataframe=dataframe,
+            export_folder=export_folder,
+            file_name=temporary_name,
+            file_extension="parquet"
+        )
+    else:
+        temporary_path = exporter.write_dataframe_to_feather(
+            dataframe=dataframe,
+            export_folder=export_folder,
+            file_name=temporary_name,
+            compression="zstd"
+            if Var.cache_referential_format == "feather_zstd"
+            else "uncompressed"
+        )
+    checksum = get_checksum(temporary_path)
+    path = temporary_path.replace(
+        temporary_suffix,
+        f"_{checksum[:CHECKSUM_PREFIX_LENGTH]}"
+    )
+    os.replace(temporary_path, path)
+    logger.debug("[~] Referential cache written to %s", path)
+    file_stat = os.stat(path)
+    return {
+        'path': path,
+        'checksum': checksum,
+        'size': file_stat.st_size,
+        'mtime_ns': file_stat.st_mtime_ns
+    }
+
+
+def update_metadata(
+    dict_metadata: Dict[str, Dict[str, Union[str, float]]]
+) -> None:
+    """Merge the metadata of the exported resource types into the metadata
+    file. The metadata file is read, updated and renamed under the lock, so
+    the updates of concurrent runs are not lost. The files of the replaced
+    resource types are deleted"""
+    with lock_metadata():
+        try:
+            metadata = utils.read_json_file(get_metadata_path())
+        except FileNotFoundError:
+            logger.debug("No cache metadata found.")
+            metadata = {}
+        list_replaced_path = [
+            str(metadata[resource_type]['path'])
+            for resource_type, resource_metadata in dict_metadata.items()
+            if resource_type in metadata
+            and metadata[resource_type].get('path')
+            != resource_metadata['path']
+        ]
+        metadata.update(dict_metadata)
+        temporary_name = f"metadata{get_temporary_suffix()}"
+        if not exporter.write_to_file(
+            export_folder=f"{Var.cache_folder_path}/",
+            file_name=temporary_name,
+            file_extension="json",
+            content=json.dumps(
+                metadata,
+                indent=4,
+                sort_keys=True
+            )
+        ):
+            return
+        os.replace(
+            f"{Var.cache_folder_path}/{temporary_name}.json",
+            get_metadata_path()
+        )
+    # Runs which read the previous metadata fall back to AWS APIs if a file
+    # is deleted before they read it
+    for path in list_replaced_path:
+        try:
+            os.remove(path)
+        except OSError:
+            logger.debug("[!] Unable to delete cache file %s", path)
+
+
+def is_unchanged(
+    path: str,
+    resource_type_metadata: Dict[str, Union[str, float]]
+) -> bool:
+    """Return True if the size and the modification time of a cache file
+    match the metadata. Metadata written without them are never matched"""
+    file_stat = os.stat(path)
+    return resource_type_metadata.get('size') == file_stat.st_size\
+        and resource_type_metadata.get('mtime_ns') == file_stat.st_mtime_ns
+
+
+def read_resource_type(
+    resource_type_metadata: Dict[str, Union[str, float]]
+) -> Optional[Union[pandas.DataFrame, pyarrow.Table]]:
+    """Read the cache file of a resource type. Arrow IPC files are
+    memory-mapped and returned as a pyarrow Table, Parquet files are read as
+    a DataFrame. The checksum of the file is verified if its size or
+    modification time differs from the metadata, or if
+    `cache_referential_verify_checksum` is set. Returns None if the file is
+    missing or if its checksum does not match the metadata"""
+    path = str(resource_type_metadata['path'])
+    expected_checksum = resource_type_metadata.get('checksum')
+    try:
+        verify_checksum = Var.cache_referential_verify_checksum is True\
+            or not is_unchanged(path, resource_type_metadata)
+        if expected_checksum is not None and verify_checksum\
+                and get_checksum(path) != expected_checksum:
+            logger.warning(
+                "[!] Checksum mismatch for referential cache file [%s], the "
+                "cache of this resource type is ignored",
+                path
+            )
+            return None
+        if path.endswith(".feather"):
+            return feather.read_table(path, memory_map=True)
+        return pandas.read_parquet(path)
+    except FileNotFoundError:
+        logger.debug("[!] Referential cache file %s not found", path)
+        return None
@@ -7,7 +7,6 @@ This module hosts the class `sagemaker_notebook` used to retrieve Amazon
 SageMaker notebook.
 """
 import logging
-import json
 
 import pandas
 
@@ -53,14 +52,7 @@ WHERE
         if len(results) == 0:
             return pandas.DataFrame()
         logger.debug("[-] Converting results to DataFrame")
-        df = pandas.DataFrame(
-            [json.loads(_) for _ in results]
-        )
-        df_configuration = pandas.json_normalize(df['configuration'])  # type: ignore
-
-        df = pandas.concat([df, df_configuration], axis=1)
-        # Dropping uneeded columns
-        df = df.drop(columns=['configuration'])
+        df = config_adv.decode_results(results)
         df = df.fillna(value="Not set")
         logger.debug("[+] Converting results to DataFrame")
         return df
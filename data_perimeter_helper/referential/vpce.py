@@ -6,7 +6,6 @@
 This module hosts the class `vpce` used to retrieve Amazon EC2 VPC endpoints
 through AWS Config advanced queries
 """
-import json
 import logging
 from typing import (
     Optional
@@ -31,6 +30,8 @@ class vpce(ResourceType):
     ):
         self.resource_type = resource_type.lower()
         self.service_name: Optional[str] = None
+        self.config_resource_type = "AWS::EC2::VPCEndpoint"
+        self.config_key_column = "vpcEndpointId"
         if "aws::ec2::vpcendpoint::" in self.resource_type:
             resource_type_as_array = self.resource_type.split("::")
             self.service_name = resource_type_as_array[-1]
@@ -40,8 +41,13 @@ class vpce(ResourceType):
             unknown_value="VPCE_NOT_IN_CONFIG_AGGREGATOR"
         )
 
-    def populate(self) -> pandas.DataFrame:
+    def populate(
+        self,
+        captured_after: Optional[float] = None
+    ) -> pandas.DataFrame:
         """ Retrieve all VPC endpoint inventoried in AWS Config aggregator
+        :param captured_after: if set, only the VPC endpoints whose
+        configuration was captured after this timestamp are retrieved
         :return: DataFrame with all VPC endpoints
         Configuration element is retrieved from Config
         https://github.com/awslabs/aws-config-resource-schema/blob/master/config/properties/resource-types/AWS::EC2::VPCEndpoint.properties.json
@@ -54,6 +60,7 @@ class vpce(ResourceType):
     configuration.policyDocument
 WHERE
     resourceType = 'AWS::EC2::VPCEndpoint'"""
+        config_query += config_adv.get_capture_time_condition(captured_after)
         if self.service_name is not None:
             config_query += f"""
     AND configuration.serviceName LIKE 'com.amazonaws.%.{self.service_name.lower()}'"""
@@ -65,13 +72,6 @@ WHERE
         logger.debug("[+] Submitting Config advanced query")
         logger.debug("[-] Converting results to DataFrame")
         assert isinstance(results, list)  # nosec: B101
-        results = pandas.DataFrame(
-            [json.loads(_) for _ in results]
-        )
-        if len(results.index) == 0:
-            return results
-        results = pandas.json_normalize(
-            results['configuration']  # type: ignore
-        )
+        results = config_adv.decode_results(results)
         logger.debug("[+] Converting results to DataFrame")
         return results
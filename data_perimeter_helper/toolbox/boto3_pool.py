@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+This module hosts functions to share boto3 sessions and clients across the
+tool. boto3 sessions are not thread-safe and are kept per thread, clients are
+thread-safe and are shared by all threads
+"""
+import logging
+import threading
+from typing import (
+    Dict,
+    Optional,
+    Tuple
+)
+
+import boto3
+import awswrangler as wr
+from botocore.client import (
+    BaseClient
+)
+from botocore.config import (
+    Config
+)
+
+
+logger = logging.getLogger(__name__)
+# botocore default size of the connection pool of a client
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+max_pool_connections = DEFAULT_MAX_POOL_CONNECTIONS
+thread_local = threading.local()
+lock = threading.Lock()
+shared_session: Dict[Tuple[Optional[str], Optional[str]], boto3.session.Session] = {}
+shared_client: Dict[Tuple[str, Optional[str], Optional[str]], BaseClient] = {}
+
+
+def configure(nb_worker: int) -> None:
+    """Align the size of the connection pools of the clients with the number
+    of workers using them, including clients created by AWS SDK for pandas"""
+    global max_pool_connections  # pylint: disable=global-statement
+    max_pool_connections = max(DEFAULT_MAX_POOL_CONNECTIONS, nb_worker)
+    wr.config.botocore_config = Config(
+        max_pool_connections=max_pool_connections
+    )
+    logger.debug("[~] boto3 connection pool size: %s", max_pool_connections)
+
+
+def get_session(
+    profile_name: Optional[str],
+    region_name: Optional[str]
+) -> boto3.session.Session:
+    """Get the boto3 session of the current thread for a given profile and
+    region"""
+    if not hasattr(thread_local, "sessions"):
+        thread_local.sessions = {}
+    key = (profile_name, region_name)
+    if key not in thread_local.sessions:
+        thread_local.sessions[key] = boto3.session.Session(
+            profile_name=profile_name,
+            region_name=region_name
+        )
+    return thread_local.sessions[key]
+
+
+def get_client(
+    service_name: str,
+    profile_name: Optional[str],
+    region_name: Optional[str],
+    config: Optional[Config] = None
+) -> BaseClient:
+    """Get the client shared by all threads for a given service, profile and
+    region. <config> is only used when the client is created"""
+    key = (service_name, profile_name, region_name)
+    with lock:
+        if key in shared_client:
+            return shared_client[key]
+        session_key = (profile_name, region_name)
+        if session_key not in shared_session:
+            shared_session[session_key] = boto3.session.Session(
+                profile_name=profile_name,
+                region_name=region_name
+            )
+        client_config = Config(max_pool_connections=max_pool_connections)
+        if config is not None:
+            client_config = client_config.merge(config)
+        client = shared_session[session_key].client(
+            service_name,
+            config=client_config
+        )
+        shared_client[key] = client
+    return client
@@ -297,6 +297,8 @@ def parse_data_processing(data_processing: str) -> tuple[List[str], List[str]]:
         if "add_column" in instruction:
             if instruction in ADD_COLUMN_DOCUMENTATION:
                 list_add_column.append(ADD_COLUMN_DOCUMENTATION[instruction])
+            elif instruction.startswith("self.add_column_role_attributes("):
+                list_add_column.extend(re.findall(r"'(\w+)'", instruction))
     if len(list_add_column) > 0:
         list_add_column = [f"`{add_column}`" for add_column in list_add_column]
         str_added_column = ", ".join(list_add_column)
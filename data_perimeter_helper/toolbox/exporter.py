@@ -20,6 +20,9 @@ from typing import (
 )
 
 import pandas
+from pyarrow import (
+    feather
+)
 from jinja2 import (
     Environment,
     FileSystemLoader
@@ -188,7 +191,7 @@ def export_list_dataframe_to_excel(
     utils.create_folder(export_folder)
     full_path = f"{export_folder}{account_id}_data_perimeter.xlsx"
     logger.debug("[~] Exporting dataframes as Excel file to [%s]", full_path)
-    list_sql_queries: List[Dict[str, str]] = []
+    list_sql_queries: List[Dict[str, Union[str, int, None]]] = []
     try:
         with pandas.ExcelWriter(full_path) as writer:
             for item in list_items:
@@ -201,7 +204,8 @@ def export_list_dataframe_to_excel(
                     list_sql_queries.append({
                         "QueryName": item['name'],
                         "AthenaSQLQuery": item['query'],
-                        "ExecTime": item.get('exec_time')
+                        "ExecTime": item.get('exec_time'),
+                        **item.get('statistics', {})
                     })
             if len(list_sql_queries) > 0:
                 write_dataframe_to_excel(
@@ -276,6 +280,28 @@ def export_list_dataframe_to_json(
         )
 
 
+def export_run_statistics(
+    list_statistics: List[Dict],
+    export_folder: Optional[str] = None,
+) -> bool:
+    """Exports the execution statistics of the queries of a run to a JSON
+    file"""
+    export_folder = export_folder or Var.result_export_folder
+    return write_to_file(
+        export_folder=export_folder,
+        file_name="run_statistics",
+        file_extension="json",
+        content=json.dumps(
+            {
+                'RunDate': datetime.now().isoformat(),
+                'Queries': list_statistics
+            },
+            indent=4,
+            default=str
+        )
+    )
+
+
 def write_dataframe_to_parquet(
     dataframe: pandas.DataFrame,
     export_folder: str,
@@ -295,3 +321,26 @@ def write_dataframe_to_parquet(
         compression='gzip'
     )
     return path
+
+
+def write_dataframe_to_feather(
+    dataframe: pandas.DataFrame,
+    export_folder: str,
+    file_name: str,
+    compression: str = "uncompressed"
+) -> str:
+    """Write a pandas Dataframe to an Arrow IPC (Feather) file. Uncompressed
+    files can be memory-mapped when read"""
+    utils.create_folder(export_folder)
+    file_name = re.sub(
+        '[^0-9a-zA-Z]+',
+        '_',
+        file_name
+    )[0:120].lower()
+    path = f"{export_folder}{file_name}.feather"
+    feather.write_feather(
+        dataframe,
+        path,
+        compression=compression
+    )
+    return path
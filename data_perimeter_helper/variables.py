@@ -20,14 +20,14 @@ from pathlib import (
     Path
 )
 
-import boto3
 from botocore.config import Config
 from tqdm import (
     tqdm
 )
 
 from data_perimeter_helper.toolbox import (
-    utils
+    utils,
+    boto3_pool
 )
 
 
@@ -72,12 +72,79 @@ class Variables:
     external_access_findings: Optional[Literal['SECURITY_HUB', 'IAM_ACCESS_ANALYZER']] = None
     # AWS Config aggregator name
     config_aggregator_name = None
+    '''
+    config_nb_shard = 4
+        Config advanced queries are split by account into config_nb_shard
+        shards with a similar number of resources, shards are paginated
+        concurrently
+    config_max_requests_per_second = 5
+        Maximum number of requests per second sent to AWS Config across all
+        shards. Set to 0 to disable the rate limiter
+    '''
+    config_nb_shard = 1
+    config_max_requests_per_second = 5
     # Athena Workgroup name
     athena_workgroup = None
     # Athena database name
     athena_database = None
     athena_ctas_approach = False
     '''
+    athena_fuse_accounts = True
+        Queries whose statements only differ by the selected account are
+        submitted as a single Athena query per batch of
+        athena_fuse_accounts_batch_size accounts, results are then split
+        back per account. Not applied to the accounts with an
+        athena_sql_limit in the data perimeter configuration
+    '''
+    athena_fuse_accounts = False
+    athena_fuse_accounts_batch_size = 50
+    '''
+    athena_async_engine = True
+        Athena queries are started without blocking a thread and tracked by
+        a single poller, up to athena_max_concurrent_queries queries run at
+        the same time. Not used if athena_ctas_approach is True
+    '''
+    athena_async_engine = False
+    athena_max_concurrent_queries = 20
+    '''
+    athena_incremental_partitions = True
+        Athena queries are performed per day partition, results of days
+        ended for more than 12 hours, the CloudTrail delivery delay, are
+        stored under cache_folder_path. Later runs only query the days not
+        stored yet and merge the request counts across days. Not applied to
+        the accounts with an athena_sql_limit in the data perimeter
+        configuration
+    '''
+    athena_incremental_partitions = False
+    '''
+    athena_staging_table = True
+        The CloudTrail columns referenced by the selected queries are
+        materialized once per run in a Parquet table, queries are then
+        performed against this table. The table is dropped at the end of the
+        run
+    '''
+    athena_staging_table = False
+    '''
+    schedule_queries_by_history = True
+        The Athena runtime and bytes scanned of each query per account are
+        persisted under cache_folder_path, queries expected to be the longest
+        are submitted first
+    '''
+    schedule_queries_by_history = False
+    '''
+    athena_chunksize = 100000
+        Athena results are read by chunks of athena_chunksize rows, the data
+        processing of queries is applied chunk by chunk. Set to 0 to read
+        results at once
+    '''
+    athena_chunksize = 0
+    '''
+    compact_result_dtypes = True
+        Repetitive columns of query results are stored as categoricals and
+        other string columns as Arrow-backed strings to reduce memory usage
+    '''
+    compact_result_dtypes = False
+    '''
     athena_cloudtrail_table_configuration = UNIQUE
         Athena queries will be performed against the table name provided by
         athena_table_name_mgmt_data_event
@@ -145,6 +212,41 @@ class Variables:
     list_resource_type_to_cache: List[str] = []
     cache_expire_after_interval = None
     cache_expire_after_in_second = None
+    '''
+    cache_referential_format = parquet
+        The referential is cached as gzip compressed Parquet files
+    cache_referential_format = feather | feather_zstd
+        The referential is cached as Arrow IPC (Feather) files, uncompressed
+        or compressed with zstd. Uncompressed files are memory-mapped and
+        only the columns used by lookups are converted to pandas
+    '''
+    cache_referential_format = "parquet"
+    '''
+    cache_referential_verify_checksum = True
+        The checksum of a cache file of a resource type is verified each time
+        the file is read. Otherwise the checksum is only verified if the size
+        or modification time of the file differs from the metadata
+    '''
+    cache_referential_verify_checksum = False
+    '''
+    cache_incremental_refresh = True
+        When the cache of a resource type retrieved from AWS Config expires,
+        only the resources captured since its generation are retrieved and
+        merged into the cache. Deleted resources are removed from the cache
+        every cache_deletion_reconciliation_after_in_hour hours
+    '''
+    cache_incremental_refresh = False
+    cache_deletion_reconciliation_after_in_hour = 24
+    '''
+    cache_athena_results = True
+        Results of Athena queries on a date window ended for more than 12
+        hours, the delay of delivery of CloudTrail events, are cached
+        under cache_folder_path and reused by later runs. The least recently
+        used results are deleted when the cache exceeds
+        cache_athena_results_max_size_in_mb
+    '''
+    cache_athena_results = False
+    cache_athena_results_max_size_in_mb = 1024
 
     def __init__(
         self,
@@ -179,11 +281,12 @@ class Variables:
     @classmethod
     def init_boto3_var(cls):
         """Init boto3 clients and sessions"""
-        cls.session_config = boto3.session.Session(
+        boto3_pool.configure(nb_worker=cls.thread_max_worker)
+        cls.session_config = boto3_pool.get_session(
             profile_name=cls.profile_config_access,
             region_name=cls.region
         )
-        cls.session_org = boto3.session.Session(
+        cls.session_org = boto3_pool.get_session(
             profile_name=cls.profile_org_access,
             region_name=cls.region
         )
@@ -192,15 +295,21 @@ class Variables:
                 'max_attempts': 15
             }
         )
-        cls.config_client = cls.session_config.client("config")
-        cls.org_client = cls.session_org.client(
+        cls.config_client = boto3_pool.get_client(
+            "config",
+            profile_name=cls.profile_config_access,
+            region_name=cls.region
+        )
+        cls.org_client = boto3_pool.get_client(
             "organizations",
+            profile_name=cls.profile_org_access,
+            region_name=cls.region,
             config=client_config_bump_max_attemps
         )
         if cls.external_access_findings in (
             'SECURITY_HUB', 'IAM_ACCESS_ANALYZER'
         ):
-            cls.session_iam_aa = boto3.session.Session(
+            cls.session_iam_aa = boto3_pool.get_session(
                 profile_name=cls.profile_iam_access_analyzer,
                 region_name=cls.region
             )
@@ -236,9 +345,9 @@ class Variables:
         cls,
         key: str,
         var_file: dict,
-        default: Optional[Union[str, bool]] = None,
+        default: Optional[Union[str, bool, int]] = None,
         mandatory: bool = False
-    ) -> Union[str, bool, None]:
+    ) -> Union[str, bool, int, None]:
         """Set a given class variables identified by its `key`. Check first
         the environment variables, then the configuration file and finally the
         default value"""
@@ -276,9 +385,40 @@ class Variables:
         cls.set_var("external_access_findings", var_file, default=False)
         cls.set_var("profile_iam_access_analyzer", var_file)
         cls.set_var("config_aggregator_name", var_file, mandatory=True)
+        cls.set_var("config_nb_shard", var_file, default=1)
+        cls.config_nb_shard = int(cls.config_nb_shard)
+        # Not set with `set_var` as 0, which disables the limit, is falsy
+        config_max_requests_per_second = utils.get_env_var(
+            "config_max_requests_per_second"
+        )
+        if config_max_requests_per_second is None:
+            config_max_requests_per_second = var_file.get(
+                "config_max_requests_per_second"
+            )
+        if config_max_requests_per_second is None:
+            config_max_requests_per_second = 5
+        cls.config_max_requests_per_second = float(
+            config_max_requests_per_second
+        )
         cls.set_var("athena_workgroup", var_file, mandatory=True)
         cls.set_var("athena_database", var_file, mandatory=True)
         cls.set_var("athena_ctas_approach", var_file, default=False)
+        cls.set_var("athena_fuse_accounts", var_file, default=False)
+        cls.set_var("athena_fuse_accounts_batch_size", var_file, default=50)
+        cls.athena_fuse_accounts_batch_size = int(
+            cls.athena_fuse_accounts_batch_size
+        )
+        cls.set_var("athena_async_engine", var_file, default=False)
+        cls.set_var("athena_max_concurrent_queries", var_file, default=20)
+        cls.athena_max_concurrent_queries = int(
+            cls.athena_max_concurrent_queries
+        )
+        cls.set_var("athena_incremental_partitions", var_file, default=False)
+        cls.set_var("athena_staging_table", var_file, default=False)
+        cls.set_var("schedule_queries_by_history", var_file, default=False)
+        cls.set_var("athena_chunksize", var_file, default=0)
+        cls.athena_chunksize = int(cls.athena_chunksize)
+        cls.set_var("compact_result_dtypes", var_file, default=False)
         cls.set_var(
             "athena_cloudtrail_table_configuration",
             var_file,
@@ -312,6 +452,13 @@ class Variables:
                 logger.debug("Metadata cache: %s", cls.cache_metadata)
             except FileNotFoundError:
                 logger.debug("Cache metadata not found")
+        cls.set_var("cache_athena_results", var_file, False)
+        cls.set_var(
+            "cache_athena_results_max_size_in_mb", var_file, default=1024
+        )
+        cls.cache_athena_results_max_size_in_mb = int(
+            cls.cache_athena_results_max_size_in_mb
+        )
         cls.set_var("list_resource_type_to_cache", var_file)
         if isinstance(cls.list_resource_type_to_cache, str):
             cls.list_resource_type_to_cache = [cls.list_resource_type_to_cache]
@@ -338,6 +485,25 @@ class Variables:
                 raise ValueError(
                     f"Invalid unit {unit} for cache_expire_after in {variable_file_path}"
                 )
+        cls.set_var("cache_referential_format", var_file, default="parquet")
+        if cls.cache_referential_format not in (
+            "parquet", "feather", "feather_zstd"
+        ):
+            raise ValueError(
+                f"Invalid cache_referential_format {cls.cache_referential_format}"
+                f" in {variable_file_path}, supported values are: parquet,"
+                " feather, feather_zstd"
+            )
+        cls.set_var(
+            "cache_referential_verify_checksum", var_file, default=False
+        )
+        cls.set_var("cache_incremental_refresh", var_file, default=False)
+        cls.set_var(
+            "cache_deletion_reconciliation_after_in_hour", var_file, default=24
+        )
+        cls.cache_deletion_reconciliation_after_in_hour = int(
+            cls.cache_deletion_reconciliation_after_in_hour
+        )
 
     @staticmethod
     def read_date_interval(
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+This module hosts functions to test the local cache of Athena query results
+"""
+import context
+from datetime import (
+    datetime,
+    timezone
+)
+
+import pandas
+import pytest
+from data_perimeter_helper.queries import (
+    athena_cache,
+    incremental
+)
+from data_perimeter_helper.queries.StagingTable import (
+    StagingTable
+)
+from data_perimeter_helper.variables import (
+    Variables as Var
+)
+
+
+QUERY = "SELECT eventname FROM \"{table}\" WHERE p_date >= '2024/01/01'"
+
+
+@pytest.fixture
+def cache_enabled(monkeypatch, tmp_path):
+    """Enable the cache of Athena results on a closed date window"""
+    monkeypatch.setattr(Var, "cache_athena_results", True)
+    monkeypatch.setattr(Var, "cache_folder_path", str(tmp_path))
+    monkeypatch.setattr(Var, "partition_date_regex", None)
+    monkeypatch.setattr(Var, "partition_date_start", "2024/01/01")
+    monkeypatch.setattr(Var, "partition_date_end", "2024/01/31")
+    monkeypatch.setattr(Var, "athena_workgroup", "primary")
+    monkeypatch.setattr(StagingTable, "table_name", None)
+
+
+def test_cache_key_is_stable(cache_enabled):
+    cache_key = athena_cache.get_cache_key(QUERY.format(table="cloudtrail"))
+    assert cache_key is not None
+    assert cache_key == athena_cache.get_cache_key(
+        QUERY.format(table="cloudtrail")
+    )
+    assert cache_key != athena_cache.get_cache_key(
+        QUERY.format(table="cloudtrail").replace("2024/01/01", "2024/01/02")
+    )
+
+
+def test_cache_key_depends_on_athena_configuration(cache_enabled, monkeypatch):
+    query = QUERY.format(table="cloudtrail")
+    cache_key = athena_cache.get_cache_key(query)
+    monkeypatch.setattr(Var, "athena_workgroup", "other")
+    assert athena_cache.get_cache_key(query) != cache_key
+    monkeypatch.setattr(Var, "athena_workgroup", "primary")
+    monkeypatch.setattr(Var, "partition_date_end", "2024/01/30")
+    assert athena_cache.get_cache_key(query) != cache_key
+
+
+def test_cache_key_ignores_staging_table_name(cache_enabled, monkeypatch):
+    monkeypatch.setattr(StagingTable, "table_name", "dph_staging_run_1")
+    cache_key = athena_cache.get_cache_key(
+        QUERY.format(table="dph_staging_run_1")
+    )
+    monkeypatch.setattr(StagingTable, "table_name", "dph_staging_run_2")
+    assert cache_key == athena_cache.get_cache_key(
+        QUERY.format(table="dph_staging_run_2")
+    )
+
+
+def test_cache_key_none_if_not_cacheable(cache_enabled, monkeypatch):
+    query = QUERY.format(table="cloudtrail")
+    monkeypatch.setattr(Var, "partition_date_end", "2999/01/01")
+    assert athena_cache.get_cache_key(query) is None
+    monkeypatch.setattr(Var, "partition_date_end", "2024/01/31")
+    monkeypatch.setattr(Var, "partition_date_regex", "2024/01/.*")
+    assert athena_cache.get_cache_key(query) is None
+    monkeypatch.setattr(Var, "partition_date_regex", None)
+    monkeypatch.setattr(Var, "cache_athena_results", False)
+    assert athena_cache.get_cache_key(query) is None
+
+
+def get_datetime_class(now: datetime):
+    """Get a datetime class returning <now> as current time"""
+    class frozen_datetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now
+    return frozen_datetime
+
+
+def test_window_ending_yesterday_closed_after_delivery_lag(
+    cache_enabled,
+    monkeypatch
+):
+    query = QUERY.format(table="cloudtrail")
+    monkeypatch.setattr(Var, "partition_date_end", "2024/02/01")
+    monkeypatch.setattr(incremental, "datetime", get_datetime_class(
+        datetime(2024, 2, 2, 0, 5, tzinfo=timezone.utc)
+    ))
+    assert athena_cache.get_cache_key(query) is None
+    monkeypatch.setattr(incremental, "datetime", get_datetime_class(
+        datetime(2024, 2, 2, 11, 59, tzinfo=timezone.utc)
+    ))
+    assert athena_cache.get_cache_key(query) is None
+    monkeypatch.setattr(incremental, "datetime", get_datetime_class(
+        datetime(2024, 2, 2, 12, 0, tzinfo=timezone.utc)
+    ))
+    assert athena_cache.get_cache_key(query) is not None
+
+
+def test_cached_result_round_trip(cache_enabled):
+    cache_key = athena_cache.get_cache_key(QUERY.format(table="cloudtrail"))
+    assert athena_cache.read_cached_result(cache_key) is None
+    dataframe = pandas.DataFrame({
+        'eventname': ['GetObject', 'PutObject'],
+        'nb_reqs': [1, 2]
+    })
+    athena_cache.write_cached_result(cache_key, dataframe)
+    assert athena_cache.has_cached_result(cache_key)
+    pandas.testing.assert_frame_equal(
+        athena_cache.read_cached_result(cache_key), dataframe
+    )
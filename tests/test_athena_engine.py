@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+This module hosts functions to test the adaptive concurrency of the Athena
+engine
+"""
+import context
+from collections import (
+    deque
+)
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor
+)
+from threading import (
+    Timer
+)
+from time import (
+    monotonic
+)
+
+import pytest
+import awswrangler as wr
+from botocore.exceptions import (
+    ClientError
+)
+from data_perimeter_helper.main import (
+    wait_queries
+)
+from data_perimeter_helper.queries.Query import (
+    Query
+)
+from data_perimeter_helper.queries.AthenaEngine import (
+    AthenaEngine
+)
+from data_perimeter_helper.variables import (
+    Variables as Var
+)
+
+
+THROTTLING_ERROR = ClientError(
+    {'Error': {'Code': 'TooManyRequestsException'}}, 'StartQueryExecution'
+)
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    """Reset the state of the Athena engine"""
+    monkeypatch.setattr(Var, "athena_max_concurrent_queries", 4)
+    monkeypatch.setattr(AthenaEngine, "queued", deque())
+    monkeypatch.setattr(AthenaEngine, "running", {})
+    monkeypatch.setattr(AthenaEngine, "concurrency_limit", None)
+    monkeypatch.setattr(AthenaEngine, "nb_throttling", 0)
+    monkeypatch.setattr(AthenaEngine, "backoff_until", 0.0)
+    monkeypatch.setattr(AthenaEngine, "BACKOFF_BASE_DELAY", 0.0)
+
+
+def test_throttling_halves_concurrency_limit(engine):
+    with AthenaEngine.condition:
+        AthenaEngine.decrease_concurrency_limit()
+    assert AthenaEngine.get_concurrency_limit() == 2
+    with AthenaEngine.condition:
+        for _ in range(20):
+            AthenaEngine.increase_concurrency_limit()
+    assert AthenaEngine.get_concurrency_limit() == 4
+
+
+def test_throttled_start_fails_after_max_retries(engine, monkeypatch):
+    list_call = []
+
+    def start_query_execution(**kwargs):
+        list_call.append(kwargs['sql'])
+        raise THROTTLING_ERROR
+
+    monkeypatch.setattr(wr.athena, "start_query_execution", start_query_execution)
+    monkeypatch.setattr(AthenaEngine, "MAX_THROTTLING_RETRIES", 3)
+    future: Future = Future()
+    AthenaEngine.queued.append(("SELECT 1", [], future, 0))
+    for _ in range(10):
+        if future.done():
+            break
+        AthenaEngine.start_queued_queries(None)
+        assert AthenaEngine.get_concurrency_limit() >= 1
+    assert len(list_call) == 4
+    assert future.exception() is THROTTLING_ERROR
+    assert len(AthenaEngine.queued) == 0
+
+
+def test_throttled_start_is_retried(engine, monkeypatch):
+    list_error = [THROTTLING_ERROR]
+
+    def start_query_execution(**kwargs):
+        if len(list_error) > 0:
+            raise list_error.pop()
+        return "query-execution-id"
+
+    monkeypatch.setattr(wr.athena, "start_query_execution", start_query_execution)
+    future: Future = Future()
+    AthenaEngine.queued.append(("SELECT 1", [], future, 0))
+    AthenaEngine.start_queued_queries(None)
+    assert AthenaEngine.queued[0][3] == 1
+    AthenaEngine.start_queued_queries(None)
+    assert AthenaEngine.running == {"query-execution-id": future}
+
+
+def test_throttled_read_fails_after_max_retries(engine, monkeypatch):
+    list_call = []
+
+    def read_sql_query(**kwargs):
+        list_call.append(kwargs['sql'])
+        raise THROTTLING_ERROR
+
+    monkeypatch.setattr(wr.athena, "read_sql_query", read_sql_query)
+    monkeypatch.setattr(AthenaEngine, "MAX_THROTTLING_RETRIES", 3)
+    with pytest.raises(ClientError):
+        Query.read_sql_query_with_backoff({'sql': "SELECT 1"})
+    assert len(list_call) == 4
+
+
+class query_test:
+    """Query whose processing returns the account ID, or fails for the
+    account `failing`"""
+    def submit_query_with_statistics(self, account_id):
+        if account_id == "failing":
+            raise RuntimeError("query failed")
+        return {'query': account_id}
+
+
+def get_item(account_id: str, step: str):
+    """Get a query submitted to the pool at a given step"""
+    return {
+        'account_id': account_id,
+        'query_name': "query_test",
+        'instance': query_test(),
+        'step': step,
+        'start_time': 0.0
+    }
+
+
+def test_wait_queries_processes_started_queries(engine):
+    athena_query: Future = Future()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        dict_pending = {
+            executor.submit(lambda: athena_query): [
+                get_item("111111111111", "start")
+            ],
+            executor.submit(lambda: athena_query): [
+                get_item("222222222222", "start")
+            ],
+            executor.submit(lambda: None): [get_item("333333333333", "start")],
+        }
+        Timer(0.5, athena_query.set_result, args=[{}]).start()
+        list_account_id = [
+            result['query'] for _, result in wait_queries(
+                executor, dict_pending
+            )
+        ]
+    assert list_account_id[0] == "333333333333"
+    assert sorted(list_account_id) == [
+        "111111111111", "222222222222", "333333333333"
+    ]
+
+
+def test_wait_queries_fails_fast(engine):
+    athena_query: Future = Future()
+    queued_query: Future = Future()
+    AthenaEngine.queued.append(("SELECT 2", [], queued_query, 0))
+    # Resolved late so that a regression does not block the test
+    timer = Timer(10, athena_query.set_result, args=[{}])
+    timer.start()
+    start_time = monotonic()
+    try:
+        with pytest.raises(RuntimeError):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                dict_pending = {
+                    athena_query: [get_item("111111111111", "athena")],
+                    executor.submit(
+                        query_test().submit_query_with_statistics, "failing"
+                    ): [get_item("failing", "process")],
+                }
+                for _ in wait_queries(executor, dict_pending):
+                    pass
+    finally:
+        timer.cancel()
+    assert monotonic() - start_time < 5
+    assert queued_query.cancelled()
+    assert len(AthenaEngine.queued) == 0
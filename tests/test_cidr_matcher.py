@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+This module hosts functions to test the matching of IP addresses against
+CIDRs
+"""
+import context
+import random
+from ipaddress import (
+    ip_address,
+    ip_network
+)
+
+import pandas
+from data_perimeter_helper.queries.CidrMatcher import (
+    CidrMatcher
+)
+
+
+def is_in_cidr_reference(value, list_cidr) -> bool:
+    """Reference implementation with the ipaddress module"""
+    try:
+        address = ip_address(value)
+    except (ValueError, TypeError):
+        return False
+    return any(
+        address in ip_network(cidr) for cidr in list_cidr
+        if ip_network(cidr).version == address.version
+    )
+
+
+def test_match_against_reference():
+    list_cidr = [
+        "10.0.0.0/8", "10.1.0.0/16", "172.16.0.0/12", "192.168.1.0/24",
+        "192.168.2.0/24", "203.0.113.7/32", "0.0.0.0/32", "2001:db8::/32",
+    ]
+    generator = random.Random(0)
+    list_value = [
+        str(ip_address(generator.getrandbits(32))) for _ in range(2000)
+    ] + [
+        "10.255.255.255", "11.0.0.0", "192.168.2.255", "192.168.3.0",
+        "203.0.113.7", "203.0.113.8", "0.0.0.0", "255.255.255.255",
+        "2001:db8::1", "2001:db9::1", "s3.amazonaws.com", "010.0.0.1",
+        "1.2.3", None,
+    ]
+    values = pandas.Series(list_value, dtype=object)
+    is_match = CidrMatcher(list_cidr).match(values)
+    assert is_match.tolist() == [
+        is_in_cidr_reference(value, list_cidr) for value in list_value
+    ]
+
+
+def test_overlapping_cidrs_are_merged():
+    matcher = CidrMatcher(["10.0.0.0/24", "10.0.0.128/25", "10.0.1.0/24", "invalid"])
+    assert matcher.starts.tolist() == [int(ip_address("10.0.0.0"))]
+    assert matcher.ends.tolist() == [int(ip_address("10.0.1.255"))]
+
+
+def test_match_with_precomputed_integers():
+    values = pandas.Series(["10.0.0.1", "8.8.8.8", None], dtype=object)
+    matcher = CidrMatcher(["10.0.0.0/8"])
+    ipv4 = CidrMatcher.ipv4_to_int(values)
+    assert matcher.match(values, ipv4).tolist() == [True, False, False]
+    assert CidrMatcher([]).match(values).tolist() == [False, False, False]
+
+
+def test_is_public():
+    values = pandas.Series(
+        ["10.0.0.1", "8.8.8.8", "s3.amazonaws.com", None, "2001:4860::1"],
+        dtype=object
+    )
+    assert CidrMatcher.is_public(values).tolist() == [
+        False, True, False, False, True
+    ]
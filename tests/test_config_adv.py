@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+This module hosts functions to test the AWS Config advanced queries
+"""
+import context
+import json
+
+import pandas
+import pytest
+# Imported first, as by the package, as variables and helper import each other
+from data_perimeter_helper.queries import (  # noqa: F401
+    helper
+)
+from data_perimeter_helper.referential import (
+    config_adv
+)
+from data_perimeter_helper.variables import (
+    Variables as Var
+)
+
+
+QUERY = """SELECT
+    arn,
+    accountId
+where
+    resourceType = 'AWS::S3::Bucket'
+    OR resourceType = 'AWS::SQS::Queue'
+"""
+DICT_COUNT = {
+    '111111111111': 50,
+    '222222222222': 30,
+    '333333333333': 20,
+    '444444444444': 10,
+}
+
+
+@pytest.fixture
+def list_query(monkeypatch):
+    """Answer the aggregation query with the number of resources per
+    account, return the list of submitted queries"""
+    monkeypatch.setattr(Var, "config_nb_shard", 2)
+    list_query = []
+
+    def paginate_config_advanced_query(query, limit):
+        list_query.append(query)
+        return [
+            json.dumps({'accountId': account_id, 'COUNT(*)': count})
+            for account_id, count in DICT_COUNT.items()
+        ]
+
+    monkeypatch.setattr(
+        config_adv,
+        "paginate_config_advanced_query",
+        paginate_config_advanced_query
+    )
+    return list_query
+
+
+def test_account_shards_are_balanced(list_query):
+    list_shard = config_adv.get_account_shards(QUERY, 100)
+    assert list_shard == [
+        ['111111111111', '444444444444'],
+        ['222222222222', '333333333333'],
+    ]
+    assert list_query == ["""SELECT accountId, COUNT(*)
+WHERE
+    (resourceType = 'AWS::S3::Bucket'
+    OR resourceType = 'AWS::SQS::Queue')
+GROUP BY accountId"""]
+
+
+def test_query_not_sharded(list_query, monkeypatch):
+    assert config_adv.get_account_shards(
+        "SELECT arn, accountId", 100
+    ) is None
+    assert config_adv.get_account_shards(
+        QUERY + "    AND accountId IN ('111111111111')", 100
+    ) is None
+    assert config_adv.get_account_shards(
+        QUERY + "GROUP BY accountId", 100
+    ) is None
+    assert config_adv.get_account_shards(
+        QUERY + "    AND accountId='111111111111'", 100
+    ) is None
+    assert config_adv.get_account_shards(
+        QUERY + "    AND accountId IN('111111111111')", 100
+    ) is None
+    monkeypatch.setattr(Var, "config_nb_shard", 1)
+    assert config_adv.get_account_shards(QUERY, 100) is None
+    assert list_query == []
+
+
+def test_shard_query_keeps_original_condition():
+    assert config_adv.get_shard_query(
+        QUERY, ['111111111111', '222222222222']
+    ) == """SELECT
+    arn,
+    accountId
+WHERE
+    (resourceType = 'AWS::S3::Bucket'
+    OR resourceType = 'AWS::SQS::Queue')
+    AND accountId IN ('111111111111', '222222222222')"""
+
+
+def test_shard_query_length_is_bounded(list_query, monkeypatch):
+    monkeypatch.setattr(config_adv, "MAX_EXPRESSION_LENGTH", 160)
+    list_shard = config_adv.get_account_shards(QUERY, 100)
+    assert list_shard is not None
+    assert len(list_shard) == 4
+    for list_account_id in list_shard:
+        assert len(config_adv.get_shard_query(
+            QUERY, list_account_id
+        )) <= config_adv.MAX_EXPRESSION_LENGTH
+
+
+def test_rate_limit_disabled(monkeypatch):
+    monkeypatch.setattr(Var, "config_max_requests_per_second", 0.0)
+    monkeypatch.setattr(config_adv, "next_request_time", 0.0)
+    config_adv.wait_rate_limit()
+    assert config_adv.next_request_time == 0.0
+
+
+LIST_ROLE = [
+    {
+        'arn': 'arn:aws:iam::111111111111:role/a',
+        'accountId': '111111111111',
+        'resourceType': 'AWS::IAM::Role',
+        'configuration': {
+            'roleId': 'AROA1',
+            'path': '/',
+            'roleLastUsed': {'region': 'eu-west-1'},
+        },
+        'tags': [{'key': 'team', 'value': 'a'}],
+    },
+    {
+        'arn': 'arn:aws:iam::222222222222:role/b',
+        'accountId': '222222222222',
+        'resourceType': 'AWS::IAM::Role',
+        'configuration': {
+            'roleId': 'AROA2',
+            'path': '/service-role/',
+        },
+        'tags': [],
+    },
+]
+
+
+def test_decode_results_matches_json():
+    list_result = [json.dumps(item) for item in LIST_ROLE]
+    df = config_adv.decode_results(list_result)
+    assert df['roleId'].tolist() == ['AROA1', 'AROA2']
+    assert df['roleLastUsed.region'].tolist()[0] == 'eu-west-1'
+    assert df['tags'].tolist() == [[{'key': 'team', 'value': 'a'}], []]
+    pandas.testing.assert_frame_equal(
+        df,
+        config_adv.decode_results_with_json(list_result),
+        check_like=True
+    )
+
+
+def test_decode_results_heterogeneous_items():
+    # A field decoded as a string and as an object cannot be parsed in bulk
+    list_result = [json.dumps(item) for item in LIST_ROLE] + [json.dumps({
+        'arn': 'arn:aws:iam::333333333333:role/c',
+        'accountId': '333333333333',
+        'resourceType': 'AWS::IAM::Role',
+        'configuration': {'roleId': 'AROA3', 'path': {'value': '/'}},
+    })]
+    df = config_adv.decode_results(list_result)
+    assert df['roleId'].tolist() == ['AROA1', 'AROA2', 'AROA3']
+    pandas.testing.assert_frame_equal(
+        df, config_adv.decode_results_with_json(list_result)
+    )
+
+
+def test_decode_results_without_configuration():
+    list_result = [
+        json.dumps({'resourceId': 'bucket-a', 'accountId': '111111111111'}),
+        json.dumps({'resourceId': 'bucket-b', 'accountId': '222222222222'}),
+    ]
+    pandas.testing.assert_frame_equal(
+        config_adv.decode_results(list_result),
+        config_adv.decode_results_with_json(list_result)
+    )
+    assert len(config_adv.decode_results([]).index) == 0
+
+
+def test_decode_results_keeps_date_like_strings():
+    list_result = [json.dumps(item) for item in LIST_ROLE] + [json.dumps({
+        'arn': 'arn:aws:iam::333333333333:role/c',
+        'accountId': '333333333333',
+        'resourceType': 'AWS::IAM::Role',
+        'configuration': {
+            'roleId': 'AROA3',
+            'path': '/',
+            'roleLastUsed': {'lastUsedDate': '2024-05-06T10:00:00Z'},
+            'createDate': '2024-05-06T10:00:00Z',
+        },
+        'tags': [{'key': 'created', 'value': '2024-01-01'}],
+    })]
+    df = config_adv.decode_results(list_result)
+    assert df['createDate'].tolist()[2] == '2024-05-06T10:00:00Z'
+    assert df['roleLastUsed.lastUsedDate'].tolist()[2] == '2024-05-06T10:00:00Z'
+    assert df['tags'].tolist()[2] == [{'key': 'created', 'value': '2024-01-01'}]
+    pandas.testing.assert_frame_equal(
+        df, config_adv.decode_results_with_json(list_result)
+    )
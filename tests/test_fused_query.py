@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+This module hosts functions to test the fusion of per-account Athena queries
+"""
+import context
+import pandas
+from data_perimeter_helper.queries import (
+    helper
+)
+from data_perimeter_helper.queries.FusedQuery import (
+    FusedQuery
+)
+from data_perimeter_helper.queries.Query import (
+    Query
+)
+from data_perimeter_helper.variables import (
+    Variables as Var
+)
+
+
+ACCOUNT_A = "111111111111"
+ACCOUNT_B = "222222222222"
+ACCOUNT_C = "333333333333"
+ACCOUNT_D = "444444444444"
+
+
+def get_statement(account_id: str) -> str:
+    """Get a statement following the layout of data perimeter helper queries"""
+    return f"""-- Query: test_query | {account_id}
+SELECT
+    eventname,
+    count(*) as nb_reqs
+FROM "__ATHENA_TABLE_NAME_PLACEHOLDER__"
+WHERE
+    p_account = '{account_id}'
+    AND useridentity.accountid = '{account_id}'
+GROUP BY
+    eventname
+"""
+
+
+def test_normalize_account_statement():
+    normalized_a = helper.athena_normalize_account_statement(
+        get_statement(ACCOUNT_A), [], ACCOUNT_A
+    )
+    normalized_b = helper.athena_normalize_account_statement(
+        get_statement(ACCOUNT_B), [], ACCOUNT_B
+    )
+    assert normalized_a is not None
+    assert normalized_a == normalized_b
+    assert ACCOUNT_A not in normalized_a
+    assert "__ATHENA_ACCOUNT_PARTITION_PLACEHOLDER__" in normalized_a
+    assert "useridentity.accountid = p_account" in normalized_a
+
+
+def test_normalize_account_statement_not_fusable():
+    # The account ID is part of a parameter
+    assert helper.athena_normalize_account_statement(
+        get_statement(ACCOUNT_A), [f"arn:aws:iam::{ACCOUNT_A}:root"], ACCOUNT_A
+    ) is None
+    # The account ID is part of a regular expression
+    statement = get_statement(ACCOUNT_A).replace(
+        "GROUP BY",
+        f"    AND regexp_like(requestparameters, ':{ACCOUNT_A}:')\nGROUP BY"
+    )
+    assert helper.athena_normalize_account_statement(
+        statement, [], ACCOUNT_A
+    ) is None
+    # The statement is not filtered on the account partition
+    assert helper.athena_normalize_account_statement(
+        get_statement(ACCOUNT_A), [], ACCOUNT_B
+    ) is None
+
+
+def test_fused_statement():
+    normalized_statement = helper.athena_normalize_account_statement(
+        get_statement(ACCOUNT_A), [], ACCOUNT_A
+    )
+    fused_query = FusedQuery(
+        "test_query", [ACCOUNT_A, ACCOUNT_B], normalized_statement, []
+    )
+    assert f"p_account IN ('{ACCOUNT_A}','{ACCOUNT_B}')" in fused_query.statement
+    assert "SELECT\n    p_account,\n" in fused_query.statement
+    assert fused_query.statement.rstrip().endswith("eventname,\n    p_account")
+
+
+def test_fused_result_split_per_account():
+    normalized_statement = helper.athena_normalize_account_statement(
+        get_statement(ACCOUNT_A), [], ACCOUNT_A
+    )
+    fused_query = FusedQuery(
+        "test_query", [ACCOUNT_A, ACCOUNT_B, ACCOUNT_C], normalized_statement, []
+    )
+    list_call = []
+
+    def function_execute(statement, params, account_label):
+        list_call.append(account_label)
+        return statement, pandas.DataFrame({
+            'p_account': [ACCOUNT_A, ACCOUNT_B, ACCOUNT_A],
+            'eventname': ['GetObject', 'PutObject', 'ListBucket'],
+            'nb_reqs': [1, 2, 3],
+        })
+
+    _, result_a = fused_query.get_result(ACCOUNT_A, function_execute)
+    _, result_b = fused_query.get_result(ACCOUNT_B, function_execute)
+    _, result_c = fused_query.get_result(ACCOUNT_C, function_execute)
+    assert len(list_call) == 1
+    assert list(result_a.columns) == ['eventname', 'nb_reqs']
+    assert result_a['eventname'].tolist() == ['GetObject', 'ListBucket']
+    assert result_b['nb_reqs'].tolist() == [2]
+    assert list(result_c.columns) == ['eventname', 'nb_reqs']
+    assert len(result_c.index) == 0
+
+
+class fused_query_test(Query):
+    """Query generating statements which cannot be fused for ACCOUNT_C and
+    ACCOUNT_D"""
+    def __init__(self, name):
+        super().__init__(name, [])
+
+    def generate_athena_statement(self, account_id):
+        statement = get_statement(account_id)
+        if account_id in (ACCOUNT_C, ACCOUNT_D):
+            # Layout not supported by `helper.athena_add_column_to_statement`
+            statement = statement.replace("SELECT\n", "SELECT DISTINCT\n")
+        return statement, []
+
+
+def test_plan_fused_queries_falls_back_per_statement(monkeypatch):
+    monkeypatch.setattr(helper, "get_athena_sql_limit", lambda account_id: 0)
+    monkeypatch.setattr(Var, "athena_fuse_accounts_batch_size", 10)
+    query = fused_query_test("fused_query_test")
+    try:
+        # The statement of ACCOUNT_C and ACCOUNT_D is planned first and cannot
+        # be fused
+        nb_query_saved = query.plan_fused_queries([
+            ACCOUNT_C, ACCOUNT_D, ACCOUNT_A, ACCOUNT_B
+        ])
+    finally:
+        Query.queries.pop("fused_query_test", None)
+    assert nb_query_saved == 1
+    assert ACCOUNT_C not in query.fused_queries
+    assert ACCOUNT_D not in query.fused_queries
+    assert query.fused_queries[ACCOUNT_A] is query.fused_queries[ACCOUNT_B]
+
+
+def test_plan_fused_queries_skips_accounts_with_sql_limit(monkeypatch, caplog):
+    monkeypatch.setattr(
+        helper,
+        "get_athena_sql_limit",
+        lambda account_id: 250 if account_id == ACCOUNT_B else 0
+    )
+    monkeypatch.setattr(helper, "set_feature_skipped_by_sql_limit", set())
+    query = fused_query_test("fused_query_test")
+    try:
+        for _ in range(2):
+            nb_query_saved = query.plan_fused_queries([
+                ACCOUNT_A, ACCOUNT_B, ACCOUNT_C
+            ])
+    finally:
+        Query.queries.pop("fused_query_test", None)
+    assert nb_query_saved == 0
+    assert query.fused_queries == {}
+    assert len([
+        record for record in caplog.records
+        if "athena_sql_limit" in record.getMessage()
+    ]) == 1
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+This module hosts functions to test the incremental processing of Athena
+queries per day partition
+"""
+import context
+from datetime import (
+    datetime,
+    timezone
+)
+
+import pandas
+import pytest
+from data_perimeter_helper.queries import (
+    helper,
+    incremental
+)
+from data_perimeter_helper.queries.Query import (
+    Query
+)
+from data_perimeter_helper.variables import (
+    Variables as Var
+)
+
+
+def get_datetime_class(now: datetime):
+    """Get a datetime class returning <now> as current time"""
+    class frozen_datetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now
+    return frozen_datetime
+
+
+def test_merge_days_sums_request_counts():
+    day_1 = pandas.DataFrame({
+        'principal_arn': ['role/a', 'role/b', None],
+        'eventname': ['GetObject', 'GetObject', 'PutObject'],
+        'nb_reqs': [1, 2, 3]
+    })
+    day_2 = pandas.DataFrame({
+        'principal_arn': ['role/a', None, 'role/c'],
+        'eventname': ['GetObject', 'PutObject', 'GetObject'],
+        'nb_reqs': [10, 20, 30]
+    })
+    result = incremental.merge_days([day_1, pandas.DataFrame(), day_2])
+    assert list(result.columns) == ['principal_arn', 'eventname', 'nb_reqs']
+    assert sorted(
+        result.astype(object).where(result.notna(), None).itertuples(
+            index=False, name=None
+        ),
+        key=str
+    ) == sorted([
+        ('role/a', 'GetObject', 11),
+        ('role/b', 'GetObject', 2),
+        (None, 'PutObject', 23),
+        ('role/c', 'GetObject', 30),
+    ], key=str)
+
+
+def test_merge_days_without_count_column():
+    day_1 = pandas.DataFrame({'bucketname': ['a', 'b']})
+    day_2 = pandas.DataFrame({'bucketname': ['b', 'c']})
+    result = incremental.merge_days([day_1, day_2])
+    assert result['bucketname'].tolist() == ['a', 'b', 'c']
+    assert len(incremental.merge_days([]).index) == 0
+
+
+def test_list_partition_day(monkeypatch):
+    monkeypatch.setattr(Var, "partition_date_start", "2024/02/27")
+    monkeypatch.setattr(Var, "partition_date_end", "2024/03/01")
+    assert incremental.get_list_partition_day() == [
+        "2024/02/27", "2024/02/28", "2024/02/29", "2024/03/01"
+    ]
+
+
+@pytest.mark.parametrize("now, first_open_day", [
+    (datetime(2024, 3, 10, 23, 0, tzinfo=timezone.utc), "2024/03/10"),
+    (datetime(2024, 3, 10, 11, 0, tzinfo=timezone.utc), "2024/03/09"),
+])
+def test_first_open_day_includes_delivery_lag(monkeypatch, now, first_open_day):
+    monkeypatch.setattr(incremental, "datetime", get_datetime_class(now))
+    assert incremental.get_first_open_day() == first_open_day
+
+
+def test_only_closed_days_are_stored(monkeypatch, tmp_path):
+    monkeypatch.setattr(Var, "cache_folder_path", str(tmp_path))
+    monkeypatch.setattr(
+        incremental, "datetime",
+        get_datetime_class(datetime(2024, 3, 10, 6, 0, tzinfo=timezone.utc))
+    )
+    list_day = ["2024/03/07", "2024/03/08", "2024/03/09", "2024/03/10"]
+    result = pandas.DataFrame({
+        'p_date': ["2024/03/07", "2024/03/09", "2024/03/10"],
+        'eventname': ['GetObject', 'GetObject', 'PutObject'],
+        'nb_reqs': [1, 2, 3]
+    })
+    stored = incremental.store_days("key", list_day, result)
+    assert 'p_date' not in stored.columns
+    # 2024/03/09 ended 6 hours ago, its events may not be delivered yet
+    assert incremental.get_list_day_to_query("key", list_day) == [
+        "2024/03/09", "2024/03/10"
+    ]
+    list_stored = incremental.read_stored_days(
+        "key", ["2024/03/07", "2024/03/08"]
+    )
+    assert list_stored[0]['nb_reqs'].tolist() == [1]
+    assert len(list_stored[1].index) == 0
+
+
+class incremental_query_test(Query):
+    """Query selecting the requests of an account"""
+    def __init__(self, name):
+        super().__init__(name, [])
+
+    def generate_athena_statement(self, account_id):
+        return f"""SELECT eventname, count(*) as nb_reqs
+FROM "__ATHENA_TABLE_NAME_PLACEHOLDER__"
+WHERE p_account = '{account_id}'
+GROUP BY eventname
+""", []
+
+
+def test_accounts_with_sql_limit_not_incremental(monkeypatch, caplog):
+    monkeypatch.setattr(Var, "athena_incremental_partitions", True)
+    monkeypatch.setattr(Var, "partition_date_regex", None)
+    monkeypatch.setattr(helper, "get_athena_sql_limit", lambda account_id: 250)
+    monkeypatch.setattr(helper, "set_feature_skipped_by_sql_limit", set())
+    query = incremental_query_test("incremental_query_test")
+    try:
+        for account_id in ["111111111111", "222222222222"]:
+            assert query.prepare_incremental_athena_query(
+                account_id, query.generate_athena_statement
+            ) is None
+    finally:
+        Query.queries.pop("incremental_query_test", None)
+    assert len([
+        record for record in caplog.records
+        if "athena_sql_limit" in record.getMessage()
+    ]) == 1
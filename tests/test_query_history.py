@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+This module hosts functions to test the history of query runtimes used to
+schedule queries
+"""
+import context
+import pytest
+from data_perimeter_helper.queries import (
+    query_history
+)
+from data_perimeter_helper.variables import (
+    Variables as Var
+)
+
+
+def get_statistics(result_source: str, queue_time: int, engine_time: int):
+    """Get the statistics attached to a query result"""
+    return {
+        'ResultSource': result_source,
+        'QueryQueueTimeInMillis': queue_time,
+        'EngineExecutionTimeInMillis': engine_time,
+        'DataScannedInBytes': 1000,
+        'AthenaClientTimeInMillis': 5,
+        'LocalProcessingTimeInMillis': 5,
+    }
+
+
+@pytest.fixture
+def empty_history(monkeypatch, tmp_path):
+    """Start from an empty history stored in a temporary folder"""
+    monkeypatch.setattr(Var, "cache_folder_path", str(tmp_path))
+    monkeypatch.setattr(query_history, "history", {})
+
+
+def test_record_athena_runtime(empty_history):
+    query_history.record(
+        "query", "111111111111", get_statistics('athena', 1000, 9000)
+    )
+    assert query_history.get_expected_runtime(
+        "query", "111111111111"
+    ) == 10000
+    query_history.record(
+        "query", "111111111111", get_statistics('athena', 0, 2000)
+    )
+    assert query_history.get_expected_runtime(
+        "query", "111111111111"
+    ) == 6000
+
+
+@pytest.mark.parametrize("result_source", ['cache', 'incremental'])
+def test_results_not_from_athena_not_recorded(empty_history, result_source):
+    query_history.record(
+        "query", "111111111111", get_statistics('athena', 1000, 9000)
+    )
+    query_history.record(
+        "query", "111111111111", get_statistics(result_source, None, None)
+    )
+    assert query_history.get_expected_runtime(
+        "query", "111111111111"
+    ) == 10000
+
+
+def test_history_saved_and_loaded(empty_history):
+    query_history.record(
+        "query", "111111111111", get_statistics('athena', 0, 4000)
+    )
+    query_history.record(
+        "query", "222222222222", get_statistics('athena', 0, 2000)
+    )
+    query_history.save()
+    query_history.history = {}
+    query_history.load()
+    assert query_history.get_expected_runtime("query", "222222222222") == 2000
+    assert query_history.get_expected_runtime("other", "111111111111") is None
+    assert query_history.get_default_runtime() == 3000
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+This module hosts functions to test the reading and writing of the
+referential cache
+"""
+import context
+import importlib
+import os
+
+import pandas
+import pyarrow
+import pytest
+# Imported first, as by the package, as variables and helper import each other
+from data_perimeter_helper.queries import (  # noqa: F401
+    helper
+)
+from data_perimeter_helper.referential import (
+    import_referential,
+    referential_cache
+)
+from data_perimeter_helper.toolbox import (
+    utils
+)
+from data_perimeter_helper.variables import (
+    Variables as Var
+)
+
+
+DATAFRAME = pandas.DataFrame({
+    'arn': ['arn:role/a', 'arn:role/b'],
+    'accountId': ['111111111111', '222222222222'],
+})
+
+
+@pytest.fixture(params=["parquet", "feather", "feather_zstd"])
+def cache_folder(request, monkeypatch, tmp_path):
+    """Write the referential cache in a temporary folder"""
+    monkeypatch.setattr(Var, "cache_folder_path", str(tmp_path))
+    monkeypatch.setattr(Var, "cache_referential_format", request.param)
+    monkeypatch.setattr(Var, "cache_referential_verify_checksum", False)
+    return tmp_path
+
+
+def read_dataframe(resource_type_metadata) -> pandas.DataFrame:
+    """Read the cache file of a resource type as a DataFrame"""
+    cache = referential_cache.read_resource_type(resource_type_metadata)
+    assert cache is not None
+    if isinstance(cache, pyarrow.Table):
+        return cache.to_pandas()
+    return cache
+
+
+def test_every_referential_module_has_its_class():
+    for file in import_referential.get_available_resource_type():
+        module = importlib.import_module(file['module_path'])
+        assert hasattr(module, file['file_name']), file['file_name']
+
+
+def test_write_and_read(cache_folder):
+    metadata = referential_cache.write_resource_type(DATAFRAME, "AWS_IAM_Role")
+    assert os.path.basename(str(metadata['path'])).startswith(
+        f"aws_iam_role_{str(metadata['checksum'])[:16]}"
+    )
+    assert metadata['size'] == os.stat(metadata['path']).st_size
+    pandas.testing.assert_frame_equal(read_dataframe(metadata), DATAFRAME)
+    assert [
+        path.name for path in cache_folder.iterdir()
+    ] == [os.path.basename(str(metadata['path']))]
+
+
+def test_checksum_only_verified_on_change(cache_folder, monkeypatch):
+    metadata = referential_cache.write_resource_type(DATAFRAME, "AWS_IAM_Role")
+    list_path = []
+
+    def get_checksum(path):
+        list_path.append(path)
+        return metadata['checksum']
+
+    monkeypatch.setattr(referential_cache, "get_checksum", get_checksum)
+    read_dataframe(metadata)
+    assert list_path == []
+    monkeypatch.setattr(Var, "cache_referential_verify_checksum", True)
+    read_dataframe(metadata)
+    assert list_path == [metadata['path']]
+    # Metadata written before the size and modification time were recorded
+    monkeypatch.setattr(Var, "cache_referential_verify_checksum", False)
+    read_dataframe({
+        'path': metadata['path'], 'checksum': metadata['checksum']
+    })
+    assert len(list_path) == 2
+
+
+def test_tampered_file_is_ignored(cache_folder):
+    metadata = referential_cache.write_resource_type(DATAFRAME, "AWS_IAM_Role")
+    with open(metadata['path'], 'ab') as file:
+        file.write(b'tampered')
+    assert referential_cache.read_resource_type(metadata) is None
+    assert referential_cache.read_resource_type({
+        **metadata, 'path': f"{cache_folder}/missing.parquet"
+    }) is None
+
+
+def test_update_metadata(cache_folder):
+    first = referential_cache.write_resource_type(DATAFRAME, "AWS_IAM_Role")
+    other = referential_cache.write_resource_type(DATAFRAME, "AWS_S3_Bucket")
+    referential_cache.update_metadata({
+        'AWS::IAM::Role': first, 'AWS::S3::Bucket': other
+    })
+    second = referential_cache.write_resource_type(
+        DATAFRAME.iloc[:1], "AWS_IAM_Role"
+    )
+    referential_cache.update_metadata({'AWS::IAM::Role': second})
+    metadata = utils.read_json_file(referential_cache.get_metadata_path())
+    assert metadata == {'AWS::IAM::Role': second, 'AWS::S3::Bucket': other}
+    assert not os.path.exists(first['path'])
+    assert len(read_dataframe(metadata['AWS::IAM::Role']).index) == 1
+    assert sorted(path.name for path in cache_folder.iterdir()) == sorted([
+        os.path.basename(str(second['path'])),
+        os.path.basename(str(other['path'])),
+        "metadata.json",
+        "metadata.json.lock",
+    ])
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+This module hosts functions to test the removal of resource exceptions from
+query results
+"""
+import context
+import pandas
+# Imported first, as by the package, as variables and helper import each other
+from data_perimeter_helper.queries import (  # noqa: F401
+    helper
+)
+from data_perimeter_helper.queries import (
+    resource_exception
+)
+
+
+DATAFRAME = pandas.DataFrame({
+    'bucketname': ['bucket-a', 'bucket-a', 'bucket-a', 'bucket-b', None],
+    'principal_arn': [
+        'arn:aws:iam::111111111111:role/admin',
+        'arn:aws:iam::111111111111:role/app',
+        None,
+        'arn:aws:iam::111111111111:role/admin',
+        'arn:aws:iam::111111111111:role/admin',
+    ],
+    'sourceipaddress': [
+        '10.0.0.1', '192.168.1.1', '10.0.0.2', '10.0.0.1', '10.0.0.1'
+    ],
+}, index=[5, 6, 7, 8, 9])
+
+
+def compile_exceptions(conf: dict, list_exception_type: list) -> dict:
+    """Compile the exceptions of each resource"""
+    return {
+        resource_name: resource_exception.compile_resource_exception(
+            exceptions, list_exception_type
+        )
+        for resource_name, exceptions in conf.items()
+    }
+
+
+def test_keep_mask_regular_expression():
+    compiled = compile_exceptions(
+        {'bucket-a': {'identity_perimeter_trusted_principal': [':role/admin$']}},
+        ['identity_perimeter_trusted_principal']
+    )
+    keep = resource_exception.get_keep_mask(DATAFRAME, 'bucketname', compiled)
+    assert keep.index.tolist() == DATAFRAME.index.tolist()
+    # Exceptions only apply to the rows of their resource
+    assert keep.tolist() == [False, True, True, True, True]
+
+
+def test_keep_mask_any_exception_of_a_resource():
+    compiled = compile_exceptions(
+        {
+            'bucket-a': {
+                'network_perimeter_trusted_principal': [':role/app$'],
+                'network_perimeter_expected_public_cidr': ['10.0.0.0/31'],
+            },
+            'bucket-b': {
+                'network_perimeter_expected_public_cidr': ['10.0.0.0/24'],
+            },
+        },
+        [
+            'network_perimeter_trusted_principal',
+            'network_perimeter_expected_public_cidr'
+        ]
+    )
+    keep = resource_exception.get_keep_mask(DATAFRAME, 'bucketname', compiled)
+    assert keep.tolist() == [False, False, True, False, True]
+
+
+def test_keep_mask_ignores_other_exception_types():
+    compiled = compile_exceptions(
+        {'bucket-a': {'identity_perimeter_trusted_principal': ['.*']}},
+        ['network_perimeter_trusted_principal']
+    )
+    assert compiled == {'bucket-a': []}
+    keep = resource_exception.get_keep_mask(DATAFRAME, 'bucketname', compiled)
+    assert keep.all()
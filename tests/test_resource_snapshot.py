@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+This module hosts functions to test the frozen snapshots of resource types
+"""
+import context
+from concurrent.futures import (
+    ThreadPoolExecutor
+)
+
+import numpy
+import pandas
+import pyarrow
+import pytest
+from data_perimeter_helper.referential import (
+    import_referential
+)
+from data_perimeter_helper.referential.ResourceSnapshot import (
+    ResourceSnapshot
+)
+
+
+DATAFRAME = pandas.DataFrame({
+    'arn': ['arn:role/a', 'arn:role/b', None, 'arn:role/a'],
+    'accountId': ['111111111111', '222222222222', '111111111111', '333333333333'],
+})
+
+
+def test_referential_auto_import_skips_snapshot():
+    list_file_name = [
+        file['file_name']
+        for file in import_referential.get_available_resource_type()
+    ]
+    assert 'ResourceSnapshot' not in list_file_name
+    assert 'iam_role' in list_file_name
+
+
+def test_lookup_index():
+    snapshot = ResourceSnapshot("Test::IAM::Role", dataframe=DATAFRAME)
+    index = snapshot.get_lookup_index('arn')
+    assert set(index.keys()) == {'arn:role/a', 'arn:role/b'}
+    assert index['arn:role/a'].tolist() == [0, 3]
+    assert snapshot.get_lookup_index('arn') is index
+    with pytest.raises(TypeError):
+        index['arn:role/c'] = [2]  # type: ignore
+    with pytest.raises(ValueError):
+        index['arn:role/a'][0] = 1
+
+
+def test_lookup_index_of_empty_snapshot():
+    snapshot = ResourceSnapshot(
+        "Test::IAM::Role", dataframe=DATAFRAME.iloc[0:0]
+    )
+    assert len(snapshot.get_lookup_index('arn')) == 0
+
+
+def test_attribute_map_keeps_first_match():
+    snapshot = ResourceSnapshot("Test::IAM::Role", dataframe=DATAFRAME)
+    attribute_map = snapshot.get_attribute_map('arn', 'accountId')
+    assert attribute_map.to_dict() == {
+        'arn:role/a': '111111111111',
+        'arn:role/b': '222222222222',
+    }
+    assert attribute_map.isna().sum() == 0
+    assert snapshot.get_attribute_map('arn', 'missing').isna().all()
+
+
+def test_table_columns_converted_lazily():
+    snapshot = ResourceSnapshot(
+        "Test::IAM::Role",
+        table=pyarrow.Table.from_pandas(DATAFRAME, preserve_index=False)
+    )
+    assert snapshot.nb_row == 4
+    assert snapshot.has_column('accountId')
+    assert snapshot.get_lookup_index('accountId')['111111111111'].tolist() == [0, 2]
+    assert list(snapshot.columns.keys()) == ['accountId']
+    assert snapshot.materialized_dataframe is None
+    pandas.testing.assert_frame_equal(snapshot.dataframe, DATAFRAME)
+
+
+def test_concurrent_readers_share_one_index():
+    snapshot = ResourceSnapshot(
+        "Test::IAM::Role",
+        table=pyarrow.Table.from_pandas(DATAFRAME, preserve_index=False)
+    )
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list_index = list(executor.map(
+            lambda _: snapshot.get_lookup_index('arn'), range(32)
+        ))
+    assert all(index is list_index[0] for index in list_index)
+
+
+def test_take_converts_only_selected_rows():
+    snapshot = ResourceSnapshot(
+        "Test::IAM::Role",
+        table=pyarrow.Table.from_pandas(DATAFRAME, preserve_index=False)
+    )
+    for positions in [[3, 0], [1], []]:
+        pandas.testing.assert_frame_equal(
+            snapshot.take(numpy.array(positions, dtype="int64")),
+            DATAFRAME.iloc[positions]
+        )
+    assert snapshot.materialized_dataframe is None
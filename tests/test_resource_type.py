@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+This module hosts functions to test the lookups on resource types
+"""
+import context
+import pandas
+import pyarrow
+import pytest
+# Imported first, as by the package, as variables and helper import each other
+from data_perimeter_helper.queries import (  # noqa: F401
+    helper
+)
+from data_perimeter_helper.referential.ResourceType import (
+    ResourceType
+)
+from data_perimeter_helper.variables import (
+    Variables as Var
+)
+
+
+class resource_type_test(ResourceType):
+    """Resource type populated with three IAM roles, two with the same
+    account ID"""
+    def __init__(self):
+        super().__init__("Test::IAM::Role")
+        self.nb_populate = 0
+
+    def populate(self, *args, **kwargs) -> pandas.DataFrame:
+        self.nb_populate += 1
+        return pandas.DataFrame({
+            'arn': ['arn:role/a', 'arn:role/b', 'arn:role/c'],
+            'accountId': ['111111111111', '222222222222', '111111111111'],
+            'tags': [{'team': 'a'}, None, {'team': 'c'}],
+        })
+
+
+@pytest.fixture
+def resource_type(monkeypatch):
+    """Get a resource type populated without cache"""
+    monkeypatch.setattr(Var, "cache_referential", False)
+    resource_type = resource_type_test()
+    yield resource_type
+    ResourceType.registry.pop(resource_type.type_name_lower, None)
+
+
+@pytest.fixture
+def resource_type_from_table(monkeypatch):
+    """Get a resource type loaded from a memory-mapped cache"""
+    monkeypatch.setattr(Var, "cache_referential", False)
+    resource_type = resource_type_test()
+    resource_type.table = pyarrow.Table.from_pandas(
+        resource_type.populate(), preserve_index=False
+    )
+    yield resource_type
+    ResourceType.registry.pop(resource_type.type_name_lower, None)
+
+
+def test_lookup(resource_type):
+    assert resource_type.lookup('arn:role/z', 'arn') == "RESOURCE_NOT_IN_REFERENTIAL"
+    result = resource_type.lookup('111111111111', 'accountId')
+    assert result['arn'].tolist() == ['arn:role/a', 'arn:role/c']
+    assert resource_type.exists('arn:role/b', 'arn')
+    assert not resource_type.exists('arn:role/z', 'arn')
+
+
+def test_lookup_many_keeps_value_order(resource_type):
+    result = resource_type.lookup_many(
+        ['arn:role/c', 'arn:role/z', 'arn:role/a'], 'arn'
+    )
+    assert result['arn'].tolist() == ['arn:role/c', 'arn:role/a']
+    result = resource_type.lookup_many(['222222222222', '111111111111'], 'accountId')
+    assert result['arn'].tolist() == ['arn:role/b', 'arn:role/a', 'arn:role/c']
+    assert len(resource_type.lookup_many(['arn:role/z'], 'arn').index) == 0
+
+
+def test_attribute_value(resource_type):
+    assert resource_type.attribute_value(
+        'arn:role/a', 'arn', 'accountId'
+    ) == '111111111111'
+    assert resource_type.attribute_value(
+        'arn:role/z', 'arn', 'accountId'
+    ) == "RESOURCE_NOT_IN_REFERENTIAL"
+    assert resource_type.attribute_value(
+        'arn:role/a', 'arn', 'missing_column'
+    ) is pandas.NA
+    assert resource_type.attribute_list(
+        '111111111111', 'accountId', 'arn'
+    ) == ['arn:role/a', 'arn:role/c']
+
+
+def test_map_attribute_value_matches_attribute_value(resource_type):
+    lookup_values = pandas.Series(
+        ['arn:role/b', None, 'arn:role/z', 'arn:role/a', 'arn:role/b'],
+        index=[10, 11, 12, 13, 14]
+    )
+    for attribute in ['accountId', 'tags']:
+        result = resource_type.map_attribute_value(
+            lookup_values, 'arn', attribute
+        )
+        assert result.index.tolist() == [10, 11, 12, 13, 14]
+        assert result.tolist() == [
+            resource_type.attribute_value(value, 'arn', attribute)
+            for value in lookup_values
+        ]
+    assert resource_type.nb_populate == 1
+
+
+def test_exists_many(resource_type):
+    assert resource_type.exists_many(
+        ['arn:role/c', 'arn:role/z', None], 'arn'
+    ).tolist() == [True, False, False]
+
+
+def test_lookups_on_table_do_not_convert_all_columns(
+    resource_type,
+    resource_type_from_table
+):
+    values = ['arn:role/c', 'arn:role/z', 'arn:role/a']
+    pandas.testing.assert_frame_equal(
+        resource_type_from_table.lookup_many(values, 'arn'),
+        resource_type.lookup_many(values, 'arn')
+    )
+    pandas.testing.assert_frame_equal(
+        resource_type_from_table.lookup('111111111111', 'accountId'),
+        resource_type.lookup('111111111111', 'accountId')
+    )
+    assert resource_type_from_table.exists_many(
+        values, 'arn'
+    ).tolist() == [True, False, True]
+    snapshot = resource_type_from_table.get_snapshot()
+    assert snapshot.materialized_dataframe is None
+    assert sorted(snapshot.columns.keys()) == ['accountId', 'arn']
+    # Only called by the fixture to build the table
+    assert resource_type_from_table.nb_populate == 1
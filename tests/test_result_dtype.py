@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+This module hosts functions to test the compact dtypes of query results
+"""
+import context
+import numpy
+import pandas
+import pytest
+# Imported first, as by the package, as variables and helper import each other
+from data_perimeter_helper.queries import (  # noqa: F401
+    helper
+)
+from data_perimeter_helper.queries import (
+    result_dtype
+)
+from data_perimeter_helper.variables import (
+    Variables as Var
+)
+
+
+def get_result(account_id: str, list_arn: list) -> pandas.DataFrame:
+    """Get a query result with repetitive and distinct columns"""
+    return pandas.DataFrame({
+        'account_id': [account_id] * len(list_arn),
+        'principal_arn': list_arn,
+        'tags': [{'team': str(i)} for i in range(len(list_arn))],
+        'nb_reqs': list(range(len(list_arn))),
+    })
+
+
+@pytest.fixture
+def compact_enabled(monkeypatch):
+    monkeypatch.setattr(Var, "compact_result_dtypes", True)
+
+
+def test_compact_dtypes(compact_enabled):
+    dataframe = get_result('111111111111', ['arn:role/a', 'arn:role/b', None])
+    result = result_dtype.compact(dataframe)
+    assert isinstance(result['account_id'].dtype, pandas.CategoricalDtype)
+    assert result['principal_arn'].dtype == result_dtype.ARROW_STRING_DTYPE
+    # Unhashable values and numbers are unchanged
+    assert result['tags'].dtype == object
+    assert result['nb_reqs'].dtype == numpy.int64
+    pandas.testing.assert_frame_equal(
+        result.astype(object), dataframe.astype(object)
+    )
+
+
+def test_compact_disabled(monkeypatch):
+    monkeypatch.setattr(Var, "compact_result_dtypes", False)
+    dataframe = get_result('111111111111', ['arn:role/a', 'arn:role/b'])
+    assert result_dtype.compact(dataframe) is dataframe
+
+
+def test_concat_keeps_categoricals(compact_enabled):
+    result_1 = result_dtype.compact(
+        get_result('111111111111', ['arn:role/a'] * 3)
+    )
+    result_2 = result_dtype.compact(
+        get_result('222222222222', ['arn:role/b'] * 2)
+    )
+    result = result_dtype.concat([result_1, result_2])
+    assert isinstance(result['account_id'].dtype, pandas.CategoricalDtype)
+    assert isinstance(result['principal_arn'].dtype, pandas.CategoricalDtype)
+    assert result['account_id'].tolist() == ['111111111111'] * 3 + ['222222222222'] * 2
+    assert result['principal_arn'].tolist() == ['arn:role/a'] * 3 + ['arn:role/b'] * 2
+    assert result['nb_reqs'].tolist() == [0, 1, 2, 0, 1]
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+This module hosts functions to test the removal of API calls made by AWS
+services on behalf of principals
+"""
+import context
+import pandas
+import pytest
+from data_perimeter_helper.queries.Query import (
+    Query
+)
+
+
+LAMBDA_TRUST_POLICY = [{'type': 'Service', 'principal': 'lambda.amazonaws.com'}]
+DATAFRAME = pandas.DataFrame({
+    'principalid': [
+        'AROALAMBDA:session', 'AROALAMBDA:session', 'AROALAMBDA:session',
+        'AROAHUMAN:user', 'AROAHUMAN:user',
+    ],
+    # Role attributes are added to query results as strings
+    'isAssumableBy': [str(LAMBDA_TRUST_POLICY)] * 3 + ['[]'] * 2,
+    'isServiceRole': ['True', 'True', 'True', 'False', 'False'],
+    'isNetworkPerimeterHumanRole': ['False', 'False', 'False', 'True', 'True'],
+    'sourceipaddress': [
+        'lambda.amazonaws.com', 'cloudformation.amazonaws.com', '10.0.0.1',
+        'cloudformation.amazonaws.com', '10.0.0.1',
+    ],
+}, index=[10, 11, 12, 13, 14])
+
+
+class service_role_filter_test(Query):
+    """Query used to call the data processing functions"""
+    def __init__(self, name):
+        super().__init__(name, [])
+
+
+@pytest.fixture
+def query():
+    query = service_role_filter_test("service_role_filter_test")
+    yield query
+    Query.queries.pop("service_role_filter_test", None)
+
+
+def test_calls_by_human_roles_from_service_networks_removed(query):
+    result = query.remove_calls_from_service_on_behalf_of_principal(
+        DATAFRAME.copy()
+    )
+    assert result.index.tolist() == [10, 11, 12, 14]
+    assert list(result.columns) == list(DATAFRAME.columns)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+This module hosts functions to test the selection of statements performed
+against the Athena staging table
+"""
+import context
+import pytest
+from data_perimeter_helper.queries import (
+    helper
+)
+from data_perimeter_helper.queries.Query import (
+    Query
+)
+from data_perimeter_helper.queries.StagingTable import (
+    StagingTable
+)
+from data_perimeter_helper.variables import (
+    Variables as Var
+)
+
+
+STATEMENT = """SELECT
+    useridentity.principalid,
+    eventname,
+    count(*) as nb_reqs
+FROM "__ATHENA_TABLE_NAME_PLACEHOLDER__"
+WHERE
+    {account_filter}
+    AND eventsource = 's3.amazonaws.com'
+GROUP BY
+    useridentity.principalid,
+    eventname
+"""
+
+
+def test_referenced_columns():
+    statement = STATEMENT.format(account_filter="p_account = '111111111111'")
+    assert StagingTable.get_referenced_columns(statement) == {
+        "useridentity", "eventname", "eventsource"
+    }
+
+
+def test_filtered_accounts():
+    assert StagingTable.get_filtered_accounts(
+        STATEMENT.format(account_filter="p_account = '111111111111'")
+    ) == {"111111111111"}
+    assert StagingTable.get_filtered_accounts(
+        STATEMENT.format(
+            account_filter="p_account IN ('111111111111','222222222222')"
+        )
+    ) == {"111111111111", "222222222222"}
+    assert StagingTable.get_filtered_accounts(
+        STATEMENT.format(account_filter="p_date >= '2024/01/01'")
+    ) is None
+
+
+def test_table_name(monkeypatch):
+    monkeypatch.setattr(StagingTable, "table_name", "dph_staging_test")
+    monkeypatch.setattr(
+        StagingTable, "set_account_id", {"111111111111", "222222222222"}
+    )
+    monkeypatch.setattr(
+        StagingTable, "set_column", {"useridentity", "eventname", "eventsource"}
+    )
+    assert StagingTable.get_table_name(
+        STATEMENT.format(account_filter="p_account = '111111111111'")
+    ) == "dph_staging_test"
+    # Account not staged
+    assert StagingTable.get_table_name(
+        STATEMENT.format(account_filter="p_account = '333333333333'")
+    ) is None
+    # Column not staged
+    assert StagingTable.get_table_name(
+        STATEMENT.format(
+            account_filter="p_account = '111111111111' AND errorcode IS NULL"
+        )
+    ) is None
+
+
+class no_statement_query_test(Query):
+    """Query generating no statement, as a query on VPC endpoints for an
+    account without VPC endpoint"""
+    def __init__(self, name):
+        super().__init__(name, [])
+
+    def generate_athena_statement(self, account_id):
+        return None
+
+
+@pytest.mark.parametrize("athena_incremental_partitions", [False, True])
+def test_query_without_statement_is_skipped(
+    monkeypatch,
+    athena_incremental_partitions
+):
+    monkeypatch.setattr(
+        Var, "athena_incremental_partitions", athena_incremental_partitions
+    )
+    monkeypatch.setattr(Var, "partition_date_regex", None)
+    monkeypatch.setattr(helper, "get_athena_sql_limit", lambda account_id: 0)
+    query = no_statement_query_test("no_statement_query_test")
+    try:
+        assert query.list_athena_statement(["111111111111"]) == []
+        assert query.get_scope_factor("111111111111") == 1
+        assert query.start_athena_query("111111111111") is None
+        readable_query, dataframe = query.execute_athena_query(
+            query.name, "111111111111", query.generate_athena_statement
+        )
+    finally:
+        Query.queries.pop("no_statement_query_test", None)
+    assert readable_query == ""
+    assert len(dataframe.index) == 0
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+"""
+This module hosts functions to test the reading of Athena results by chunks
+"""
+import context
+from pathlib import (
+    Path
+)
+
+import pandas
+import pytest
+from data_perimeter_helper.queries import (
+    athena_cache,
+    helper
+)
+from data_perimeter_helper.queries.Query import (
+    Query
+)
+from data_perimeter_helper.queries.StagingTable import (
+    StagingTable
+)
+from data_perimeter_helper.variables import (
+    Variables as Var
+)
+
+
+LIST_CHUNK = [
+    pandas.DataFrame({'eventname': ['GetObject', 'PutObject'], 'nb_reqs': [1, 2]}),
+    pandas.DataFrame({'eventname': [None, None], 'nb_reqs': [3, 4]}),
+    pandas.DataFrame({'eventname': ['ListBucket'], 'nb_reqs': [5]}),
+]
+
+
+class streamed_query_test(Query):
+    """Query keeping the rows with more than one request"""
+    def __init__(self, name):
+        super().__init__(name, [])
+
+    def generate_athena_statement(self, account_id):
+        return f"""SELECT eventname, count(*) as nb_reqs
+FROM "__ATHENA_TABLE_NAME_PLACEHOLDER__"
+WHERE p_account = '{account_id}'
+""", []
+
+    def submit_query(self, account_id):
+        query, dataframe = self.submit_athena_query(self.name, account_id)
+        if 'nb_reqs' in dataframe.columns:
+            dataframe = dataframe[dataframe['nb_reqs'] > 1]
+        return {'query': query, 'dataframe': dataframe}
+
+
+@pytest.fixture
+def streamed_query(monkeypatch, tmp_path):
+    """Read Athena results by chunks with the result cache enabled"""
+    monkeypatch.setattr(Var, "athena_chunksize", 2)
+    monkeypatch.setattr(Var, "athena_incremental_partitions", False)
+    monkeypatch.setattr(Var, "use_parameterized_queries", False)
+    monkeypatch.setattr(Var, "athena_table_name_mgmt_data_event", "cloudtrail")
+    monkeypatch.setattr(Var, "cache_athena_results", True)
+    monkeypatch.setattr(Var, "cache_athena_results_max_size_in_mb", 100)
+    monkeypatch.setattr(Var, "cache_folder_path", str(tmp_path))
+    monkeypatch.setattr(Var, "partition_date_regex", None)
+    monkeypatch.setattr(Var, "partition_date_start", "2024/01/01")
+    monkeypatch.setattr(Var, "partition_date_end", "2024/01/31")
+    monkeypatch.setattr(StagingTable, "table_name", None)
+    monkeypatch.setattr(helper, "athena_cloudtrail_with_union", lambda: False)
+    monkeypatch.setattr(helper, "get_athena_sql_limit", lambda account_id: 0)
+    list_call = []
+
+    def read_sql_query(query, params, query_name, account_id, chunksize=None):
+        list_call.append(chunksize)
+        if chunksize is None:
+            return pandas.concat(LIST_CHUNK, ignore_index=True)
+        return iter(chunk.copy() for chunk in LIST_CHUNK)
+
+    monkeypatch.setattr(Query, "read_sql_query", staticmethod(read_sql_query))
+    query = streamed_query_test("streamed_query_test")
+    yield query, list_call
+    Query.queries.pop("streamed_query_test", None)
+
+
+def test_streamed_results_are_cached(streamed_query, tmp_path):
+    query, list_call = streamed_query
+    result = query.submit_query_streamed("111111111111")
+    assert result['dataframe']['nb_reqs'].tolist() == [2, 3, 4, 5]
+    assert list_call == [2]
+    cache_key = athena_cache.get_cache_key(result['query'])
+    assert athena_cache.has_cached_result(cache_key)
+    assert list(Path(athena_cache.get_cache_folder_path()).glob("*.tmp")) == []
+    assert athena_cache.read_cached_result(cache_key)['nb_reqs'].tolist() == [
+        1, 2, 3, 4, 5
+    ]
+    # Cached results are read at once without querying Athena
+    assert query.execute_athena_query_streamed(
+        query.name, "111111111111"
+    ) is None
+    result = query.submit_query_streamed("111111111111")
+    assert result['dataframe']['nb_reqs'].tolist() == [2, 3, 4, 5]
+    assert list_call == [2]
+
+
+def test_interrupted_stream_is_not_cached(streamed_query, monkeypatch):
+    query, _ = streamed_query
+
+    def submit_query(account_id):
+        query_name, dataframe = query.submit_athena_query(query.name, account_id)
+        raise RuntimeError("processing failed")
+
+    monkeypatch.setattr(query, "submit_query", submit_query)
+    with pytest.raises(RuntimeError):
+        query.submit_query_streamed("111111111111")
+    folder = Path(athena_cache.get_cache_folder_path())
+    assert list(folder.glob("*.parquet")) == []
+    assert list(folder.glob("*.tmp")) == []